@@ -1,11 +1,17 @@
 from integrated.Modules.Core.IntegratedModelComponent import Component
 
+import numpy as np
 import pandas as pd
 
+DAY_NS = 86400 * 10**9 #Nanoseconds in a day
+
 class Climate(Component):
 
     """
     Serves as an interface to climate data
+
+    Totals and means over date ranges are answered from cumulative sums of each numeric column (see getRangeTotals()),
+    built the first time they are needed. Climate data are treated as read-only once a Climate object is created.
     """
 
     def __init__(self, data, **kwargs):
@@ -42,6 +48,213 @@ class Climate(Component):
         return self.description.loc[attrib, phenom]
     #End getClimateAttrib()
 
+    def _getRangeIndex(self):
+
+        """
+        Cumulative sums of each numeric column of the climate data, with an integer position for each day
+
+        Missing values count as 0 towards totals and are left out of means, as with Pandas sum() and mean().
+
+        :returns: Dict of timestamps (int64 nanoseconds), whether the data are daily without gaps (so positions can
+                  be calculated rather than searched), numeric columns and whether all columns are numeric, and (number of timesteps + 1, number of columns)
+                  arrays of cumulative totals and counts of values
+        """
+
+        try:
+            return self.range_index
+        except AttributeError:
+            pass
+        #End try
+
+        numeric = self.data.select_dtypes(include=[np.number])
+        values = numeric.values.astype(float)
+        missing = np.isnan(values)
+
+        timestamps = self.data.index.asi8
+
+        totals = np.zeros((len(values) + 1, values.shape[1]))
+        np.cumsum(np.where(missing, 0.0, values), axis=0, out=totals[1:])
+
+        counts = np.zeros(totals.shape, dtype=int)
+        np.cumsum(~missing, axis=0, out=counts[1:])
+
+        steps = np.diff(timestamps)
+
+        self.range_index = {
+            'timestamps': timestamps,
+            'daily': (len(timestamps) > 0) and (timestamps[0] % DAY_NS == 0) and bool(np.all(steps == DAY_NS)),
+            'columns': numeric.columns,
+            'all_numeric': len(numeric.columns) == len(self.data.columns),
+            'values': values,
+            'totals': totals,
+            'counts': counts
+        }
+
+        return self.range_index
+
+    #End _getRangeIndex()
+
+    def _usesRangeIndex(self, data):
+
+        """
+        :param data: climate data given to a method, or None
+        :returns: (bool) the data are (columns of) the climate data of this object, so ranges can be answered from the range index
+        """
+
+        if not isinstance(self.data.index, pd.DatetimeIndex) or not self.data.index.is_monotonic_increasing:
+            return False
+        #End if
+
+        if (data is None) or (data is self.data):
+            return self._getRangeIndex()['all_numeric']
+        elif not isinstance(data, pd.DataFrame) or (data.index is not self.data.index):
+            return False
+        #End if
+
+        #Only numeric columns have cumulative sums
+        if not data.columns.isin(self._getRangeIndex()['columns']).all():
+            return False
+        #End if
+
+        return True
+
+    #End _usesRangeIndex()
+
+    @staticmethod
+    def _toTimestamps(dates):
+
+        """
+        :param dates: list-like of dates (strings, datetimes or datetime64)
+        :returns: array of dates as int64 nanoseconds
+        """
+
+        if isinstance(dates, pd.DatetimeIndex):
+            return dates.asi8
+        #End if
+
+        return pd.DatetimeIndex(pd.to_datetime(dates)).asi8
+
+    #End _toTimestamps()
+
+    def _findRangePositions(self, starts, ends):
+
+        """
+        :param starts: array of start dates (inclusive) as int64 nanoseconds
+        :param ends: array of end dates (inclusive) as int64 nanoseconds
+        :returns: tuple of arrays of first position in each range, and position after the last
+        """
+
+        index = self._getRangeIndex()
+        timestamps = index['timestamps']
+
+        if index['daily']:
+            num_steps = len(timestamps)
+            first = timestamps[0]
+
+            #Days at or after start, and days up to and including end
+            lo = np.clip(-((first - starts) // DAY_NS), 0, num_steps)
+            hi = np.clip(((ends - first) // DAY_NS) + 1, 0, num_steps)
+        else:
+            lo = np.searchsorted(timestamps, starts, side='left')
+            hi = np.searchsorted(timestamps, ends, side='right')
+        #End if
+
+        return lo, np.maximum(hi, lo)
+
+    #End _findRangePositions()
+
+    def _getColumnPositions(self, columns):
+
+        """
+        :param columns: list of column names, or None for all numeric columns
+        :returns: array of positions of columns in the range index
+        """
+
+        index = self._getRangeIndex()
+
+        if columns is None:
+            return np.arange(len(index['columns']))
+        #End if
+
+        cols = index['columns'].get_indexer(columns)
+        if (cols == -1).any():
+            raise KeyError("Climate data has no numeric column(s) {c}".format(c=list(np.asarray(columns)[cols == -1])))
+        #End if
+
+        return cols
+
+    #End _getColumnPositions()
+
+    def getRangeTotals(self, starts, ends, columns=None):
+
+        """
+        Total of each column over many date ranges at once
+
+        Example::
+
+            #Rainfall in each irrigation season
+            Climate.getRangeTotals(['1990-08-15', '1991-08-15'], ['1991-05-15', '1992-05-15'], columns=['rainfall'])
+
+        :param starts: list-like of start dates (inclusive)
+        :param ends: list-like of end dates (inclusive)
+        :param columns: (optional) list of columns to total. All numeric columns if None
+        :returns: DataFrame of totals, one row for each range
+        """
+
+        index = self._getRangeIndex()
+        cols = self._getColumnPositions(columns)
+        lo, hi = self._findRangePositions(self._toTimestamps(starts), self._toTimestamps(ends))
+
+        totals = index['totals'][:, cols]
+
+        return pd.DataFrame(totals[hi] - totals[lo], columns=index['columns'][cols])
+
+    #End getRangeTotals()
+
+    def getRangeMeans(self, starts, ends, columns=None):
+
+        """
+        Mean of each column over many date ranges at once. Ranges without values give NaN
+
+        :param starts: list-like of start dates (inclusive)
+        :param ends: list-like of end dates (inclusive)
+        :param columns: (optional) list of columns. All numeric columns if None
+        :returns: DataFrame of means, one row for each range
+        """
+
+        index = self._getRangeIndex()
+        cols = self._getColumnPositions(columns)
+        lo, hi = self._findRangePositions(self._toTimestamps(starts), self._toTimestamps(ends))
+
+        totals = index['totals'][:, cols]
+        counts = index['counts'][:, cols]
+        counts = (counts[hi] - counts[lo]).astype(float)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = (totals[hi] - totals[lo]) / np.where(counts > 0, counts, np.nan)
+        #End with
+
+        return pd.DataFrame(means, columns=index['columns'][cols])
+
+    #End getRangeMeans()
+
+    def getRangeTotal(self, start, end, column='rainfall'):
+
+        """
+        :param start: start date (inclusive)
+        :param end: end date (inclusive)
+        :param column: column to total
+        :returns: total of column between the given dates
+        """
+
+        index = self._getRangeIndex()
+        col = index['columns'].get_loc(column)
+        lo, hi = self._findRangePositions(np.array([pd.Timestamp(start).value]), np.array([pd.Timestamp(end).value]))
+
+        return index['totals'][hi[0], col] - index['totals'][lo[0], col]
+
+    #End getRangeTotal()
+
     def getAnnualRainfall(self, timestep, data=None):
         """
         Calculate the total amount of rainfall that occured in a year, given in the timestep
@@ -51,7 +264,13 @@ class Climate(Component):
 
         year = timestep if type(timestep) == int else timestep.year
 
-        data = self.data if data == None else data
+        if data is None:
+            data = self.data
+        #End if
+
+        if self._usesRangeIndex(data):
+            return self.getAnnualRainfalls([year])[0]
+        #End if
 
         year_data = data[data.index.year == year]
 
@@ -59,7 +278,28 @@ class Climate(Component):
 
         return yearly_rainfall['rainfall']
     #End getAnnualRainfall()
-    
+
+    def getAnnualRainfalls(self, years):
+
+        """
+        Batch version of getAnnualRainfall()
+
+        :param years: list-like of years (int)
+        :returns: array of total rainfall in each year
+        """
+
+        index = self._getRangeIndex()
+        col = index['columns'].get_loc('rainfall')
+
+        #Start of each year, and of the year after
+        bounds = np.array([pd.Timestamp(year=int(year) + i, month=1, day=1).value for year in years for i in (0, 1)], dtype=np.int64)
+
+        lo, hi = self._findRangePositions(bounds[0::2], bounds[1::2] - 1)
+
+        return index['totals'][hi, col] - index['totals'][lo, col]
+
+    #End getAnnualRainfalls()
+
     def getSummerRainfall(self, timestep, data=None, summer_months=[1, 4]):
 
         """
@@ -114,6 +354,43 @@ class Climate(Component):
         return self.getSeasonRange(start_date, end_date, data)
     #End getInterYearRange()
 
+    def _getInterYearDates(self, timestep, months, days=[1, 15]):
+
+        """
+        Start and end of the range given by getInterYearRange(), without slicing the data
+
+        :returns: tuple of start and end Timestamps
+        """
+
+        start_date, end_date = self._adjustInterYearDates(timestep, months, [days[0], 15 if days[1] == None else days[1]])
+
+        if days[1] == None:
+            end_date = self._moveToEndOfMonth(end_date)
+        #End if
+
+        return pd.Timestamp(start_date), pd.Timestamp(end_date)
+
+    #End _getInterYearDates()
+
+    def getInterYearTotal(self, timestep, months, days=[1, 15], column='rainfall'):
+
+        """
+        Total of a column over the range given by getInterYearRange(), e.g. summer rainfall::
+
+            Climate.getInterYearTotal(timestep, [1, 4], days=[1, None])
+
+        :param timestep: Current timestep to consider
+        :param months: Tuple of Start and end month
+        :param days: int of start/end day or None. If end day is None, moves to last day of given month
+        :param column: column to total
+        """
+
+        start_date, end_date = self._getInterYearDates(timestep, months, days)
+
+        return self.getRangeTotal(start_date, end_date, column)
+
+    #End getInterYearTotal()
+
     def _moveToEndOfMonth(self, dt):
         """
         Move day of given datetime to the last day of that month
@@ -177,6 +454,21 @@ class Climate(Component):
 
         assert end > start, 'Season end date cannot be earlier than start date ({} < {} ?)'.format(start, end)
 
+        if self._usesRangeIndex(data):
+            index = self._getRangeIndex()
+            lo, hi = self._findRangePositions(np.array([pd.Timestamp(start).value]), np.array([pd.Timestamp(end).value]))
+            col = index['columns'].get_loc(data.columns[0])
+
+            #The last value of a cumulative sum is NaN if the last day is missing; empty ranges are handled below
+            if hi[0] > lo[0]:
+                if np.isnan(index['values'][hi[0] - 1, col]):
+                    return np.nan
+                #End if
+
+                return index['totals'][hi[0], col] - index['totals'][lo[0], col]
+            #End if
+        #End if
+
         return self.getSeasonRange(start, end, data).cumsum().iloc[-1, 0]
 
     #End getSeasonalRainfall()
@@ -200,9 +492,13 @@ class Climate(Component):
             data = self.data
         #End if
 
-        irrigation_season = self.getInterYearRange(timestep, months, days, data=data)
+        start_date, end_date = self._getInterYearDates(timestep, months, days)
+
+        if not (start_date <= timestep <= end_date):
+            return False
+        #End if
 
-        return (timestep in irrigation_season.index)
+        return (timestep in data.index)
 
     #End inIrrigationSeason()
 
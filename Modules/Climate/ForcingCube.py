@@ -0,0 +1,217 @@
+import json
+import os
+
+import numpy as np
+
+
+class ForcingCube(object):
+
+    """
+    Climate forcing for a node network held as a single (time, node, variable) float array.
+
+    Timesteps are addressed by integer position, with a lookup from date to position, so the forcing for all nodes
+    in a timestep is a single O(1) slice.
+
+    The array can be backed by a memory-mapped file. When pickled (e.g. when sent to worker processes) a file-backed cube
+    only passes the file location, and each process maps the same file instead of receiving its own copy.
+
+    Example::
+
+        Forcing = ForcingCube.fromNodeClimate(climate_data, node_ids, IDs, filename='forcing.npy')
+
+        t = Forcing.getTimeIndex('02/09/2005')
+        evap, rain = Forcing.getTimestep(t).T #Values for all nodes
+
+    """
+
+    def __init__(self, data, dates, node_ids, variables, filename=None):
+
+        """
+        :param data: array-like of shape (number of timesteps, number of nodes, number of variables)
+        :param dates: list of timestep labels (e.g. date strings), one for each timestep
+        :param node_ids: list of node ids, one for each node
+        :param variables: list of variable names, e.g. ['evap', 'rain']
+        :param filename: path of the memory-mapped file holding data, if any
+        """
+
+        self.data = data
+        self.dates = list(dates)
+        self.node_ids = list(node_ids)
+        self.variables = list(variables)
+        self.filename = filename
+
+        assert self.data.shape == (len(self.dates), len(self.node_ids), len(self.variables)), \
+            'Forcing data shape {s} does not match dates, nodes and variables'.format(s=self.data.shape)
+
+        self.time_index = dict((date, i) for i, date in enumerate(self.dates))
+        self.node_pos = dict((node_id, i) for i, node_id in enumerate(self.node_ids))
+        self.var_pos = dict((var, i) for i, var in enumerate(self.variables))
+
+    #End init()
+
+    @classmethod
+    def fromNodeClimate(cls, climate_data, node_ids, IDs, variables=['evap', 'rain'], date_col='Date', filename=None):
+
+        """
+        Build a forcing cube from a climate DataFrame with one column per node and variable, named "{ID}_{variable}" (e.g. 406214_rain)
+
+        :param climate_data: Pandas DataFrame of climate data
+        :param node_ids: list of node ids
+        :param IDs: list of IDs used in the climate data column names, in the same order as node_ids
+        :param variables: list of variables to include. Each timestep slice has one column per variable in this order
+        :param date_col: column holding timestep labels
+        :param filename: (optional) path of a file to write the cube to and memory-map
+        :returns: ForcingCube
+        """
+
+        shape = (len(climate_data.index), len(node_ids), len(variables))
+
+        if filename is not None:
+            data = np.lib.format.open_memmap(filename, mode='w+', dtype=np.float64, shape=shape)
+        else:
+            data = np.empty(shape, dtype=np.float64)
+        #End if
+
+        for k, var in enumerate(variables):
+            cols = ["{node_id}_{var}".format(node_id=ID, var=var) for ID in IDs]
+            data[:, :, k] = climate_data[cols].values
+        #End for
+
+        dates = climate_data[date_col].values
+
+        if filename is not None:
+            data.flush()
+            cls._writeMetadata(filename, dates, node_ids, variables)
+            data = np.load(filename, mmap_mode='r')
+        #End if
+
+        return cls(data, dates, node_ids, variables, filename=filename)
+
+    #End fromNodeClimate()
+
+    @classmethod
+    def load(cls, filename):
+
+        """
+        Memory-map a forcing cube previously written with fromNodeClimate(). The data are opened read-only.
+
+        :param filename: path to the cube file
+        :returns: ForcingCube
+        """
+
+        with open(cls._metadataPath(filename), 'r') as f:
+            meta = json.load(f)
+        #End with
+
+        data = np.load(filename, mmap_mode='r')
+
+        return cls(data, meta['dates'], meta['node_ids'], meta['variables'], filename=filename)
+
+    #End load()
+
+    @staticmethod
+    def _metadataPath(filename):
+        return os.path.splitext(filename)[0] + '.json'
+    #End _metadataPath()
+
+    @classmethod
+    def _writeMetadata(cls, filename, dates, node_ids, variables):
+
+        """
+        Dates, node ids and variable names are stored alongside the cube file as JSON
+        """
+
+        meta = {
+            'dates': [str(date) for date in dates],
+            'node_ids': [np.asarray(node_id).item() for node_id in node_ids],
+            'variables': list(variables)
+        }
+
+        with open(cls._metadataPath(filename), 'w') as f:
+            json.dump(meta, f)
+        #End with
+
+    #End _writeMetadata()
+
+    def __getstate__(self):
+
+        state = self.__dict__.copy()
+
+        #File-backed data is re-mapped on unpickling rather than copied
+        if self.filename is not None:
+            state['data'] = None
+
+        return state
+
+    #End __getstate__()
+
+    def __setstate__(self, state):
+
+        self.__dict__.update(state)
+
+        if self.data is None:
+            self.data = np.load(self.filename, mmap_mode='r')
+
+    #End __setstate__()
+
+    def getTimeIndex(self, date):
+
+        """
+        :param date: timestep label as used when building the cube
+        :returns: integer position of the timestep
+        """
+
+        return self.time_index[date]
+
+    #End getTimeIndex()
+
+    def getTimestep(self, t):
+
+        """
+        :param t: integer timestep position
+        :returns: (node, variable) array of forcing for all nodes in the timestep
+        """
+
+        return self.data[t]
+
+    #End getTimestep()
+
+    def getNodeSeries(self, node_id):
+
+        """
+        :returns: (time, variable) array of forcing for the given node
+        """
+
+        return self.data[:, self.node_pos[node_id], :]
+
+    #End getNodeSeries()
+
+    def getVariable(self, var, node_ids=None):
+
+        """
+        :param var: name of variable
+        :param node_ids: (optional) list of node ids to extract, in the order given. All nodes if None
+        :returns: (time, node) array of the given variable
+        """
+
+        values = self.data[:, :, self.var_pos[var]]
+
+        if node_ids is not None:
+            values = values[:, [self.node_pos[node_id] for node_id in node_ids]]
+        #End if
+
+        return values
+
+    #End getVariable()
+
+    def getNodePositions(self, node_ids):
+
+        """
+        :returns: array of positions of the given nodes along the node axis
+        """
+
+        return np.array([self.node_pos[node_id] for node_id in node_ids], dtype=int)
+
+    #End getNodePositions()
+
+#End ForcingCube
@@ -192,6 +192,37 @@ def importSpecificRangesFromFiles(store, irrigation, crop):
 
 #End importDataFromFiles()
 
+def getRangesFilePath(case, store, irrigation, crop, component, comp_name, output_path=None):
+
+    """
+    Path of the file holding optimised values for one component of a storage, irrigation and crop combination,
+    in the folder layout read by importSpecificRangesFromFiles()
+
+    :param case: 'local', 'breakeven' or 'closest'
+    :param store: name of storage, e.g. FarmDam
+    :param irrigation: name of irrigation, e.g. Spray
+    :param crop: name of crop, e.g. Cotton
+    :param component: type of component; 'storages', 'irrigations' or 'crops'
+    :param comp_name: name of component
+    :param output_path: folder holding optimised ranges. Defaults to the one set in paths.py
+    :returns: path to file
+    """
+
+    output_path = paths.output_path if output_path is None else output_path
+
+    farm_id = store+"_"+irrigation+"_"+crop
+
+    if case == 'closest':
+        farm_id = farm_id+"_(Points_of_Concern)"
+    #End if
+
+    #Crop files are named in lower case (e.g. cotton.csv)
+    filename = comp_name.lower() if component == 'crops' else comp_name
+
+    return output_path+case+"/"+farm_id+"/"+component+"/"+filename+".csv"
+
+#End getRangesFilePath()
+
 def importStorageRanges():
 
     """
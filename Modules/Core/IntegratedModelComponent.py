@@ -1,4 +1,12 @@
 import copy
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+#Values treated as read-only parameter data (e.g. crop coefficient tables), shared between a component and its copies
+SHARED_TYPES = (pd.core.generic.NDFrame, np.ndarray, basestring, int, long, float, bool, type(None))
+
 class Component(object):
 
     """
@@ -6,6 +14,9 @@ class Component(object):
       All model components should inherit (or implement their own versions) of the methods defined here.
     """
 
+    #Empty so components that declare __slots__ (e.g. FarmField) have no instance __dict__
+    __slots__ = ()
+
     def __init__():
         pass
     #End __init__()
@@ -18,10 +29,98 @@ class Component(object):
         setattr(self, name, value) if value is not None else setattr(self, name, default_val)
     #End setAttribute
 
+    def getAttributes(self):
+
+        """
+        :returns: Dict of attribute name and value for this object, from its instance __dict__ and any declared __slots__
+        """
+
+        attributes = dict(getattr(self, '__dict__', {}))
+
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                if (name not in ('__dict__', '__weakref__')) and hasattr(self, name):
+                    attributes[name] = getattr(self, name)
+                #End if
+            #End for
+        #End for
+
+        return attributes
+
+    #End getAttributes()
+
     def getCopy(self):
-        return copy.deepcopy(self)
+
+        """
+        Copy this component, e.g. to use in another field combination or season.
+
+        Unlike copy.deepcopy(), parameter tables (pandas objects and numpy arrays) and other immutable values are
+        shared with the original rather than copied. Components only ever replace these, never change them in place,
+        so replacing one on the copy leaves the original untouched. Per-simulation state is copied: nested components
+        (e.g. a field's Crop and Irrigation) are copied the same way, lists, dicts and sets are copied with their
+        contents copied, and any other objects are deep copied.
+
+        :returns: copy of this component
+        """
+
+        return self._copyValue(self, {})
+
     #End getCopy()
 
+    @staticmethod
+    def _copyValue(value, memo):
+
+        """
+        :param value: value to copy
+        :param memo: Dict of id of values already copied and their copy, so objects referenced more than once are copied once
+        :returns: copy of value, or value itself if it is shared
+        """
+
+        if isinstance(value, SHARED_TYPES):
+            return value
+        #End if
+
+        try:
+            return memo[id(value)]
+        except KeyError:
+            pass
+        #End try
+
+        if isinstance(value, Component):
+            new = value.__class__.__new__(value.__class__)
+            memo[id(value)] = new
+
+            for name, attr in value.getAttributes().iteritems():
+                object.__setattr__(new, name, Component._copyValue(attr, memo))
+            #End for
+
+        elif type(value) is list:
+            new = []
+            memo[id(value)] = new
+            new.extend(Component._copyValue(item, memo) for item in value)
+
+        elif type(value) in (dict, OrderedDict):
+            new = type(value)()
+            memo[id(value)] = new
+
+            for key, item in value.iteritems():
+                new[key] = Component._copyValue(item, memo)
+            #End for
+
+        elif type(value) is tuple:
+            new = tuple(Component._copyValue(item, memo) for item in value)
+
+        elif type(value) in (set, frozenset):
+            new = type(value)(Component._copyValue(item, memo) for item in value)
+
+        else:
+            new = copy.deepcopy(value, memo)
+        #End if
+
+        return new
+
+    #End _copyValue()
+
 
     def setMethod(self, name, func):
 
@@ -181,11 +280,20 @@ class Component(object):
         """
         Count total number of parameters for this object
 
+        Declared state (e.g. FieldState) is counted field by field, as if held in the instance __dict__
+
         :returns: number of parameters
         :return type: int
         """
 
-        return len(self.__dict__)
+        attributes = self.getAttributes()
+
+        state = attributes.get('_state')
+        if state is None:
+            return len(attributes)
+        #End if
+
+        return len(attributes) - 1 + len(state.fields)
 
     #End getNumParams()
 
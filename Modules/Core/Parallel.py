@@ -0,0 +1,81 @@
+import multiprocessing
+
+#Data held by each worker process (e.g. the simulation function and shared tables), set when the worker starts
+worker_data = {}
+
+
+def _initWorker(data, initializer):
+
+    """
+    Set the data of a worker process once, instead of sending it with every task
+
+    :param data: Dict of data for the worker
+    :param initializer: (optional) function called without arguments once the data is set, e.g. to load tables
+                        named in the data
+    """
+
+    worker_data.clear()
+    worker_data.update(data)
+
+    if initializer is not None:
+        initializer()
+    #End if
+
+#End _initWorker()
+
+
+def runInPool(func, tasks, data=None, initializer=None, processes=None, chunksize=1):
+
+    """
+    Apply a function to each task in worker processes, giving results in the order of the tasks as they arrive.
+
+    Each worker is given the data once when it starts, which tasks read from worker_data. Runs in this process if
+    processes is 1.
+
+    The pool is closed once all results are read. If a task raises an error, or results stop being read (the
+    generator is closed), the pool is terminated so tasks still queued are not run. Close the generator when
+    reading may stop early, e.g.::
+
+        with closing(runInPool(_runFarm, tasks, data={'simulate': simulate}, processes=8)) as results:
+            for result in results:
+                ...
+
+    :param func: function of one task, defined at module level so it can be sent to worker processes
+    :param tasks: list of tasks
+    :param data: (optional) Dict of data for each worker, see worker_data
+    :param initializer: (optional) function called in each worker once its data is set
+    :param processes: number of worker processes, defaults to the number of CPUs
+    :param chunksize: number of tasks sent to a worker at a time
+    :returns: generator of results
+    """
+
+    data = {} if data is None else data
+    processes = multiprocessing.cpu_count() if processes is None else processes
+
+    if processes <= 1:
+        _initWorker(data, initializer)
+
+        for task in tasks:
+            yield func(task)
+        #End for
+
+        return
+    #End if
+
+    pool = multiprocessing.Pool(processes, initializer=_initWorker, initargs=(data, initializer))
+
+    try:
+        for result in pool.imap(func, tasks, chunksize=chunksize):
+            yield result
+        #End for
+    except:
+        #Stop the tasks still queued rather than waiting for them to finish
+        pool.terminate()
+        pool.join()
+        raise
+    else:
+        pool.close()
+        pool.join()
+    #End try
+
+#End runInPool()
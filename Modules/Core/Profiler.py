@@ -0,0 +1,267 @@
+import math
+import timeit
+
+import numpy as np
+import pandas as pd
+
+
+class _NullSection(object):
+
+    """
+    Section returned while profiling is disabled. Does nothing on entry or exit.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+#End _NullSection
+
+_null_section = _NullSection()
+
+
+class _Section(object):
+
+    """
+    Times a block of code and reports it to the Profiler on exit
+    """
+
+    __slots__ = ('profiler', 'name', 'items')
+
+    def __init__(self, profiler, name, items):
+        self.profiler = profiler
+        self.name = name
+        self.items = items
+
+    def __enter__(self):
+        self.profiler._push(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler._pop(self.items)
+        return False
+
+#End _Section
+
+
+class Profiler(object):
+
+    """
+    Low overhead instrumentation shared by model components.
+
+    Code is timed in named sections, optionally split by node type. Sections may be nested; each distinct stack of sections
+    keeps its number of calls, number of items processed (e.g. nodes in a vectorized call), total and self time, and a histogram
+    of call durations in power-of-two microsecond bins.
+
+    While disabled, section() returns a shared object that does nothing, so instrumented code only pays for the method call.
+
+    Example::
+
+        from integrated.Modules.Core.Profiler import profiler
+
+        profiler.enable()
+
+        with profiler.section('IHACRES.calcCMD', 'routing'):
+            ...
+
+        print profiler.getReport()
+        profiler.writeCollapsedStacks('hydrology.folded') #For flamegraph.pl or speedscope
+
+    """
+
+    #Upper edges of histogram bins, in microseconds
+    histogram_bins = 2.0**np.arange(28)
+
+    def __init__(self, enabled=False):
+
+        """
+        :param enabled: start recording straight away
+        """
+
+        self.enabled = enabled
+        self.reset()
+
+    #End init()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+
+        """
+        Clear all recorded timings
+        """
+
+        self.stats = {}
+        self._stack = []
+
+    #End reset()
+
+    def section(self, component, node_type=None, items=1):
+
+        """
+        Context manager that times the enclosed block.
+
+        :param component: name of the section, e.g. 'Routing.calcFlow'
+        :param node_type: (optional) type of node being processed, recorded as a separate entry for each type
+        :param items: number of items (e.g. nodes) processed by the block
+        """
+
+        if not self.enabled:
+            return _null_section
+        #End if
+
+        name = component if node_type is None else '{c}[{t}]'.format(c=component, t=node_type)
+
+        return _Section(self, name, items)
+
+    #End section()
+
+    def _push(self, name):
+
+        #Frame of [name, start time, time spent in nested sections]
+        self._stack.append([name, timeit.default_timer(), 0.0])
+
+    #End _push()
+
+    def _pop(self, items):
+
+        end = timeit.default_timer()
+
+        key = tuple(frame[0] for frame in self._stack)
+        name, start, child_time = self._stack.pop()
+
+        elapsed = end - start
+
+        if len(self._stack) > 0:
+            self._stack[-1][2] += elapsed
+        #End if
+
+        self.record(key, elapsed, self_time=elapsed - child_time, items=items)
+
+    #End _pop()
+
+    def record(self, key, elapsed, self_time=None, items=1):
+
+        """
+        Add a timing directly, e.g. one measured elsewhere
+
+        :param key: section name, or tuple of nested section names
+        :param elapsed: time taken in seconds
+        :param self_time: time taken excluding nested sections, same as elapsed if not given
+        :param items: number of items processed
+        """
+
+        if not isinstance(key, tuple):
+            key = (key, )
+        #End if
+
+        try:
+            stat = self.stats[key]
+        except KeyError:
+            stat = self.stats[key] = {'calls': 0, 'items': 0, 'total_time': 0.0, 'self_time': 0.0,
+                                      'histogram': np.zeros(len(self.histogram_bins), dtype=int)}
+        #End try
+
+        stat['calls'] += 1
+        stat['items'] += items
+        stat['total_time'] += elapsed
+        stat['self_time'] += elapsed if self_time is None else self_time
+
+        micro = elapsed * 1e6
+        b = 0 if micro <= 1.0 else min(int(math.ceil(math.log(micro, 2))), len(self.histogram_bins) - 1)
+        stat['histogram'][b] += 1
+
+    #End record()
+
+    def merge(self, other):
+
+        """
+        Add timings recorded by another Profiler, e.g. one used in a worker process
+        """
+
+        for key, other_stat in other.stats.iteritems():
+            if key not in self.stats:
+                self.stats[key] = {'calls': 0, 'items': 0, 'total_time': 0.0, 'self_time': 0.0,
+                                   'histogram': np.zeros(len(self.histogram_bins), dtype=int)}
+            #End if
+
+            stat = self.stats[key]
+            for field in ['calls', 'items', 'total_time', 'self_time', 'histogram']:
+                stat[field] = stat[field] + other_stat[field]
+            #End for
+        #End for
+
+    #End merge()
+
+    def getReport(self):
+
+        """
+        :returns: DataFrame with one row per section stack (names joined by ';') and columns
+                  calls, items, total_time, self_time, mean_time (per call) and item_time (per item), sorted by total time
+        """
+
+        rows = []
+        for key, stat in self.stats.iteritems():
+            rows.append({
+                'section': ';'.join(key),
+                'calls': stat['calls'],
+                'items': stat['items'],
+                'total_time': stat['total_time'],
+                'self_time': stat['self_time'],
+                'mean_time': stat['total_time'] / stat['calls'],
+                'item_time': stat['total_time'] / stat['items'] if stat['items'] > 0 else np.nan
+            })
+        #End for
+
+        columns = ['calls', 'items', 'total_time', 'self_time', 'mean_time', 'item_time']
+
+        if len(rows) == 0:
+            return pd.DataFrame(columns=columns)
+        #End if
+
+        report = pd.DataFrame(rows).set_index('section')[columns]
+
+        return report.sort_values('total_time', ascending=False)
+
+    #End getReport()
+
+    def getHistogram(self, section):
+
+        """
+        :param section: section stack, as found in the index of getReport()
+        :returns: Series of call counts indexed by upper bin edge in microseconds
+        """
+
+        stat = self.stats[tuple(section.split(';'))]
+
+        return pd.Series(stat['histogram'], index=self.histogram_bins)
+
+    #End getHistogram()
+
+    def writeCollapsedStacks(self, filepath):
+
+        """
+        Write self time of each section stack in the collapsed stack format used by flame graph tools
+        (one "outer;inner microseconds" line per stack)
+
+        :param filepath: path of file to write
+        """
+
+        with open(filepath, 'w') as f:
+            for key, stat in sorted(self.stats.iteritems()):
+                f.write('{stack} {t}\n'.format(stack=';'.join(key), t=int(round(stat['self_time'] * 1e6))))
+            #End for
+        #End with
+
+    #End writeCollapsedStacks()
+
+#End Profiler
+
+#Shared instance used by model components unless they are given their own
+profiler = Profiler()
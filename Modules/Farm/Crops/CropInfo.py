@@ -5,13 +5,20 @@ import numpy as np
 from datetime import datetime
 
 from integrated.Modules.Core.IntegratedModelComponent import Component
+from integrated.Modules.Farm.Fields.FieldState import CropState, stateProperty
 
 class CropInfo(Component):
 
     """
     Crop Object that represents a crop type
+
+    Simulation state (planted, plant_date) is kept in a CropState, or the row of the field it is planted in
+    when fields are held in a FieldStateTable, rather than the instance __dict__.
     """
 
+    planted = stateProperty('planted', "(bool) Crop has been planted this season")
+    plant_date = stateProperty('plant_date', "Date the crop was planted")
+
     def __init__(self, crop_name, price_per_yield, variable_cost_per_Ha, yield_per_Ha=None, gross_margin_per_Ha=None, water_use_ML_per_Ha=None, required_water_ML_per_Ha=None, depletion_fraction=None, **kwargs):
 
         """
@@ -36,6 +43,8 @@ class CropInfo(Component):
 
         """
 
+        self._state = CropState()
+
         self.name = crop_name
 
         #self.yield_per_Ha = yield_per_Ha if yield_per_Ha is not None else 0.0
@@ -115,46 +124,204 @@ class CropInfo(Component):
     #End _prepareSeasonInfo()
 
     def _getPreparedSeasonInfo(self, val_type):
+
+        #Prepared again if season_info has been replaced since it was last prepared
+        if getattr(self, 'prepped_season_source', None) is not self.season_info:
+            self.prepped_season_info = self._prepareSeasonInfo(val_type)
+            self.prepped_season_source = self.season_info
+        #End if
+
+        return self.prepped_season_info.loc[val_type, :].copy()
+    #End getPreparedSeasonInfo()
+
+    def _getStageCalendar(self, val_type="Best Guess"):
+
+        """
+        Growth stages of the crop compiled for fast lookup, built once for each val_type and kept until season_info
+        or planting_info are replaced.
+
+        Stage boundaries are the cumulative number of days from planting at which each stage ends (as in
+        _prepareSeasonInfo()). A day belongs to the first stage whose boundary it does not exceed, and days past the
+        last boundary belong to the last stage.
+
+        :returns: Dict of boundaries (array), stages (array of lower case stage names), whether the boundaries
+                  are sorted (so stages can be found with a binary search), and coefficients for each stage
+                  (Dict of coefficient name and array, filled as coefficients are requested)
+        """
+
         try:
-            season_info = self.prepped_season_info
+            calendars = self.stage_calendars
         except AttributeError:
-            season_info = self._prepareSeasonInfo(val_type)
-            self.prepped_season_info = season_info
+            calendars = self.stage_calendars = {}
         #End try
 
-        return season_info.loc[val_type, :].copy()
-    #End getPreparedSeasonInfo()
+        calendar = calendars.get(val_type)
+        if (calendar is not None) and (calendar['season_info'] is self.season_info) and (calendar['planting_info'] is self.planting_info):
+            return calendar
+        #End if
 
-    def getCurrentStage(self, timestep, val_type="Best Guess"):
+        season_info = self._getPreparedSeasonInfo(val_type).drop('plant_date')
+        boundaries = season_info.values.astype(float)
 
-        season_info = self._getPreparedSeasonInfo(val_type)
-        season_info = season_info.drop('plant_date')
+        calendar = {
+            'season_info': self.season_info,
+            'planting_info': self.planting_info,
+            'boundaries': boundaries,
+            'stages': np.array([stage.lower() for stage in season_info.index], dtype=object),
 
-        days_from_season_start = ((pd.to_datetime(timestep) - self.plant_date) / np.timedelta64(1, 'D')).astype(int)
+            #Days are never <= NaN, so stages with missing lengths are skipped rather than searched
+            'sorted': (not np.isnan(boundaries).any()) and bool(np.all(np.diff(boundaries) >= 0)),
+            'coefs': {}
+        }
 
-        temp = ([days_from_season_start, ] * len(season_info)) <= season_info
+        calendars[val_type] = calendar
+
+        return calendar
+
+    #End _getStageCalendar()
+
+    def _calcDaysFromPlanting(self, timesteps):
+
+        """
+        :param timesteps: datetime or list/array of datetimes
+        :returns: number of whole days since the crop was planted, for each timestep
+        """
+
+        return np.asarray((pd.to_datetime(timesteps) - self.plant_date) / np.timedelta64(1, 'D')).astype(int)
+
+    #End _calcDaysFromPlanting()
+
+    def _findStagePositions(self, calendar, days):
+
+        """
+        :param calendar: stage calendar as given by _getStageCalendar()
+        :param days: array of days since planting
+        :returns: array of positions of the stage for each day
+        """
+
+        boundaries = calendar['boundaries']
+
+        if calendar['sorted']:
+            pos = np.searchsorted(boundaries, days, side='left')
+        else:
+            with np.errstate(invalid='ignore'):
+                within = np.asarray(days)[..., np.newaxis] <= boundaries
+            #End with
+
+            pos = np.where(within.any(axis=-1), within.argmax(axis=-1), len(boundaries))
+        #End if
+
+        #Gone past seasonal growth stages, (past 'late'/'harvest' date)
+        return np.minimum(pos, len(boundaries) - 1)
+
+    #End _findStagePositions()
+
+    def _getCalendarCoefs(self, calendar, coef_name):
+
+        """
+        :returns: array of the given coefficient for each stage in the calendar, NaN where the stage is not in planting_info
+        """
 
         try:
-            stage = temp[temp == True].index[0].lower()
-        except IndexError:
-            #Gone past seasonal growth stages, (past 'late'/'harvest' date)
-            stage = temp.index[-1].lower()
+            return calendar['coefs'][coef_name]
+        except KeyError:
+            pass
+        #End try
+
+        pi = self.planting_info
+        stage_names = pi.index.str.lower()
+
+        coefs = []
+        for stage in calendar['stages']:
+            coef = pi.loc[stage_names == stage, coef_name]
+            coefs.append(coef.iloc[0] if len(coef) > 0 else np.nan)
+        #End for
+
+        coefs = np.array(coefs)
+        calendar['coefs'][coef_name] = coefs
+
+        return coefs
+
+    #End _getCalendarCoefs()
+
+    def getCurrentStage(self, timestep, val_type="Best Guess"):
+
+        calendar = self._getStageCalendar(val_type)
+
+        return calendar['stages'][self._findStagePositions(calendar, self._calcDaysFromPlanting(timestep))]
 
-        return stage
     #End getCurrentStage()
 
     def getStageCoef(self, timestep, coef_name, val_type="Best Guess"):
 
-        stage = self.getCurrentStage(timestep, val_type)
+        calendar = self._getStageCalendar(val_type)
 
-        pi = self.planting_info
-        coef = pi.loc[pi.index.str.lower() == stage, coef_name]
+        pos = self._findStagePositions(calendar, self._calcDaysFromPlanting(timestep))
+        coef = self._getCalendarCoefs(calendar, coef_name)[pos]
 
-        assert len(coef) > 0, "Plant coefficient not found"
+        assert not pd.isnull(coef), "Plant coefficient not found"
 
-        return coef.iloc[0]
+        return coef
     #End getStageCoef()
 
+    def getStages(self, timesteps, val_type="Best Guess"):
+
+        """
+        Batch version of getCurrentStage()
+
+        :param timesteps: list or array of datetimes
+        :returns: array of lower case stage names for each timestep
+        """
+
+        calendar = self._getStageCalendar(val_type)
+
+        return calendar['stages'][self._findStagePositions(calendar, self._calcDaysFromPlanting(timesteps))]
+
+    #End getStages()
+
+    def getStageCoefs(self, timesteps, coef_name, val_type="Best Guess"):
+
+        """
+        Batch version of getStageCoef()
+
+        :param timesteps: list or array of datetimes
+        :param coef_name: name of planting_info column, e.g. 'Crop Coefficient'
+        :returns: array of coefficient for each timestep
+        """
+
+        calendar = self._getStageCalendar(val_type)
+
+        pos = self._findStagePositions(calendar, self._calcDaysFromPlanting(timesteps))
+        coefs = self._getCalendarCoefs(calendar, coef_name)[pos]
+
+        assert not pd.isnull(coefs).any(), "Plant coefficient not found"
+
+        return coefs
+
+    #End getStageCoefs()
+
+    def getCropCoefs(self, timesteps, val_type="Best Guess"):
+
+        """
+        Batch version of getCurrentStageCropCoef()
+        """
+
+        return self.getStageCoefs(timesteps, "Crop Coefficient", val_type)
+
+    #End getCropCoefs()
+
+    def getDepletionCoefs(self, timesteps, val_type="Best Guess"):
+
+        """
+        Batch version of getCurrentStageDepletionCoef()
+        """
+
+        assert self.plant_date != None, "Plant date not set!"
+
+        return self.getStageCoefs(timesteps, "Depletion Fraction", val_type)
+
+    #End getDepletionCoefs()
+
     def getCurrentStageDepletionCoef(self, timestep, val_type="Best Guess"):
 
         """
@@ -298,7 +465,7 @@ class CropInfo(Component):
 
     #End calcGrossMarginsMLHa()
 
-    def calcTotalCropGrossMargin(self, land_used_Ha, yield_per_Ha, price_per_yield):
+    def calcTotalCropGrossMargin(self, land_used_Ha, yield_per_Ha=None, price_per_yield=None):
 
         """
         Calculate gross income from crop for a given irrigated area, taking into account variable costs
@@ -1,6 +1,9 @@
 from __future__ import division
 from integrated.Modules.Core.IntegratedModelComponent import Component
 
+import copy
+import numpy as np
+
 class FarmComponent(Component):
 
     """
@@ -8,6 +11,9 @@ class FarmComponent(Component):
     All methods defined here should be redefined by implementing child classes.
     """
 
+    #Attributes that choose between calculations and so cannot be given as arrays to calcForParamArrays()
+    flag_params = ('implemented',)
+
     def __init__(self, implemented=False):
         self.implemented = implemented
     #End init()
@@ -37,4 +43,58 @@ class FarmComponent(Component):
         Calculate the capital cost 
         """
         pass
-    #End calcImplementationCostPerHa()
\ No newline at end of file
+    #End calcImplementationCostPerHa()
+
+    def calcForParamArrays(self, method_name, params, *args, **kwargs):
+
+        """
+        Evaluate a cost method for many parameter sets in one call, e.g. 100,000 samples of capital cost and
+        discount rate for a range sweep or breakeven search.
+
+        Gives the same values as setting the parameters on this component and calling the method once for each
+        parameter set. The component itself is left unchanged.
+
+        Example::
+
+            annual_costs = Dam.calcForParamArrays('calcAnnualCosts', {'storage_cost_per_ML': np.linspace(500, 2000, 100000),
+                                                                      'discount_rate': np.random.uniform(0.03, 0.1, 100000)})
+
+        :param method_name: name of method to evaluate, e.g. 'calcAnnualCosts'
+        :param params: Dict of attribute name and array (or scalar) of values. Arrays are broadcast against each other
+        :param args: other arguments to pass to the method, which may also be arrays
+        :param kwargs: other keyword arguments to pass to the method
+        :returns: array of the method result for each parameter set
+        """
+
+        arrays = {}
+        for name, values in params.iteritems():
+            if not hasattr(self, name):
+                raise KeyError("{c} has no parameter '{p}'".format(c=type(self).__name__, p=name))
+            #End if
+
+            values = np.asarray(values)
+
+            if (name in self.flag_params) and (values.ndim > 0):
+                raise ValueError("'{p}' chooses between calculations and cannot be given as an array".format(p=name))
+            #End if
+
+            arrays[name] = values
+        #End for
+
+        #Shape of the parameter sets, starting from a scalar in case no arrays are given
+        shape = np.broadcast(np.empty(()), *arrays.values()).shape
+
+        #Shallow copy, so methods that update attributes (e.g. annual_cost) do so on the copy
+        Temp = copy.copy(self)
+        for name, values in arrays.iteritems():
+            setattr(Temp, name, values)
+        #End for
+
+        result = getattr(Temp, method_name)(*args, **kwargs)
+
+        result = np.asarray(result, dtype=float)
+
+        return np.broadcast_to(result, np.broadcast(result, np.broadcast_to(0.0, shape)).shape).copy()
+
+    #End calcForParamArrays()
+
@@ -3,6 +3,7 @@ import math
 import copy
 
 from integrated.Modules.Farm.Farms.FarmComponent import FarmComponent
+from integrated.Modules.Core.GeneralFunctions import calcCapitalCostPerYear
 
 class FarmInfo(FarmComponent):
 
@@ -368,8 +369,6 @@ class FarmInfo(FarmComponent):
         Calculate Annualised implementation costs
         """
 
-        import Common.GeneralFunctions as GeneralFunctions
-
         #Annualise gross income using the greatest lifespan
 
         store_life = self.getParam(component='storages', comp_name=store_name, attr_name='num_years')
@@ -396,7 +395,7 @@ class FarmInfo(FarmComponent):
         #End if
 
         implementation_cost = store_cost + irrig_cost + part_cost
-        implementation_cost = GeneralFunctions.calcCapitalCostPerYear(implementation_cost, self.discount_rate, max_life) + self.storages[store_name].calcOngoingCosts()
+        implementation_cost = calcCapitalCostPerYear(implementation_cost, self.discount_rate, max_life) + self.storages[store_name].calcOngoingCosts()
 
         return implementation_cost
 
@@ -1,12 +1,23 @@
 from __future__ import division
 from integrated.Modules.Core.IntegratedModelComponent import Component
+from integrated.Modules.Farm.Fields.FieldState import FieldState, stateProperty
 
 class FarmField(Component):
 
     """
     Container to associate an irrigation with a crop, irrigation and storage type
+
+    Simulation state (c_swd, water_applied, area) is kept in a FieldState, or a row of a FieldStateTable.
+    Attributes are declared in __slots__, so a field has no instance __dict__.
     """
 
+    __slots__ = ('name', 'Storage', 'Irrigation', '_Crop', 'Soil', 'season_ended', 'pump_operation_hours',
+                 'pump_operation_days', '_state')
+
+    c_swd = stateProperty('c_swd', "Cumulative Soil Water Deficit (mm)")
+    water_applied = stateProperty('water_applied', "Water applied to field (ML)")
+    area = stateProperty('area', "Field area (Ha)")
+
     def __init__(self, name=None, storage=None, irrigation=None, crop=None, soil=None, area=None):
         #self.name = "{i}-{c}".format(i=irrigation.name, c=crop.name)
 
@@ -19,6 +30,8 @@ class FarmField(Component):
         :param area: Field area
         """
 
+        self._state = FieldState()
+
         if name is None:
             self.name = "{i}-{s}".format(i=irrigation.name, s=soil.name)
         else:
@@ -45,6 +58,24 @@ class FarmField(Component):
         
     #End init()
 
+    @property
+    def Crop(self):
+        return self._Crop
+    #End Crop()
+
+    @Crop.setter
+    def Crop(self, Crop):
+
+        self._Crop = Crop
+
+        #Crops planted in a field held in a FieldStateTable keep their state in the field's row
+        table = getattr(self._state, 'table', None)
+        if (table is not None) and (Crop is not None):
+            table.attachCrop(self._state.row, Crop)
+        #End if
+
+    #End Crop()
+
     def status(self, timestep):
 
         return {
@@ -0,0 +1,280 @@
+import numpy as np
+
+
+def stateProperty(name, doc=None):
+
+    """
+    Attribute of a component that is kept in its declared state object (self._state) rather than its __dict__
+
+    :param name: name of state field
+    :param doc: (optional) description of the attribute
+    :returns: property
+    """
+
+    def getter(self):
+        return getattr(self._state, name)
+    #End getter()
+
+    def setter(self, value):
+        setattr(self._state, name, value)
+    #End setter()
+
+    return property(getter, setter, doc=doc)
+
+#End stateProperty()
+
+
+class FieldState(object):
+
+    """
+    Simulation state of a single field, with declared fields instead of an instance __dict__.
+
+    Used by FarmField for the cumulative soil water deficit, water applied and area. Fields that are simulated
+    together can instead keep their state in a FieldStateTable.
+    """
+
+    fields = ('c_swd', 'water_applied', 'area')
+    __slots__ = fields
+
+    def __init__(self, c_swd=None, water_applied=0, area=None):
+
+        """
+        :param c_swd: Cumulative Soil Water Deficit (mm)
+        :param water_applied: water applied to field this season (ML)
+        :param area: Field area (Ha)
+        """
+
+        self.c_swd = c_swd
+        self.water_applied = water_applied
+        self.area = area
+
+    #End init()
+
+    def getValues(self):
+        return tuple(getattr(self, name) for name in self.fields)
+    #End getValues()
+
+    def __deepcopy__(self, memo):
+        return FieldState(*self.getValues())
+    #End __deepcopy__()
+
+    def __reduce__(self):
+        return (FieldState, self.getValues())
+    #End __reduce__()
+
+#End FieldState
+
+
+class CropState(object):
+
+    """
+    Simulation state of a crop, with declared fields instead of an instance __dict__.
+    """
+
+    fields = ('planted', 'plant_date')
+    __slots__ = fields
+
+    def __init__(self, planted=False, plant_date=None):
+
+        """
+        :param planted: (bool) crop has been planted this season
+        :param plant_date: date the crop was planted
+        """
+
+        self.planted = planted
+        self.plant_date = plant_date
+
+    #End init()
+
+    def getValues(self):
+        return tuple(getattr(self, name) for name in self.fields)
+    #End getValues()
+
+    def __deepcopy__(self, memo):
+        return CropState(*self.getValues())
+    #End __deepcopy__()
+
+    def __reduce__(self):
+        return (CropState, self.getValues())
+    #End __reduce__()
+
+#End CropState
+
+
+class _RowView(object):
+
+    """
+    State of one field held in a row of a FieldStateTable. Copying or pickling a view gives standalone state
+    with the current values, so copies of a field do not write into the table.
+    """
+
+    __slots__ = ('table', 'row')
+
+    standalone = None
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+    #End init()
+
+    def getValues(self):
+        return tuple(getattr(self, name) for name in self.fields)
+    #End getValues()
+
+    def __deepcopy__(self, memo):
+        return self.standalone(*self.getValues())
+    #End __deepcopy__()
+
+    def __reduce__(self):
+        return (self.standalone, self.getValues())
+    #End __reduce__()
+
+#End _RowView
+
+
+def _columnProperty(name, convert):
+
+    def getter(self):
+        return convert(self.table.columns[name][self.row])
+    #End getter()
+
+    def setter(self, value):
+        self.table.columns[name][self.row] = value
+    #End setter()
+
+    return property(getter, setter)
+
+#End _columnProperty()
+
+
+def _optionalFloat(value):
+    return None if np.isnan(value) else float(value)
+#End _optionalFloat()
+
+
+class FieldStateView(_RowView):
+
+    __slots__ = ()
+
+    fields = FieldState.fields
+    standalone = FieldState
+
+    c_swd = _columnProperty('c_swd', _optionalFloat)
+    water_applied = _columnProperty('water_applied', float)
+    area = _columnProperty('area', _optionalFloat)
+
+#End FieldStateView
+
+
+class CropStateView(_RowView):
+
+    __slots__ = ()
+
+    fields = CropState.fields
+    standalone = CropState
+
+    planted = _columnProperty('planted', bool)
+    plant_date = _columnProperty('plant_date', lambda value: value)
+
+#End CropStateView
+
+
+class FieldStateTable(object):
+
+    """
+    Struct-of-arrays store of the simulation state of many fields (e.g. all fields of all farms in a region).
+
+    Each field and its crop keep their usual attribute API (Field.c_swd, Field.Crop.planted, etc.), but the values
+    are held in one array per state variable, so a farm adds no per-field state objects and the state of all fields
+    can be worked on at once through the arrays in columns.
+
+    A crop given to a field after it is added (e.g. the next crop in rotation) takes over the field's row, and the
+    crop it replaces is given standalone state with its last values.
+
+    Example::
+
+        Table = FieldStateTable()
+        Table.addFields([Field for Farm in farms for Field in Farm.fields])
+
+        #Cumulative soil water deficit of every field
+        Table.columns['c_swd']
+
+    """
+
+    #Column name and dtype; None is stored as NaN in float columns
+    dtypes = [('c_swd', float), ('water_applied', float), ('area', float), ('planted', bool), ('plant_date', object)]
+
+    def __init__(self):
+
+        self.columns = {name: np.empty(0, dtype=dtype) for name, dtype in self.dtypes}
+        self.crops = np.empty(0, dtype=object)
+
+    #End init()
+
+    def __len__(self):
+        return len(self.crops)
+    #End __len__()
+
+    def addFields(self, fields):
+
+        """
+        Move the state of the given fields (and their crops) into this table
+
+        :param fields: list of FarmField objects
+        :returns: array of rows given to the fields
+        """
+
+        start = len(self)
+        rows = np.arange(start, start + len(fields))
+
+        for name, dtype in self.dtypes:
+            self.columns[name] = np.concatenate([self.columns[name], np.empty(len(fields), dtype=dtype)])
+        #End for
+
+        self.crops = np.concatenate([self.crops, np.empty(len(fields), dtype=object)])
+
+        for row, Field in zip(rows, fields):
+            c_swd, water_applied, area = Field._state.getValues()
+
+            self.columns['c_swd'][row] = np.nan if c_swd is None else c_swd
+            self.columns['water_applied'][row] = water_applied
+            self.columns['area'][row] = np.nan if area is None else area
+            self.columns['planted'][row] = False
+            self.columns['plant_date'][row] = None
+
+            Field._state = FieldStateView(self, row)
+
+            if Field.Crop is not None:
+                self.attachCrop(row, Field.Crop)
+            #End if
+        #End for
+
+        return rows
+
+    #End addFields()
+
+    def attachCrop(self, row, Crop):
+
+        """
+        Keep the state of the given crop in the given row
+
+        :param row: row of field the crop is planted in
+        :param Crop: CropInfo object
+        """
+
+        previous = self.crops[row]
+        if (previous is not None) and (previous is not Crop):
+            previous._state = CropState(*previous._state.getValues())
+        #End if
+
+        planted, plant_date = Crop._state.getValues()
+
+        self.columns['planted'][row] = planted
+        self.columns['plant_date'][row] = plant_date
+
+        Crop._state = CropStateView(self, row)
+        self.crops[row] = Crop
+
+    #End attachCrop()
+
+#End FieldStateTable
@@ -2,6 +2,7 @@ from __future__ import division
 from integrated.Modules.Farm.Farms.FarmComponent import FarmComponent
 from integrated.Modules.Core.GeneralFunctions import *
 import copy
+import numpy as np
 
 class IrrigationPractice(FarmComponent):
 
@@ -214,8 +215,13 @@ class IrrigationPractice(FarmComponent):
         Calculate the operational cost of this irrigation system
         """
 
-        op_cost_per_Ha = (self.maintenance_rate * self.cost_per_Ha) \
-                            if self.cost_per_Ha != 0.0 else self.maintenance_rate * self.replacement_cost_per_Ha
+        if np.ndim(self.cost_per_Ha) > 0:
+            #Parameter arrays, see FarmComponent.calcForParamArrays()
+            op_cost_per_Ha = self.maintenance_rate * np.where(self.cost_per_Ha != 0.0, self.cost_per_Ha, self.replacement_cost_per_Ha)
+        else:
+            op_cost_per_Ha = (self.maintenance_rate * self.cost_per_Ha) \
+                                if self.cost_per_Ha != 0.0 else self.maintenance_rate * self.replacement_cost_per_Ha
+        #End if
 
         op_cost_per_Ha = op_cost_per_Ha + self.cost_per_Ha
 
@@ -249,7 +255,11 @@ class IrrigationPractice(FarmComponent):
         :return type: float
         """
 
-        self.replacement_cost_per_Ha = self.replacement_cost_per_Ha if self.cost_per_Ha == 0 else self.cost_per_Ha
+        if np.ndim(self.cost_per_Ha) > 0:
+            self.replacement_cost_per_Ha = np.where(self.cost_per_Ha == 0, self.replacement_cost_per_Ha, self.cost_per_Ha)
+        else:
+            self.replacement_cost_per_Ha = self.replacement_cost_per_Ha if self.cost_per_Ha == 0 else self.cost_per_Ha
+        #End if
 
         return irrigation_area_Ha * self.replacement_cost_per_Ha
     #End calcReplacementCost()
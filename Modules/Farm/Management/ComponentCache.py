@@ -0,0 +1,234 @@
+from collections import OrderedDict
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from integrated.Modules.Core.IntegratedModelComponent import Component
+
+
+class ComponentCache(object):
+
+    """
+    Least recently used cache of values calculated from farm components, such as storage and irrigation costs per Hectare.
+
+    Entries are keyed by what the value was calculated from: for each component its type and name (identity) and a
+    fingerprint of all its parameter values, so changing any parameter (e.g. an irrigation system becoming implemented)
+    gives a different key rather than a stale value. Parameter tables (pandas objects, numpy arrays) are fingerprinted
+    by identity, as components share them read-only.
+
+    Example::
+
+        Cache = ComponentCache(max_entries=1000)
+
+        key = Cache.makeKey('irrigation_cost_per_Ha', Field.Irrigation)
+        irrig_cost_per_Ha = Cache.memoize(key, Field.Irrigation.calcTotalCostsPerHa)
+
+        print Cache.getStats()
+
+    """
+
+    def __init__(self, max_entries=1000):
+
+        """
+        :param max_entries: largest number of values to keep. Unbounded if None
+        """
+
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.clear()
+
+    #End init()
+
+    def clear(self):
+
+        """
+        Remove all entries and reset statistics
+        """
+
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    #End clear()
+
+    @classmethod
+    def _update(cls, h, value, seen):
+
+        """
+        Add value to the fingerprint h
+
+        :param h: hashlib object
+        :param value: value to add
+        :param seen: Dict of id of objects already added and the order they were added in, so objects referenced more
+                     than once are added once
+        """
+
+        if isinstance(value, (pd.core.generic.NDFrame, np.ndarray)):
+            h.update('table:{i}:{s}'.format(i=id(value), s=value.shape))
+            return
+        #End if
+
+        if isinstance(value, (basestring, int, long, float, bool, type(None), np.generic)):
+            h.update(type(value).__name__)
+            h.update(repr(value))
+            return
+        #End if
+
+        if id(value) in seen:
+            h.update('ref:{n}'.format(n=seen[id(value)]))
+            return
+        #End if
+
+        seen[id(value)] = len(seen)
+
+        if isinstance(value, dict):
+            h.update('dict')
+            for key in sorted(value):
+                h.update(repr(key))
+                cls._update(h, value[key], seen)
+            #End for
+
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            h.update(type(value).__name__)
+            for item in (sorted(value) if isinstance(value, (set, frozenset)) else value):
+                cls._update(h, item, seen)
+            #End for
+
+        elif isinstance(value, Component) or hasattr(value, '__dict__'):
+            h.update(type(value).__name__)
+
+            #Declared state (see Fields.FieldState) has no __dict__ and is added by its values instead,
+            #so copies with equal values give equal keys
+            attributes = value.getAttributes() if isinstance(value, Component) else value.__dict__
+            for key in sorted(attributes):
+                if key == '_state':
+                    continue
+                #End if
+
+                h.update(repr(key))
+                cls._update(h, attributes[key], seen)
+            #End for
+
+            state = attributes.get('_state')
+            if state is not None:
+                h.update('state')
+                for item in state.getValues():
+                    cls._update(h, item, seen)
+                #End for
+            #End if
+
+        else:
+            h.update(repr(value))
+        #End if
+
+    #End _update()
+
+    @classmethod
+    def makeKey(cls, *parts):
+
+        """
+        :param parts: components and other values (e.g. the total farm area) the cached value depends on
+        :returns: key as string
+        """
+
+        h = hashlib.sha1()
+        seen = {}
+        for part in parts:
+            cls._update(h, part, seen)
+        #End for
+
+        return h.digest()
+
+    #End makeKey()
+
+    def get(self, key, default=None):
+
+        """
+        :param key: key as given by makeKey()
+        :param default: value to return if key is not cached
+        :returns: cached value
+        """
+
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        #End try
+
+        #Most recently used entries are kept at the end
+        self.entries[key] = value
+        self.hits += 1
+
+        return value
+
+    #End get()
+
+    def put(self, key, value):
+
+        """
+        :param key: key as given by makeKey()
+        :param value: value to cache
+        """
+
+        self.entries[key] = value
+
+        if self.max_entries is not None:
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            #End while
+        #End if
+
+    #End put()
+
+    def memoize(self, key, func, *args, **kwargs):
+
+        """
+        Get the cached value for key, calculating and caching it with func(*args, **kwargs) if not cached
+
+        :param key: key as given by makeKey()
+        :param func: function to calculate the value
+        :returns: value
+        """
+
+        if key in self.entries:
+            return self.get(key)
+        #End if
+
+        self.misses += 1
+
+        value = func(*args, **kwargs)
+        self.put(key, value)
+
+        return value
+
+    #End memoize()
+
+    def getStats(self):
+
+        """
+        :returns: Dict of number of entries, hits, misses, evictions and hit rate
+        """
+
+        lookups = self.hits + self.misses
+
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': (self.hits / float(lookups)) if lookups > 0 else np.nan
+        }
+
+    #End getStats()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+#End ComponentCache
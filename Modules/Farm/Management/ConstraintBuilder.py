@@ -0,0 +1,196 @@
+import numpy as np
+import scipy.sparse as sparse
+
+
+class ConstraintBuilder(object):
+
+    """
+    Builds the left hand side constraint matrices (A_ub, A_eq) for the farm LP as sparse matrices.
+
+    The constraint matrices only depend on the layout of the problem (number of field/water source columns, number of
+    water sources, and which field/crop combinations are active), not on the profits or areas being considered.
+    Matrices are therefore built once per layout and reused for every field combination, season and week.
+
+    Example::
+
+        Builder = ConstraintBuilder()
+        A_ub = Builder.getFieldWaterSourceAub(num_coefs=8, num_water_sources=2)
+
+        b_ub = Builder.calcBub(A_ub, b_ub_list, max_b_ub)
+
+    """
+
+    def __init__(self, max_entries=None):
+
+        """
+        :param max_entries: (optional) largest number of layouts to keep. Unbounded if None
+        """
+
+        self.max_entries = max_entries
+        self.layouts = {}
+        self.hits = 0
+        self.misses = 0
+
+    #End init()
+
+    @staticmethod
+    def genGroupRows(num_coefs, num_set):
+
+        """
+        Sparse equivalent of LpInterface.generateFieldAub(). One row for each consecutive group of num_set coefficients,
+        with a '1' for each coefficient in the group
+
+        :param num_coefs: number of :math:`c` coefficients
+        :param num_set: number of coefficients in a group
+        :returns: A_ub rows
+        :return type: scipy.sparse.csr_matrix
+        """
+
+        if num_set < 1:
+            raise ValueError("Group size must be at least 1, got {n}".format(n=num_set))
+        #End if
+
+        cols = np.arange(num_coefs)
+        rows = cols // num_set
+        num_rows = -(-num_coefs // num_set)
+
+        return sparse.csr_matrix((np.ones(num_coefs), (rows, cols)), shape=(num_rows, num_coefs))
+
+    #End genGroupRows()
+
+    def _getCached(self, key, build):
+
+        try:
+            A = self.layouts[key]
+            self.hits += 1
+            return A
+        except KeyError:
+            pass
+        #End try
+
+        self.misses += 1
+
+        A = build()
+
+        if (self.max_entries is not None) and (len(self.layouts) >= self.max_entries):
+            self.layouts.clear()
+        #End if
+
+        self.layouts[key] = A
+
+        return A
+
+    #End _getCached()
+
+    def getFieldWaterSourceAub(self, num_coefs, num_water_sources):
+
+        """
+        A_ub used by LpInterface.genAubs(). In order, rows for:
+
+        * each Field-WaterSource column (area irrigated with each water source)
+        * each Field (area irrigated from all water sources)
+        * the farm (total area, only if there is more than one Field)
+
+        :param num_coefs: number of Field-WaterSource columns
+        :param num_water_sources: number of water sources
+        :returns: A_ub
+        :return type: scipy.sparse.csr_matrix
+        """
+
+        if num_coefs < 1:
+            raise ValueError("Left hand constraints cannot be empty!")
+        #End if
+
+        def build():
+            blocks = [sparse.identity(num_coefs, format='csr'), self.genGroupRows(num_coefs, num_water_sources)]
+
+            #Fields are completely used
+            if num_coefs > num_water_sources:
+                blocks.append(self.genGroupRows(num_coefs, num_coefs))
+            #End if
+
+            return sparse.vstack(blocks, format='csr')
+        #End build()
+
+        return self._getCached(('field_ws', num_coefs, num_water_sources), build)
+
+    #End getFieldWaterSourceAub()
+
+    def getFieldCropAub(self, num_coefs, num_water_sources, crop_rows, num_fields):
+
+        """
+        A_ub used by LpInterface.genAllAubs(). In order, rows for:
+
+        * each Field-Crop-WaterSource column
+        * each Field-Crop (all water sources)
+        * each field combination, with a '1' for the Field-Crop-WaterSource columns active in that combination
+        * the farm (only if there is more than one Field)
+
+        :param num_coefs: number of Field-Crop-WaterSource columns
+        :param num_water_sources: number of water sources
+        :param crop_rows: list of lists of active column indices for each field combination
+        :param num_fields: number of fields
+        :returns: A_ub
+        :return type: scipy.sparse.csr_matrix
+        """
+
+        if num_coefs < 1:
+            raise ValueError("Left hand constraints cannot be empty!")
+        #End if
+
+        crop_rows = tuple(tuple(cols) for cols in crop_rows)
+
+        def build():
+            blocks = [sparse.identity(num_coefs, format='csr'), self.genGroupRows(num_coefs, num_water_sources)]
+
+            if len(crop_rows) > 0:
+                rows = np.repeat(np.arange(len(crop_rows)), [len(cols) for cols in crop_rows])
+                cols = np.array([c for active in crop_rows for c in active], dtype=int)
+                blocks.append(sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(crop_rows), num_coefs)))
+            #End if
+
+            if num_fields > 1:
+                blocks.append(self.genGroupRows(num_coefs, num_coefs))
+            #End if
+
+            return sparse.vstack(blocks, format='csr')
+        #End build()
+
+        return self._getCached(('field_crop_ws', num_coefs, num_water_sources, crop_rows, num_fields > 1), build)
+
+    #End getFieldCropAub()
+
+    @staticmethod
+    def calcBub(A_ub, b_ub_list, max_b_ub):
+
+        """
+        Right hand upper bounds for each A_ub row: the sum of the areas for the columns in the row,
+        capped at the maximum possible area for the row
+
+        :param A_ub: sparse A_ub
+        :param b_ub_list: area possible for each column of A_ub
+        :param max_b_ub: maximum area for each row of A_ub
+        :returns: b_ub
+        :return type: numpy array
+        """
+
+        num_rows = A_ub.shape[0]
+        if len(max_b_ub) < num_rows:
+            raise IndexError("Need a maximum area for each of the {n} A_ub rows, got {m}".format(n=num_rows, m=len(max_b_ub)))
+        #End if
+
+        return np.minimum(A_ub.dot(np.asarray(b_ub_list, dtype=float)), np.asarray(max_b_ub[:num_rows], dtype=float))
+
+    #End calcBub()
+
+    def getStats(self):
+
+        """
+        :returns: Dict of number of layouts cached, hits and misses
+        """
+
+        return {'layouts': len(self.layouts), 'hits': self.hits, 'misses': self.misses}
+
+    #End getStats()
+
+#End ConstraintBuilder
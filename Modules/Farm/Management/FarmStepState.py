@@ -0,0 +1,190 @@
+import numpy as np
+
+from integrated.Modules.Farm.Fields.FieldState import FieldStateTable
+
+
+class FarmStepState(object):
+
+    """
+    State of every field of one or more farms held in arrays, so all fields can be advanced a timestep at once
+    with FarmManager.stepFields().
+
+    Cumulative soil water deficit and water applied are kept in a FieldStateTable (so Field.c_swd etc. still work),
+    the values of the field components (irrigation efficiency, soil TAW, crop root depth, pumping costs) in one array
+    per value, and the allocation of each water source in one array across all farms.
+
+    Water sources are numbered per farm, in the order of Farm.water_sources. The proportion of water taken from each
+    water source is given per field as an array of (number of fields, largest number of water sources on a farm).
+
+    Component values are gathered when the state is created; call update() after fields change irrigation systems
+    or crops, and updatePumpingCosts() after water levels change.
+
+    Example::
+
+        State = FarmStepState([Manager])
+        State.setProportions([water_source_proportion[Field.name] for Field in State.fields])
+
+        step = FarmManager.stepFields(State, ETo, crop_coefs, depletion_fractions, effective_rain)
+
+        State.storeAllocations()
+
+    """
+
+    def __init__(self, managers, Table=None):
+
+        """
+        :param managers: list of FarmManagers whose fields are advanced together
+        :param Table: (optional) FieldStateTable to keep field state in. A new table is used if not given
+        """
+
+        self.managers = managers
+        self.fields = [Field for Manager in managers for Field in Manager.Farm.fields]
+
+        self.Table = FieldStateTable() if Table is None else Table
+        self.rows = self.Table.addFields(self.fields)
+
+        num_fields = len(self.fields)
+
+        #Farm each field belongs to
+        self.farm = np.repeat(np.arange(len(managers)), [len(Manager.Farm.fields) for Manager in managers])
+
+        #All water sources, and the position of each farm's water sources in that list (-1 where a farm has fewer)
+        self.water_sources = [WS for Manager in managers for WS in Manager.Farm.water_sources]
+
+        num_ws = [len(Manager.Farm.water_sources) for Manager in managers]
+        self.ws_index = np.full((len(managers), max(num_ws) if len(num_ws) > 0 else 0), -1, dtype=int)
+
+        start = 0
+        for i, n in enumerate(num_ws):
+            self.ws_index[i, :n] = np.arange(start, start + n)
+            start += n
+        #End for
+
+        self.allocation = np.array([WS.allocation for WS in self.water_sources], dtype=float)
+        self.proportion = np.zeros((num_fields, self.ws_index.shape[1]))
+
+        #Values of the last timestep
+        self.ETc = np.zeros(num_fields)
+        self.effective_rain = np.zeros(num_fields)
+        self.RAW = np.zeros(num_fields)
+        self.nid = np.zeros(num_fields)
+
+        self.update()
+
+    #End init()
+
+    def __len__(self):
+        return len(self.fields)
+    #End __len__()
+
+    @property
+    def c_swd(self):
+        return self.Table.columns['c_swd'][self.rows]
+    #End c_swd()
+
+    @property
+    def water_applied(self):
+        return self.Table.columns['water_applied'][self.rows]
+    #End water_applied()
+
+    @property
+    def area(self):
+        return self.Table.columns['area'][self.rows]
+    #End area()
+
+    def update(self):
+
+        """
+        Gather the values of each field's irrigation system, soil and crop
+        """
+
+        fields = self.fields
+
+        self.irrigation_efficiency = np.array([Field.Irrigation.irrigation_efficiency for Field in fields], dtype=float)
+        self.dryland = np.array(['dryland' in Field.Irrigation.name.lower() for Field in fields], dtype=bool)
+        self.implemented = np.array([Field.Irrigation.implemented for Field in fields], dtype=bool)
+        self.TAW_mm = np.array([Field.Soil.TAW_mm for Field in fields], dtype=float)
+        self.root_depth_m = np.array([np.nan if Field.Crop is None else Field.Crop.root_depth_m for Field in fields], dtype=float)
+
+        self.updatePumpingCosts()
+
+    #End update()
+
+    def updatePumpingCosts(self):
+
+        """
+        Pumping cost per ML for each field and water source of its farm, as given by WaterSource.calcPumpingCostsPerML()
+        """
+
+        self.pumping_cost_per_ML = np.zeros(self.proportion.shape)
+
+        for i, Field in enumerate(self.fields):
+            flow_rate_Lps = Field.calcFlowRate()
+
+            for slot, ws in enumerate(self.ws_index[self.farm[i]]):
+                if ws == -1:
+                    break
+                #End if
+
+                self.pumping_cost_per_ML[i, slot] = self.water_sources[ws].calcPumpingCostsPerML(flow_rate_Lps, additional_head=Field.Irrigation.head_pressure)
+            #End for
+        #End for
+
+    #End updatePumpingCosts()
+
+    def setProportions(self, proportions):
+
+        """
+        :param proportions: list of Dicts (one for each field, in the order of self.fields) of the proportion of water
+                            to take from each water source, e.g. {'Surface Water': 0.6, 'Groundwater': 0.4},
+                            or array of (number of fields, number of water sources)
+        """
+
+        if isinstance(proportions, np.ndarray):
+            if proportions.shape != self.proportion.shape:
+                raise ValueError("Expected proportions of shape {e}, got {s}".format(e=self.proportion.shape, s=proportions.shape))
+            #End if
+
+            self.proportion[:] = proportions
+            return
+        #End if
+
+        if len(proportions) != len(self.fields):
+            raise ValueError("Expected proportions for {n} fields, got {m}".format(n=len(self.fields), m=len(proportions)))
+        #End if
+
+        for i, proportion in enumerate(proportions):
+            for slot, ws in enumerate(self.ws_index[self.farm[i]]):
+                if ws == -1:
+                    break
+                #End if
+
+                self.proportion[i, slot] = proportion[self.water_sources[ws].name]
+            #End for
+        #End for
+
+    #End setProportions()
+
+    def loadAllocations(self):
+
+        """
+        Read allocation volumes from the water sources (e.g. after allocations are announced for a new season)
+        """
+
+        self.allocation[:] = [WS.allocation for WS in self.water_sources]
+
+    #End loadAllocations()
+
+    def storeAllocations(self):
+
+        """
+        Write allocation volumes back to the water sources
+        """
+
+        for WS, allocation in zip(self.water_sources, self.allocation):
+            WS.allocation = allocation
+        #End for
+
+    #End storeAllocations()
+
+#End FarmStepState
@@ -4,9 +4,24 @@ import itertools
 
 #Linear programming
 from scipy.optimize import linprog as lp
+import scipy.sparse as sparse
+
+from integrated.Modules.Farm.Management.ConstraintBuilder import ConstraintBuilder
 
 class LpInterface(object):
 
+    def __init__(self, Constraints=None, Solver=None):
+
+        """
+        :param Constraints: (optional) ConstraintBuilder used to build and cache A_ub for each layout
+        :param Solver: (optional) LpSolver used to re-solve each field combination from its previous optimal basis.
+                       If not given, every LP is solved from scratch with SciPy linprog
+        """
+
+        self.Constraints = ConstraintBuilder() if Constraints is None else Constraints
+        self.Solver = Solver
+
+    #End init()
 
     def genLogTemplates(self, field_combinations):
 
@@ -118,56 +133,27 @@ class LpInterface(object):
 
         """
 
-        num_coefs = len(c_coefs)
-        ret = []
-        for i in xrange(0, num_coefs, num_set):
-            temp_list = [y for y in xrange(i, i+(num_set))]
-
-            ret.extend([[1 if x in temp_list else 0 for x, val in enumerate(c_coefs)]])
-        #End for
-
-        return ret
+        return self.Constraints.genGroupRows(len(c_coefs), num_set).toarray().astype(int).tolist()
     #End generateFieldAub()
 
     def genAubs(self, c_log, water_sources):
         """
         Generate A upper bounds for SciPy LP function based on generated c values
-        """
-
-        temp_c = c_log.drop(['max_area', 'bounds'], axis=1)
 
-        A_ub = [0, ] * len(temp_c.columns)
+        A_ub only depends on the number of Field-WaterSource columns and water sources, so is built once for each
+        layout and reused (see ConstraintBuilder)
 
-        #Generate Aubs for case in which a single field is used with a single water source
-        A_ub = self.generateFieldAub(A_ub, 1)
-
-        assert len(A_ub) > 0, "Left hand constraints cannot be empty!"
-
-        num_water_sources = len(water_sources)
-
-        #Generate list of lists, '1' set for each Field-WaterSource combination
-        A_ub.extend(self.generateFieldAub(A_ub[0], num_water_sources))
-
-        #num_fields = len(A_ub) / len(water_sources)
-
-        #Add Aub for alternate combinations (?)
-
-        #Add constraints for when all fields and water sources are used if necessary
-        #Checks if the last Aub entry is of identical values (all 1s)
-        if [A_ub[-1][0]]*len(A_ub[-1]) != A_ub[-1]:
-            t = temp_c.copy()
-            t_mask = ((np.isnan(t)) == False)
-            t = t_mask.applymap(lambda x: 1 if x else 0).as_matrix()
+        :param c_log: Pandas DataFrame of c coefficients, as generated by genLogTemplates()
+        :param water_sources: Water Sources to consider
+        :returns: A_ub
+        :return type: scipy.sparse.csr_matrix
+        """
 
-            #A_ub = np.append(A_ub, t, axis=0)
+        num_coefs = len(c_log.drop(['max_area', 'bounds'], axis=1).columns)
 
-            #Fields are completely used
-            if len(t[0]) > len(water_sources):
-                A_ub = np.append(A_ub, [[1, ]*len(t[0])], axis=0)
-            #End if
-        #End if
+        assert num_coefs > 0, "Left hand constraints cannot be empty!"
 
-        return A_ub
+        return self.Constraints.getFieldWaterSourceAub(num_coefs, len(water_sources))
     #End genAubs()
 
     def genAubMap(self, fields, water_sources):
@@ -195,6 +181,8 @@ class LpInterface(object):
         :param fields_combinations: Pandas Dataframe of field combinations to consider
         :param crops: List of crops to consider for each field
         :param water_sources: List of water sources to consider
+        :returns: A_ub
+        :return type: scipy.sparse.csr_matrix
 
         """
 
@@ -204,37 +192,28 @@ class LpInterface(object):
 
         num_fields_water_sources = (num_fields * num_crops) * num_water_sources
 
-        #Temp c to generate A_ub as this only needs to be done once
-        temp_c = [0 for f in xrange(num_fields_water_sources)]
-        self.c_length = len(temp_c) #Store for later use
-
-        #Generate list of lists, '1' set for each Field-Crop-WaterSource combination
-        A_ub = self.generateFieldAub(temp_c, 1)
-        A_ub.extend(self.generateFieldAub(temp_c, num_water_sources))
+        self.c_length = num_fields_water_sources #Store for later use
 
-        #Set '1' for each active Field-Crop combination
+        #Column indices of each active Field-Crop combination
+        crop_rows = []
         if num_crops > 1:
             for row in fields_combinations.itertuples():
-                t = []
-                #t_map = []
-                for Field in row[1:]:
-                    for f in crops:
-                        for WS in water_sources:
-                            t.append(1 if f == Field.name and Field.Crop.name in crops[f] else 0)
-                        #End for
-                    #end for
+                active = []
+                for field_pos, Field in enumerate(row[1:]):
+                    for crop_pos, f in enumerate(crops):
+                        if f == Field.name and Field.Crop.name in crops[f]:
+                            start = ((field_pos * num_crops) + crop_pos) * num_water_sources
+                            active.extend(xrange(start, start + num_water_sources))
+                        #End if
+                    #End for
                 #End for
-                A_ub.append(t)
-
-                #A_ub_map.append(t_map)
+                crop_rows.append(active)
             #End for
-
-        #Set '1' for each field-WaterSource combination
-        if num_fields > 1:
-            A_ub.extend(self.generateFieldAub(temp_c, num_fields_water_sources))
         #End if
 
-        A_ub_map = np.array(row[1:])
+        A_ub = self.Constraints.getFieldCropAub(num_fields_water_sources, num_water_sources, crop_rows, num_fields)
+
+        A_ub_map = fields_combinations.iloc[-1].values
         self.A_ub_map = np.repeat(A_ub_map, num_water_sources)
 
         return A_ub
@@ -246,8 +225,8 @@ class LpInterface(object):
         """
         :params results: Pandas Dataframe of possible field combinations, used to store LP results
         :params c_bnds: Pandas dataframe of c coefficients and bounds for each field and water source
-        :param A_ub: left hand side upper bounds
-        :param b_ub: right hand side upper bounds
+        :param A_ub: left hand side upper bounds, as generated by genAubs()
+        :param b_ub_log: right hand side upper bounds
         :param b_eq_log: right hand equality constraints
         :param fields: Pandas DataFrame of FarmField objects to consider
         :param water_sources: Water Sources to consider
@@ -270,7 +249,29 @@ class LpInterface(object):
         #Build list of c, b_ub, and bounds for each combination of fields
         temp_df = c_bnds.drop("max_area", axis=1)
 
-        c_length = len(A_ub[0])
+        #A_ub, and so b_ub, are the same for every field combination; calculate them once
+
+        A_ub = sparse.csr_matrix(A_ub)
+        c_length = A_ub.shape[1]
+
+        #Generate maximum bounds for b_ub
+        #Generate a map between fields and Aub constraints
+        self.genAubMap(fields, water_sources)
+
+        #Calculate max area possible with each water source
+        max_ws_areas = [f.area for f in self.A_ub_map]
+
+        #Grab the maximum field area and farm area
+        max_field_areas = [f.area for f in np.unique(self.A_ub_map)]
+        max_b_ub = max_ws_areas + max_field_areas + [sum(max_field_areas)]
+
+        #Calculate total sum for each right hand upper bound combination
+        b_ub_all = self.Constraints.calcBub(A_ub, b_ub_log.iloc[0].tolist(), max_b_ub)
+
+        assert A_ub.shape[0] == len(b_ub_all), "Number of A ub rows must be equal to number of elements in b_ub"
+
+        #SciPy linprog (simplex) only takes dense constraints
+        A_ub = A_ub.toarray()
 
         for row in c_bnds.itertuples():
 
@@ -292,36 +293,7 @@ class LpInterface(object):
                     bounds = j
             #End for
 
-            #Insert a list at an index as we
-            #need to include bounds for each GW+SW combination
-            b_ub_list = b_ub_log.iloc[0].tolist()
-            b_ub = []
-
-            #Generate maximum bounds for b_ub
-            #Generate a map between fields and Aub constraints
-            self.genAubMap(fields, water_sources)
-
-            #Calculate max area possible with each water source
-            max_ws_areas = [f.area for f in self.A_ub_map]
-
-            #Grab the maximum field area and farm area
-            max_field_areas = [f.area for f in np.unique(self.A_ub_map)]
-            max_b_ub = max_ws_areas + max_field_areas + [sum(max_field_areas)]
-            
-            #Generate b_ub for each A_ub entry
-            #Calculate total sum for each right hand upper bound combination
-            for idx, ub in enumerate(A_ub):
-
-                temp = np.array([])
-                #Create association between Field-WaterSource irrigation area and b_ub True/False
-                for f, b in zip(b_ub_list, ub):
-                    temp = np.append(temp, f) if b == True else temp
-                #End for
-
-                b_ub.append(min(sum(temp), max_b_ub[idx]))
-            #End for
-
-            assert len(A_ub) == len(b_ub), "Number of A ub rows must be equal to number of elements in b_ub"
+            b_ub = b_ub_all
 
             try:
                 b_eq = b_eq_log.iloc[i].tolist()
@@ -357,7 +329,12 @@ class LpInterface(object):
 
                 # assert len(A_eq) == len(b_eq), "Number of equality constraints do not match ({A} != {b}, A_eq != b_eq)".format(A=len(A_eq), b=len(b_eq))
 
-                res = lp(c=c, A_ub=A_ub, A_eq=A_eq, b_ub=b_ub, b_eq=b_eq, bounds=bounds)
+                if self.Solver is not None:
+                    #Each field combination keeps its own basis
+                    res = self.Solver.solve((A_ub.shape, i), c=c, A_ub=A_ub, A_eq=A_eq, b_ub=b_ub, b_eq=b_eq, bounds=bounds)
+                else:
+                    res = lp(c=c, A_ub=A_ub, A_eq=A_eq, b_ub=b_ub, b_eq=b_eq, bounds=bounds)
+                #End if
 
             except (ValueError, IndexError) as e:
                 print "====================="
@@ -0,0 +1,228 @@
+import numpy as np
+from scipy.optimize import OptimizeResult
+from scipy.optimize import linprog as lp
+
+
+class LpSolver(object):
+
+    """
+    Wraps SciPy linprog for LPs that are solved again and again with the same constraint structure,
+    where only the right hand sides (b_ub, b_eq) or costs (c) change between solves.
+
+    The optimal basis of each problem (identified by a key, e.g. the field combination) is kept. On the next solve
+    the basis is checked against the new b and c: if it is still primal and dual feasible it is still optimal,
+    and the solution is found with two linear solves instead of a full simplex run. Otherwise the problem is
+    solved from scratch (a fallback) and the new basis kept.
+
+    Only problems with the default variable bounds (all variables >= 0) are warm started.
+
+    Example::
+
+        Solver = LpSolver()
+        LP = LpInterface(Solver=Solver)
+
+        for season in seasons:
+            results = LP.runLP(...)
+        #End for
+
+        print Solver.getStats()
+
+    """
+
+    def __init__(self, warm_start=True, tol=1e-9):
+
+        """
+        :param warm_start: reuse previous optimal bases. If False every problem is solved from scratch
+        :param tol: tolerance used when checking feasibility and optimality of a previous basis
+        """
+
+        self.warm_start = warm_start
+        self.tol = tol
+        self.bases = {}
+        self.clear()
+
+    #End init()
+
+    def clear(self):
+
+        """
+        Forget all kept bases and reset statistics
+        """
+
+        self.bases.clear()
+        self.warm_solves = 0
+        self.cold_solves = 0
+        self.fallbacks = 0
+
+    #End clear()
+
+    @staticmethod
+    def _standardForm(c, A_ub, b_ub, A_eq, b_eq):
+
+        """
+        :returns: Tuple of A, b and cost of the problem in standard form, with a slack variable for each A_ub row
+        """
+
+        A_ub = np.asarray(A_ub, dtype=float)
+        num_ub, num_vars = A_ub.shape
+
+        A = np.hstack([A_ub, np.eye(num_ub)])
+        b = np.asarray(b_ub, dtype=float)
+
+        if A_eq is not None:
+            A_eq = np.asarray(A_eq, dtype=float)
+            A = np.vstack([A, np.hstack([A_eq, np.zeros((A_eq.shape[0], num_ub))])])
+            b = np.append(b, np.asarray(b_eq, dtype=float))
+        #End if
+
+        cost = np.append(np.asarray(c, dtype=float), np.zeros(num_ub))
+
+        return A, b, cost
+
+    #End _standardForm()
+
+    def _findBasis(self, A, values):
+
+        """
+        Choose a basis from the solution found by linprog: the variables with non-zero values, completed
+        (where the solution is degenerate) with slack and then other variables that keep the basis independent
+
+        :param A: standard form constraint matrix
+        :param values: value of each standard form variable
+        :returns: array of basic variable indices, or None if a basis could not be found
+        """
+
+        num_rows, num_cols = A.shape
+
+        positive = np.flatnonzero(values > self.tol)
+        rest = np.setdiff1d(np.arange(num_cols), positive)
+
+        #Slack variables are the last columns of A; try these (in reverse) before the others
+        order = np.concatenate([positive[np.argsort(-values[positive], kind='mergesort')], rest[::-1]])
+
+        Q = np.empty((num_rows, 0))
+        basis = []
+        for j in order:
+            col = A[:, j]
+            residual = col - Q.dot(Q.T.dot(col))
+            norm = np.linalg.norm(residual)
+
+            if norm > self.tol * max(1.0, np.linalg.norm(col)):
+                Q = np.hstack([Q, (residual / norm)[:, np.newaxis]])
+                basis.append(j)
+
+                if len(basis) == num_rows:
+                    return np.array(basis)
+                #End if
+            #End if
+        #End for
+
+        return None
+
+    #End _findBasis()
+
+    def _solveWithBasis(self, basis, A, b, cost, num_vars):
+
+        """
+        :returns: OptimizeResult if the basis is optimal for the given b and cost, otherwise None
+        """
+
+        B = A[:, basis]
+
+        try:
+            x_B = np.linalg.solve(B, b)
+            y = np.linalg.solve(B.T, cost[basis])
+        except np.linalg.LinAlgError:
+            return None
+        #End try
+
+        #Primal feasible
+        if not np.all(x_B >= -self.tol):
+            return None
+        #End if
+
+        #Dual feasible (all reduced costs non-negative)
+        reduced = cost - A.T.dot(y)
+        reduced[basis] = 0.0
+        if not np.all(reduced >= -self.tol):
+            return None
+        #End if
+
+        values = np.zeros(A.shape[1])
+        values[basis] = np.maximum(x_B, 0.0)
+
+        x = values[:num_vars]
+
+        return OptimizeResult(x=x, fun=cost[:num_vars].dot(x), slack=values[num_vars:], success=True, status=0, nit=0,
+                              message='Previous optimal basis is still optimal')
+
+    #End _solveWithBasis()
+
+    def solve(self, key, c, A_ub, b_ub, A_eq=None, b_eq=None, bounds=None):
+
+        """
+        Solve the LP, reusing the optimal basis found for the given key if it is still optimal
+
+        Arguments other than key are as for scipy.optimize.linprog
+
+        :param key: identifies the problem, e.g. a field combination. Problems with the same key are expected to have the same structure
+        :returns: scipy OptimizeResult
+        """
+
+        num_vars = len(c)
+
+        can_warm_start = self.warm_start and (bounds is None or all(bnd == (0, None) for bnd in bounds))
+
+        if can_warm_start:
+            A, b, cost = self._standardForm(c, A_ub, b_ub, A_eq, b_eq)
+
+            basis = self.bases.get(key)
+            if (basis is not None) and (basis[1] == A.shape):
+                res = self._solveWithBasis(basis[0], A, b, cost, num_vars)
+                if res is not None:
+                    self.warm_solves += 1
+                    return res
+                #End if
+
+                self.fallbacks += 1
+            #End if
+        #End if
+
+        res = lp(c=c, A_ub=A_ub, A_eq=A_eq, b_ub=b_ub, b_eq=b_eq, bounds=bounds)
+        self.cold_solves += 1
+
+        if can_warm_start and res.success:
+            values = np.append(res.x, b[:len(b_ub)] - np.asarray(A_ub, dtype=float).dot(res.x))
+            basis = self._findBasis(A, values)
+
+            if basis is not None:
+                self.bases[key] = (basis, A.shape)
+            else:
+                self.bases.pop(key, None)
+            #End if
+        #End if
+
+        return res
+
+    #End solve()
+
+    def getStats(self):
+
+        """
+        :returns: Dict of number of problems with a kept basis, warm and cold solves, fallbacks to a cold solve,
+                  and share of warm start attempts that fell back
+        """
+
+        attempts = self.warm_solves + self.fallbacks
+
+        return {
+            'bases': len(self.bases),
+            'warm_solves': self.warm_solves,
+            'cold_solves': self.cold_solves,
+            'fallbacks': self.fallbacks,
+            'fallback_rate': (self.fallbacks / float(attempts)) if attempts > 0 else np.nan
+        }
+
+    #End getStats()
+
+#End LpSolver
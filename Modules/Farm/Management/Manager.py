@@ -4,6 +4,7 @@ from integrated.Modules.Core.IntegratedModelComponent import Component
 from integrated.Modules.Farm.Fields.Field import FarmField
 from integrated.Modules.Farm.Fields.Soil import SoilType
 from integrated.Modules.Farm.Irrigations.IrrigationPractice import IrrigationPractice
+from integrated.Modules.Farm.Management.FarmStepState import FarmStepState
 
 #Linear programming
 from scipy.optimize import linprog as lp
@@ -544,6 +545,108 @@ class FarmManager(Component):
 
     #End updateWaterAllocations()
 
+    @staticmethod
+    def calcIrrigationStep(c_swd, ETc, effective_rain, nid, RAW, irrigation_efficiency):
+
+        """
+        Array equivalent of updateCSWD() and calcIrrigationMLPerHa() for many fields at once.
+        All arguments are arrays with a value for each field (or scalars applying to all fields).
+
+        :param c_swd: Cumulative Soil Water Deficit of each field (mm)
+        :param ETc: crop water use
+        :param effective_rain: effective rainfall, as given to calcIrrigationMLPerHa()
+        :param nid: Net Irrigation Depth (mm)
+        :param RAW: Readily Available Water (mm)
+        :param irrigation_efficiency: efficiency of each field's irrigation system
+
+        :returns: Tuple of updated Cumulative Soil Water Deficit and water to send (ML/Ha) for each field
+        """
+
+        #Update cumulative Soil Water Deficit, limited to max possible soil water depletion
+        c_swd = np.minimum((c_swd + effective_rain) - ETc, 0)
+        c_swd = np.where(-c_swd > RAW, -RAW, c_swd)
+
+        #Apply Crop Water Use once NID is reached
+        water_to_send_mm = np.where(-c_swd >= nid, -c_swd * 0.5, 0.0)
+
+        adj_water_to_send_ML_Ha = (water_to_send_mm / irrigation_efficiency) / 100
+
+        assert np.all(adj_water_to_send_ML_Ha >= 0), "Cannot send negative amounts of water!"
+
+        return np.minimum(c_swd + water_to_send_mm, 0), adj_water_to_send_ML_Ha
+
+    #End calcIrrigationStep()
+
+    @staticmethod
+    def stepFields(State, ETo, crop_coef, depletion_fraction, effective_rain, irrigating=True, e_rz_coef=0.55):
+
+        """
+        Advance every field held in a FarmStepState by one timestep: update soil water deficits, determine irrigation
+        water, take it from each water source in proportion, and calculate pumping costs.
+
+        Same calculations as calcIrrigationMLPerHa(), updateWaterAllocations() and the pumping cost of each water source,
+        done for all fields of all farms at once. Dryland fields are left unchanged.
+
+        Array arguments have a value for each field, in the order of State.fields; scalars apply to all fields.
+
+        :param State: FarmStepState
+        :param ETo: reference evapotranspiration (mm)
+        :param crop_coef: crop coefficient (Kc) of the current stage of each field's crop
+        :param depletion_fraction: depletion fraction of the current stage of each field's crop
+        :param effective_rain: effective rainfall, as given to calcIrrigationMLPerHa()
+        :param irrigating: (bool) whether fields can be irrigated this timestep, e.g. in the irrigation season.
+                           Fields without an implemented irrigation system are never irrigated.
+        :param e_rz_coef: effective root zone coefficient, as used by FarmField.calcNetIrrigationDepth()
+
+        :returns: Dict of arrays of irrigation water (ML) and pumping cost for each field, and water taken from
+                  each water source for each field (number of fields, number of water sources)
+        """
+
+        rows = State.rows
+        columns = State.Table.columns
+        area = columns['area'][rows]
+
+        State.ETc = ETo * np.asarray(crop_coef, dtype=float)
+        State.effective_rain = np.broadcast_to(np.asarray(effective_rain, dtype=float), area.shape).copy()
+        State.RAW = State.TAW_mm * depletion_fraction
+        State.nid = (State.root_depth_m * e_rz_coef) * State.RAW
+
+        irrigated = ~State.dryland
+
+        c_swd, water_ML_Ha = FarmManager.calcIrrigationStep(columns['c_swd'][rows], State.ETc, State.effective_rain,
+                                                            State.nid, State.RAW, State.irrigation_efficiency)
+
+        columns['c_swd'][rows[irrigated]] = c_swd[irrigated]
+
+        water_ML = np.where(irrigated & State.implemented & irrigating, water_ML_Ha * area, 0.0)
+
+        columns['water_applied'][rows] += water_ML * State.irrigation_efficiency
+
+        #Take water from each water source in proportion
+        ws_water_ML = water_ML[:, np.newaxis] * State.proportion
+
+        ws = State.ws_index[State.farm]
+        has_ws = ws != -1
+        State.allocation -= np.bincount(ws[has_ws], weights=ws_water_ML[has_ws], minlength=len(State.allocation))
+
+        return {
+            'water_ML': water_ML,
+            'ws_water_ML': ws_water_ML,
+            'pumping_cost': (ws_water_ML * State.pumping_cost_per_ML).sum(axis=1)
+        }
+
+    #End stepFields()
+
+    def genStepState(self):
+
+        """
+        :returns: FarmStepState of the fields of this farm, to be advanced with stepFields()
+        """
+
+        return FarmStepState([self])
+
+    #End genStepState()
+
 
     def calcWaterApplication(self, ETc, effective_rain, timestep, proportion, base_irrigation_efficiency=None, crop=None):
 
@@ -845,10 +948,12 @@ class FarmManager(Component):
 
     #End
 
-    def generateFieldCombinations(self):
+    def generateFieldSetups(self):
 
         """
-        Generate all possible combinations of fields, storages and irrigations
+        Generate all possible setups (storage, irrigation and crop) for each field, limited to the available crop choices
+
+        :returns: Dict of field name and list of FarmField objects, one for each possible setup
         """
 
         all_combinations = {
@@ -865,19 +970,162 @@ class FarmManager(Component):
         #Create field objects based on generated field setup combinations
         field_combi = self.setupFieldComponentsStatus(all_combinations)
 
-        #Create all possible combinations of fields
-        field_combinations = self.generateCombinations(field_combi)
-
-        #Filter field_combinations down to available crop choices
+        #Filter field setups down to available crop choices
         crop_choices = self.getAvailableCropChoices()
 
-        field_combinations = field_combinations.apply(lambda x: x.map(lambda y: y if y.Crop.name in crop_choices[y.name] else np.nan))
+        for field_name in field_combi:
+            field_combi[field_name] = [Field for Field in field_combi[field_name] if Field.Crop.name in crop_choices[field_name]]
+        #End for
+
+        return field_combi
+
+    #End generateFieldSetups()
+
+    def generateFieldCombinations(self):
+
+        """
+        Generate all possible combinations of fields, storages and irrigations
+        """
+
+        #Create all possible combinations of fields
+        field_combinations = self.generateCombinations(self.generateFieldSetups())
         field_combinations = field_combinations.dropna().reset_index(drop=True)
-        
+
         return field_combinations
 
     #End generateFieldCombinations()
 
+    def calcFieldProfitBound(self, Field):
+
+        """
+        Upper bound on the profit a field setup can make in a season, used to rank and prune field combinations
+        without solving an LP for them (see searchFieldCombinations()).
+
+        The LP irrigates at most the field area and, per Hectare, earns the crop gross margin (if the irrigation
+        system is implemented) less irrigation, storage, pumping, water and overuse costs. Pumping, water and overuse
+        costs are never negative, so leaving them out gives an upper bound.
+
+        :param Field: FarmField object
+        :returns: maximum possible profit ($) for the field
+        """
+
+        margin_per_Ha = Field.Crop.calcGrossMarginsPerHa() if Field.Irrigation.implemented else 0.0
+        min_costs_per_Ha = Field.Irrigation.calcTotalCostsPerHa() + self.calcStorageCostsPerHa(Field)
+
+        return max(0.0, margin_per_Ha - min_costs_per_Ha) * Field.area
+
+    #End calcFieldProfitBound()
+
+    def searchFieldCombinations(self, evaluate, field_setups=None, tolerance=0.0, max_evaluations=None):
+
+        """
+        Branch and bound search for the most profitable combination of field setups.
+
+        The profit bound of a combination is the sum of the bounds of its field setups (see calcFieldProfitBound()).
+        Combinations are generated lazily in order of decreasing bound, rather than taking the full product of
+        setups, and evaluated (typically by solving the LP) until the next bound is below the best profit found,
+        at which point no remaining combination can do better.
+
+        Example::
+
+            def evaluate(fields):
+                combination = pd.DataFrame([fields], columns=[f.name for f in fields])
+                ...
+                results = Manager.LpInterface.runLP(None, c_log, A_ub, b_ub_log, b_eq_log, combination, Manager.Farm.water_sources)
+                return -results['profit'].iloc[0]
+            #End evaluate()
+
+            evaluated, stats = Manager.searchFieldCombinations(evaluate)
+            best = evaluated.loc[evaluated['profit'].idxmax()]
+
+        :param evaluate: function taking a list of FarmField objects (copies, one per field) and returning the profit ($)
+                         of the combination, or None if it is infeasible
+        :param field_setups: (optional) Dict of field name and list of FarmField setups. Defaults to generateFieldSetups()
+        :param tolerance: only evaluate combinations whose bound exceeds the best profit by more than this amount
+        :param max_evaluations: (optional) stop after evaluating this many combinations
+        :returns: Tuple of DataFrame of evaluated combinations (a column for each field, 'profit_bound' and 'profit'),
+                  in the order evaluated, and Dict of search statistics
+        """
+
+        import heapq
+
+        field_setups = self.generateFieldSetups() if field_setups is None else field_setups
+
+        field_names = sorted(field_setups)
+
+        #Setups for each field, ordered by decreasing bound
+        setups = []
+        bounds = []
+        for field_name in field_names:
+            ranked = sorted(((self.calcFieldProfitBound(Field), i, Field) for i, Field in enumerate(field_setups[field_name])),
+                            key=lambda x: (-x[0], x[1]))
+            setups.append([Field for bound, i, Field in ranked])
+            bounds.append([bound for bound, i, Field in ranked])
+        #End for
+
+        num_combinations = int(np.prod([len(s) for s in setups])) if len(setups) > 0 else 0
+
+        evaluated = []
+        best_profit = -np.inf
+
+        #Best-first enumeration of the product of setups; each combination is a tuple of positions in the ranked lists
+        heap = []
+        seen = set()
+        if num_combinations > 0:
+            start = (0, ) * len(setups)
+            heapq.heappush(heap, (-sum(b[0] for b in bounds), start))
+            seen.add(start)
+        #End if
+
+        while len(heap) > 0:
+
+            neg_bound, positions = heapq.heappop(heap)
+            bound = -neg_bound
+
+            #No remaining combination can beat the best found
+            if bound <= best_profit + tolerance:
+                break
+            #End if
+
+            if (max_evaluations is not None) and (len(evaluated) >= max_evaluations):
+                break
+            #End if
+
+            fields = [setups[k][pos].getCopy() for k, pos in enumerate(positions)]
+            profit = evaluate(fields)
+
+            if profit is not None:
+                best_profit = max(best_profit, profit)
+            #End if
+
+            evaluated.append(fields + [bound, np.nan if profit is None else profit])
+
+            #Next best combinations differ in one field
+            for k in xrange(len(positions)):
+                if positions[k] + 1 < len(setups[k]):
+                    next_positions = positions[:k] + (positions[k] + 1, ) + positions[k+1:]
+
+                    if next_positions not in seen:
+                        seen.add(next_positions)
+                        heapq.heappush(heap, (-sum(bounds[j][p] for j, p in enumerate(next_positions)), next_positions))
+                    #End if
+                #End if
+            #End for
+        #End while
+
+        evaluated = pd.DataFrame(evaluated, columns=field_names + ['profit_bound', 'profit'])
+
+        stats = {
+            'combinations': num_combinations,
+            'evaluated': len(evaluated.index),
+            'pruned': num_combinations - len(evaluated.index),
+            'best_profit': best_profit
+        }
+
+        return evaluated, stats
+
+    #End searchFieldCombinations()
+
     def generateCombinations(self, combs):
 
         """
@@ -0,0 +1,499 @@
+from contextlib import closing
+import multiprocessing
+import os
+
+import numpy as np
+from scipy.optimize import brentq
+
+from integrated.Modules.Core.GeneralFunctions import getRangesFilePath
+from integrated.Modules.Core.Parallel import runInPool, worker_data
+
+
+def findRoots(func, lower, upper, num_points=11, include=None, xtol=1e-8):
+
+    """
+    Find where a function crosses zero within a range of values.
+
+    The function is evaluated on a grid of points to bracket each crossing, and each bracket is then narrowed down
+    with Brent's method. Two crossings between the same pair of grid points cancel out and are not found, so the grid
+    should be fine enough to separate them.
+
+    :param func: function of one value
+    :param lower: lower bound of range
+    :param upper: upper bound of range
+    :param num_points: number of grid points used to bracket crossings
+    :param include: (optional) value to add to the grid, e.g. the best guess value
+    :param xtol: tolerance of roots, relative to the width of the range
+    :returns: array of roots in ascending order
+    """
+
+    grid = np.linspace(lower, upper, num_points)
+    if (include is not None) and (lower < include < upper):
+        grid = np.unique(np.append(grid, include))
+    #End if
+
+    values = np.array([func(x) for x in grid], dtype=float)
+
+    roots = list(grid[values == 0])
+    for i in xrange(len(grid) - 1):
+        a, b = values[i], values[i + 1]
+
+        if np.isfinite(a) and np.isfinite(b) and (a * b < 0):
+            roots.append(brentq(func, grid[i], grid[i + 1], xtol=xtol * (upper - lower)))
+        #End if
+    #End for
+
+    return np.sort(roots)
+
+#End findRoots()
+
+
+def _searchCombination(task):
+
+    """
+    :param task: tuple of (storage name, irrigation name, crop name, list of (storage name, irrigation name) to compare against)
+    :returns: tuple of (storage name, irrigation name, crop name, results), see PointsOfConcernSearch.searchCombination()
+    """
+
+    store, irrigation, crop, alternatives = task
+
+    return store, irrigation, crop, worker_data['Search'].searchCombination(store, irrigation, crop, alternatives)
+
+#End _searchCombination()
+
+
+class PointsOfConcernSearch(object):
+
+    """
+    Searches parameter ranges of storage, irrigation and crop combinations for Points of Concern: values at which
+    the annualized net income of a farm crosses zero, or at which the farm stops being more (or less) profitable than
+    another combination growing the same crop.
+
+    Crossings are bracketed on a grid over each parameter range (min_bound to max_bound) and narrowed down with
+    Brent's method. Combinations are searched in parallel worker processes. For each combination three sets of
+    results are found and written in the folder layout read by GeneralFunctions.importSpecificRangesFromFiles():
+
+        breakeven: for each parameter on its own, the value closest to the best guess at which net income is zero
+        local:     for each parameter on its own, the value closest to the best guess at which net income is zero
+                   or the ranking against another combination flips
+        closest:   the values of all parameters together closest to the best guess (relative to the width of each
+                   range) at which net income is zero, searched along the direction of steepest change in net income
+
+    Each result file is a copy of the component's range table with 'best_guess' replaced by the value found and a
+    'found' column marking parameters for which a value was found; other parameters keep their best guess.
+
+    Farms are created by a function given to the search, called as
+
+        build_farm(store, irrigation, crop, ranges)
+
+    which returns a FarmInfo with the named storage, irrigation and crop set to their best guess values. It must be
+    defined at module level so it can be sent to worker processes.
+
+    Example::
+
+        def build_farm(store, irrigation, crop, ranges):
+            ...
+            return FarmInfo(...)
+        #End build_farm()
+
+        Data = importSpecificRangesFromFiles('FarmDam', 'Spray', 'Cotton')
+
+        Search = PointsOfConcernSearch(build_farm, Data['best_guess'], processes=8)
+        results = Search.run(['FarmDam', 'BasinStorage', 'ASRStorage'], ['Flood', 'Spray', 'Drip'], ['Cotton'])
+
+    """
+
+    #Types of farm component and the parts of a combination they are named by
+    components = ('storages', 'irrigations', 'crops')
+
+    #Parts of a component that may hold a parameter not found on the component itself (see WaterStore.loadParams())
+    subcomponents = ('ClimateVariables', 'WaterSources')
+
+    def __init__(self, build_farm, ranges, processes=None, num_points=11, xtol=1e-8, step=1e-3, income_method='calcAnnualizedNetIncome', output_path=None):
+
+        """
+        :param build_farm: function to create the farm of a combination, see above
+        :param ranges: Dict of component name and DataFrame of parameter ranges, with parameter, best_guess,
+                       min_bound and max_bound columns (e.g. the 'best_guess' ranges given by importSpecificRangesFromFiles())
+        :param processes: number of worker processes, defaults to the number of CPUs. Runs in this process if 1
+        :param num_points: number of grid points used to bracket crossings over each range
+        :param xtol: tolerance of values found, relative to the width of the parameter range
+        :param step: step used to estimate the change in net income with each parameter, relative to the width of
+                     the parameter range
+        :param income_method: FarmInfo method giving the net income, called with irrigation_name and crop_name
+        :param output_path: folder to write results to. Defaults to the one set in paths.py
+        """
+
+        self.build_farm = build_farm
+        self.ranges = ranges
+        self.processes = multiprocessing.cpu_count() if processes is None else processes
+        self.num_points = num_points
+        self.xtol = xtol
+        self.step = step
+        self.income_method = income_method
+        self.output_path = output_path
+
+    #End init()
+
+    @staticmethod
+    def getFarmID(store, irrigation, crop):
+        return store+"_"+irrigation+"_"+crop
+    #End getFarmID()
+
+    def getSearchParams(self, Farm, store, irrigation, crop):
+
+        """
+        Parameters of the combination that can be searched: those with a numeric range of some width that are
+        found on the farm's components
+
+        :returns: list of Dicts of parameter details
+        """
+
+        params = []
+        for component, comp_name in zip(self.components, (store, irrigation, crop)):
+
+            if comp_name not in self.ranges:
+                raise KeyError("No parameter ranges given for '{c}'".format(c=comp_name))
+            #End if
+
+            Comp = getattr(Farm, component)[comp_name]
+
+            for index, row in self.ranges[comp_name].iterrows():
+
+                try:
+                    best_guess, lower, upper = float(row['best_guess']), float(row['min_bound']), float(row['max_bound'])
+                except (TypeError, ValueError):
+                    continue
+                #End try
+
+                if not (upper > lower) or np.isnan(best_guess):
+                    continue
+                #End if
+
+                if hasattr(Comp, row.parameter):
+                    subcomponent = None
+                else:
+                    found = [sub for sub in self.subcomponents if hasattr(getattr(Comp, sub, None), row.parameter)]
+                    if len(found) == 0:
+                        continue
+                    #End if
+
+                    subcomponent = found[0]
+                #End if
+
+                params.append({'index': index, 'component': component, 'comp_name': comp_name, 'subcomponent': subcomponent,
+                               'attr_name': row.parameter, 'best_guess': best_guess, 'lower': lower, 'upper': upper})
+            #End for
+        #End for
+
+        return params
+
+    #End getSearchParams()
+
+    def calcIncome(self, Farm, irrigation, crop, values):
+
+        """
+        Calculate net income of a farm with the given parameter values, setting them back afterwards
+
+        :param Farm: FarmInfo object
+        :param irrigation: name of irrigation to calculate income for
+        :param crop: name of crop to calculate income for
+        :param values: list of (parameter details, value). Parameters of components the farm does not have are left out
+        :returns: net income
+        """
+
+        #Keep the attributes of every component (and its subcomponents) as some cost methods update attributes
+        #from others (e.g. IrrigationPractice.calcReplacementCost())
+        saved = []
+        for component in self.components:
+            for Comp in getattr(Farm, component).itervalues():
+                saved.append((Comp, dict(Comp.__dict__)))
+
+                for sub in self.subcomponents:
+                    Sub = getattr(Comp, sub, None)
+                    if hasattr(Sub, '__dict__'):
+                        saved.append((Sub, dict(Sub.__dict__)))
+                    #End if
+                #End for
+            #End for
+        #End for
+
+        try:
+            for param, x in values:
+
+                if param['comp_name'] not in getattr(Farm, param['component']):
+                    continue
+                #End if
+
+                Farm.setParam(component=param['component'], comp_name=param['comp_name'], subcomponent=param['subcomponent'],
+                              attr_name=param['attr_name'], amount=x)
+            #End for
+
+            return getattr(Farm, self.income_method)(irrigation_name=irrigation, crop_name=crop)
+        finally:
+            for obj, attributes in saved:
+                obj.__dict__.clear()
+                obj.__dict__.update(attributes)
+            #End for
+        #End try
+
+    #End calcIncome()
+
+    def findNearestRoot(self, func, param):
+
+        """
+        :returns: root of func within the parameter range closest to the best guess, or None if there is none
+        """
+
+        roots = findRoots(func, param['lower'], param['upper'], self.num_points, include=param['best_guess'], xtol=self.xtol)
+
+        if len(roots) == 0:
+            return None
+        #End if
+
+        return roots[np.argmin(np.abs(roots - param['best_guess']))]
+
+    #End findNearestRoot()
+
+    def findClosestPoint(self, Farm, irrigation, crop, params, breakeven):
+
+        """
+        Find the values of all parameters together, closest to the best guess, at which net income is zero.
+
+        Distance is measured relative to the width of each parameter range. Starting from the best guess, net income is
+        searched along the direction it changes fastest towards zero until a parameter reaches its bound. The point found
+        is compared against the breakeven point of each parameter on its own, and the closer of these is used.
+
+        :param params: list of parameter details, as given by getSearchParams()
+        :param breakeven: list of breakeven value (or None) of each parameter on its own
+        :returns: array of parameter values, or None if no point was found
+        """
+
+        if len(params) == 0:
+            return None
+        #End if
+
+        x0 = np.array([param['best_guess'] for param in params])
+        lower = np.array([param['lower'] for param in params])
+        upper = np.array([param['upper'] for param in params])
+        width = upper - lower
+
+        calcAt = lambda x: self.calcIncome(Farm, irrigation, crop, zip(params, x))
+
+        income = calcAt(x0)
+        if not np.isfinite(income):
+            return None
+        #End if
+
+        if income == 0:
+            return x0
+        #End if
+
+        best, best_distance = None, np.inf
+
+        #Single parameter breakeven points
+        for i, x in enumerate(breakeven):
+            if x is None:
+                continue
+            #End if
+
+            distance = abs(x - x0[i]) / width[i]
+            if distance < best_distance:
+                best = x0.copy()
+                best[i] = x
+                best_distance = distance
+            #End if
+        #End for
+
+        #Change in income per width of each parameter range
+        gradient = np.zeros(len(params))
+        for i in xrange(len(params)):
+            up, down = x0.copy(), x0.copy()
+            up[i] = min(x0[i] + self.step * width[i], upper[i])
+            down[i] = max(x0[i] - self.step * width[i], lower[i])
+
+            gradient[i] = (calcAt(up) - calcAt(down)) / ((up[i] - down[i]) / width[i])
+        #End for
+
+        norm = np.sqrt(np.sum(gradient**2))
+        if (not np.isfinite(norm)) or (norm == 0):
+            return best
+        #End if
+
+        direction = -np.sign(income) * gradient / norm
+
+        #Furthest distance along direction before a parameter reaches its bound
+        with np.errstate(divide='ignore', invalid='ignore'):
+            limits = np.where(direction > 0, (upper - x0) / width / direction, (lower - x0) / width / direction)
+        #End with
+
+        #No need to search further than the closest single parameter breakeven point
+        t_max = min(np.min(limits[direction != 0]), best_distance)
+        if not (t_max > 0):
+            return best
+        #End if
+
+        roots = findRoots(lambda t: calcAt(x0 + t * direction * width), 0, t_max, self.num_points, xtol=self.xtol)
+        roots = roots[roots > 0]
+
+        if len(roots) > 0 and roots[0] < best_distance:
+            best = np.clip(x0 + roots[0] * direction * width, lower, upper)
+        #End if
+
+        return best
+
+    #End findClosestPoint()
+
+    def searchCombination(self, store, irrigation, crop, alternatives=None):
+
+        """
+        Search for the Points of Concern of one combination
+
+        :param store: name of storage
+        :param irrigation: name of irrigation
+        :param crop: name of crop
+        :param alternatives: (optional) list of (storage name, irrigation name) growing the same crop to compare against
+        :returns: Dict of 'local', 'breakeven' and 'closest', each a Dict of (component type, component name) and
+                  DataFrame of values found
+        """
+
+        alternatives = [] if alternatives is None else alternatives
+
+        Farm = self.build_farm(store, irrigation, crop, self.ranges)
+        params = self.getSearchParams(Farm, store, irrigation, crop)
+
+        others = [(alt_irrigation, self.getFarmID(alt_store, alt_irrigation, crop), self.build_farm(alt_store, alt_irrigation, crop, self.ranges))
+                  for alt_store, alt_irrigation in alternatives]
+
+        breakeven = []
+        local = []
+        for param in params:
+
+            root = self.findNearestRoot(lambda x: self.calcIncome(Farm, irrigation, crop, [(param, x)]), param)
+            breakeven.append(root)
+
+            nearest = (root, 'breakeven', '')
+            for alt_irrigation, alt_id, Other in others:
+
+                #Parameters of components shared with the other farm (e.g. the crop) are changed on both farms
+                diff = lambda x: self.calcIncome(Farm, irrigation, crop, [(param, x)]) - self.calcIncome(Other, alt_irrigation, crop, [(param, x)])
+
+                flip = self.findNearestRoot(diff, param)
+                if (flip is not None) and ((nearest[0] is None) or (abs(flip - param['best_guess']) < abs(nearest[0] - param['best_guess']))):
+                    nearest = (flip, 'ranking', alt_id)
+                #End if
+            #End for
+
+            local.append(nearest)
+        #End for
+
+        closest = self.findClosestPoint(Farm, irrigation, crop, params, breakeven)
+
+        results = {}
+        for case in ('local', 'breakeven', 'closest'):
+
+            tables = {}
+            for component, comp_name in zip(self.components, (store, irrigation, crop)):
+                table = self.ranges[comp_name].copy()
+                table['found'] = False
+
+                if case == 'local':
+                    table['point_type'] = ''
+                    table['compared_to'] = ''
+                #End if
+
+                tables[(component, comp_name)] = table
+            #End for
+
+            for i, param in enumerate(params):
+                table = tables[(param['component'], param['comp_name'])]
+
+                if case == 'breakeven':
+                    value = breakeven[i]
+                elif case == 'local':
+                    value, point_type, compared_to = local[i]
+                else:
+                    value = None if closest is None else closest[i]
+                #End if
+
+                if value is None:
+                    continue
+                #End if
+
+                table.loc[param['index'], 'best_guess'] = value
+                table.loc[param['index'], 'found'] = True
+
+                if case == 'local':
+                    table.loc[param['index'], 'point_type'] = point_type
+                    table.loc[param['index'], 'compared_to'] = compared_to
+                #End if
+            #End for
+
+            results[case] = tables
+        #End for
+
+        return results
+
+    #End searchCombination()
+
+    def writeResults(self, store, irrigation, crop, results):
+
+        """
+        Write results of a combination in the folder layout read by importSpecificRangesFromFiles()
+
+        :param results: results of the combination, as given by searchCombination()
+        """
+
+        for case, tables in results.iteritems():
+            for (component, comp_name), table in tables.iteritems():
+
+                filepath = getRangesFilePath(case, store, irrigation, crop, component, comp_name, output_path=self.output_path)
+
+                folder = os.path.dirname(filepath)
+                if not os.path.isdir(folder):
+                    os.makedirs(folder)
+                #End if
+
+                table.to_csv(filepath)
+            #End for
+        #End for
+
+    #End writeResults()
+
+    def run(self, storages, irrigations, crops, write=True):
+
+        """
+        Search every combination of the given storages, irrigations and crops. Each combination is compared against
+        the other combinations growing the same crop.
+
+        :param storages: list of storage names
+        :param irrigations: list of irrigation names
+        :param crops: list of crop names
+        :param write: write results of each combination as they arrive
+        :returns: Dict of farm id (e.g. FarmDam_Spray_Cotton) and results, as given by searchCombination()
+        """
+
+        combinations = [(store, irrigation, crop) for crop in crops for store in storages for irrigation in irrigations]
+
+        tasks = [(store, irrigation, crop, [(s, i) for s, i, c in combinations if (c == crop) and ((s, i) != (store, irrigation))])
+                 for store, irrigation, crop in combinations]
+
+        results = {}
+        found = runInPool(_searchCombination, tasks, data={'Search': self}, processes=self.processes)
+
+        with closing(found):
+            for store, irrigation, crop, combination_results in found:
+
+                if write:
+                    self.writeResults(store, irrigation, crop, combination_results)
+                #End if
+
+                results[self.getFarmID(store, irrigation, crop)] = combination_results
+            #End for
+        #End with
+
+        return results
+
+    #End run()
+
+#End PointsOfConcernSearch
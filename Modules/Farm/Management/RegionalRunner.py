@@ -0,0 +1,297 @@
+from contextlib import closing
+import hashlib
+import multiprocessing
+import os
+import pickle
+import random
+
+import numpy as np
+import pandas as pd
+
+from integrated.Modules.Core.Parallel import runInPool, worker_data
+
+
+def shareTables(tables, path):
+
+    """
+    Write tables to disk so they can be memory-mapped read-only by any number of processes
+
+    Values of each table are written as a .npy file; the index and columns of DataFrames and Series are kept alongside.
+
+    :param tables: Dict of table name and numeric DataFrame, Series or numpy array (e.g. climate data, crop coefficients)
+    :param path: folder to write tables to
+    :returns: Dict of table name and location of the shared table, as used by loadTables()
+    """
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    #End if
+
+    specs = {}
+    for name, table in tables.iteritems():
+
+        values = np.asarray(table.values if isinstance(table, (pd.DataFrame, pd.Series)) else table)
+        if values.dtype == object:
+            raise ValueError("Table '{n}' cannot be shared as it is not numeric".format(n=name))
+        #End if
+
+        filename = os.path.join(path, '{n}.npy'.format(n=name))
+        np.save(filename, values)
+
+        meta = None
+        if isinstance(table, pd.DataFrame):
+            meta = {'type': 'DataFrame', 'index': table.index, 'columns': table.columns}
+        elif isinstance(table, pd.Series):
+            meta = {'type': 'Series', 'index': table.index, 'name': table.name}
+        #End if
+
+        meta_filename = None
+        if meta is not None:
+            meta_filename = os.path.join(path, '{n}.meta.pkl'.format(n=name))
+            with open(meta_filename, 'wb') as f:
+                pickle.dump(meta, f, pickle.HIGHEST_PROTOCOL)
+            #End with
+        #End if
+
+        specs[name] = (filename, meta_filename)
+    #End for
+
+    return specs
+
+#End shareTables()
+
+
+def loadTables(specs):
+
+    """
+    Memory-map tables written by shareTables(). Values are opened read-only and are not copied into the process.
+
+    :param specs: Dict of table name and location, as given by shareTables()
+    :returns: Dict of table name and DataFrame, Series or numpy array
+    """
+
+    tables = {}
+    for name, (filename, meta_filename) in specs.iteritems():
+
+        values = np.load(filename, mmap_mode='r')
+
+        if meta_filename is None:
+            tables[name] = values
+            continue
+        #End if
+
+        with open(meta_filename, 'rb') as f:
+            meta = pickle.load(f)
+        #End with
+
+        if meta['type'] == 'DataFrame':
+            tables[name] = pd.DataFrame(values, index=meta['index'], columns=meta['columns'], copy=False)
+        else:
+            tables[name] = pd.Series(values, index=meta['index'], name=meta['name'], copy=False)
+        #End if
+    #End for
+
+    return tables
+
+#End loadTables()
+
+
+def _loadWorkerTables():
+
+    """
+    Map the shared tables once per worker process instead of sending them with every task
+    """
+
+    worker_data['tables'] = loadTables(worker_data['table_specs'])
+
+#End _loadWorkerTables()
+
+
+def _runFarm(task):
+
+    """
+    Run the simulation of one farm
+
+    :param task: tuple of (farm id, farm, seed)
+    :returns: Dict of column name and array of results for the farm
+    """
+
+    farm_id, farm, seed = task
+
+    #Seed the random number generators so the farm gives the same results whichever process runs it
+    random.seed(seed)
+    np.random.seed(seed)
+
+    results = worker_data['simulate'](farm, worker_data['tables'], seed)
+
+    return RegionalRunner.toColumns(farm_id, results)
+
+#End _runFarm()
+
+
+class RegionalRunner(object):
+
+    """
+    Runs the simulation of many farms (e.g. all farms in a region) in parallel worker processes.
+
+    Farms are simulated by a function given to the runner, which is called once for each farm as
+
+        simulate(farm, tables, seed)
+
+    where farm is the farm to simulate (e.g. a FarmManager, or the parameters to build one from), tables is a Dict of
+    the shared tables and seed is the farm's seed. It returns the results for the farm as a DataFrame, or a Dict of
+    column name and values. The function must be defined at module level so it can be sent to worker processes.
+
+    Tables used by every farm (climate data, crop coefficients) are written to disk once and memory-mapped read-only
+    by each worker, rather than pickled with each task.
+
+    Each farm is given a seed from the runner seed and its farm id, and the random number generators (random and
+    numpy.random) are seeded with it before the farm is run, so a farm's results can be reproduced on their own
+    and do not depend on the number of processes or the order farms are run in.
+
+    Results of each farm are gathered, in the order farms are given, into one set of columns with a 'farm_id'
+    column, and can also be appended to a CSV file as they arrive.
+
+    Example::
+
+        def simulate(Manager, tables, seed):
+            ...
+            return {'season': seasons, 'profit': profits}
+        #End simulate()
+
+        Runner = RegionalRunner(simulate, tables={'climate': climate_data}, table_path='shared', processes=8)
+        results = Runner.run(managers, farm_ids=[Manager.Farm.name for Manager in managers], filepath='region.csv')
+
+    """
+
+    def __init__(self, simulate, tables=None, table_path=None, processes=None, seed=0, chunksize=1):
+
+        """
+        :param simulate: function to simulate a farm, see above
+        :param tables: Dict of table name and numeric DataFrame, Series or array shared by all farms
+        :param table_path: folder to write shared tables to. Required if tables are given
+        :param processes: number of worker processes, defaults to the number of CPUs. Runs in this process if 1
+        :param seed: seed from which the seed of each farm is derived
+        :param chunksize: number of farms sent to a worker at a time
+        """
+
+        if (tables is not None) and (len(tables) > 0) and (table_path is None):
+            raise ValueError("A table_path is needed to share tables between processes")
+        #End if
+
+        self.simulate = simulate
+        self.processes = multiprocessing.cpu_count() if processes is None else processes
+        self.seed = seed
+        self.chunksize = chunksize
+
+        self.table_specs = shareTables(tables, table_path) if tables else {}
+
+    #End init()
+
+    def getSeed(self, farm_id):
+
+        """
+        :param farm_id: id of farm
+        :returns: seed for the given farm, derived from the runner seed and the farm id
+        """
+
+        digest = hashlib.sha1('{s}:{f}'.format(s=self.seed, f=farm_id)).hexdigest()
+
+        #numpy seeds must be below 2**32
+        return int(digest[:8], 16)
+
+    #End getSeed()
+
+    @staticmethod
+    def toColumns(farm_id, results):
+
+        """
+        :param farm_id: id of farm
+        :param results: DataFrame, or Dict of column name and values (scalars or equal length sequences)
+        :returns: Dict of column name and array of values, including a 'farm_id' column
+        """
+
+        if isinstance(results, pd.DataFrame):
+            columns = {col: results[col].values for col in results.columns}
+            num_rows = len(results.index)
+        else:
+            columns = {col: np.asarray(values) for col, values in results.iteritems()}
+            lengths = set(values.size for values in columns.itervalues() if values.ndim > 0)
+
+            if len(lengths) > 1:
+                raise ValueError("Results for farm {f} have columns of different lengths: {l}".format(f=farm_id, l=sorted(lengths)))
+            #End if
+
+            num_rows = lengths.pop() if len(lengths) > 0 else 1
+            columns = {col: np.repeat(values, num_rows) if values.ndim == 0 else values.ravel() for col, values in columns.iteritems()}
+        #End if
+
+        if 'farm_id' in columns:
+            raise ValueError("'farm_id' is added by the runner and cannot be a result column")
+        #End if
+
+        columns['farm_id'] = np.repeat(np.asarray(farm_id), num_rows)
+
+        return columns
+
+    #End toColumns()
+
+    def run(self, farms, farm_ids=None, filepath=None):
+
+        """
+        Simulate each of the given farms
+
+        :param farms: list of farms, each given to the simulation function
+        :param farm_ids: (optional) list of ids of each farm. Defaults to the position of each farm in the list
+        :param filepath: (optional) CSV file to append each farm's results to as they arrive
+        :returns: DataFrame of results of all farms, in the order the farms were given
+        """
+
+        farm_ids = range(len(farms)) if farm_ids is None else list(farm_ids)
+
+        if len(farm_ids) != len(farms):
+            raise ValueError("Expected {n} farm ids, got {m}".format(n=len(farms), m=len(farm_ids)))
+        #End if
+
+        if len(set(farm_ids)) != len(farm_ids):
+            raise ValueError("Farm ids must be unique")
+        #End if
+
+        tasks = [(farm_id, farm, self.getSeed(farm_id)) for farm_id, farm in zip(farm_ids, farms)]
+
+        columns = {}
+        col_order = None
+        header = True
+
+        results = runInPool(_runFarm, tasks, data={'simulate': self.simulate, 'table_specs': self.table_specs},
+                            initializer=_loadWorkerTables, processes=self.processes, chunksize=self.chunksize)
+
+        with closing(results):
+            for farm_columns in results:
+
+                if col_order is None:
+                    col_order = ['farm_id'] + sorted(col for col in farm_columns if col != 'farm_id')
+                elif sorted(farm_columns) != sorted(col_order):
+                    raise ValueError("Farm {f} gave different result columns to the first farm".format(f=farm_columns['farm_id'][0]))
+                #End if
+
+                for col in col_order:
+                    columns.setdefault(col, []).append(farm_columns[col])
+                #End for
+
+                if filepath is not None:
+                    pd.DataFrame(farm_columns, columns=col_order).to_csv(filepath, mode='w' if header else 'a', header=header, index=False)
+                    header = False
+                #End if
+            #End for
+        #End with
+
+        if col_order is None:
+            return pd.DataFrame()
+        #End if
+
+        return pd.DataFrame({col: np.concatenate(values) for col, values in columns.iteritems()}, columns=col_order)
+
+    #End run()
+
+#End RegionalRunner
@@ -1,5 +1,5 @@
 from BasinStorage import BasinStorage
-#from Common.GeneralFunctions import *
+from integrated.Modules.Core.GeneralFunctions import calcCapitalCostPerYear
 
 class ASRStorage(BasinStorage):
 
@@ -1,5 +1,5 @@
 from WaterStore import WaterStore
-#from GeneralFunctions import *
+from integrated.Modules.Core.GeneralFunctions import calcCapitalCostPerYear
 
 
 class BasinStorage(WaterStore):
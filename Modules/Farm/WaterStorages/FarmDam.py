@@ -12,6 +12,8 @@ class FarmDam(WaterStore):
     Defines a farm dam
     """
 
+    flag_params = WaterStore.flag_params + ('include_farm_dam_capital_costs',)
+
     def __init__(self, include_farm_dam_capital_costs=True, **kwargs):
 
         self.include_farm_dam_capital_costs = include_farm_dam_capital_costs
@@ -19,7 +19,7 @@ import numpy as np
 
 DEBUG = False
 
-def memoFieldCombinations(row, func, Manager, c_log, b_ub_log, b_eq_log, b_ub_memo={}, comp_memo={}, water_applied=None):
+def memoFieldCombinations(row, func, Manager, c_log, b_ub_log, b_eq_log, cost_cache=None, water_applied=None):
 
     """
     Decorator method to allow memoization for generating Linear Programming coefficients and constraints
@@ -32,8 +32,7 @@ def memoFieldCombinations(row, func, Manager, c_log, b_ub_log, b_eq_log, b_ub_me
     :param c_log: Pandas dataframe used to store the Scipy Linear Programming :math:`c` values for the given row
     :param b_ub_log: Pandas dataframe used to store the Scipy Linear Programming right hand upper bound values
     :param b_eq_log: Pandas dataframe used to store the Scipy Linear Programming right hand equality values
-    :param b_ub_memo: Dict used to store previously generated right hand upper bound values 
-    :param comp_memo: Dict used to store previously generated :math:`c` values for field components
+    :param cost_cache: ComponentCache used to store previously calculated storage and irrigation costs. Not cached if None
     :param water_applied: Dict for each field with amount of water (in ML) already applied
 
     """
@@ -69,31 +68,18 @@ def memoFieldCombinations(row, func, Manager, c_log, b_ub_log, b_eq_log, b_ub_me
         crop_plant_date = Field.Crop.plant_date if hasattr(Field.Crop, 'plant_date') else None
         Field.Crop.planted = True
 
-        field_store = Field.name+" "+Store.name
-
-        #storage_cost_per_Ha = comp_memo.get(field_store, Manager.calcStorageCostsPerHa(Field))
-        if field_store in comp_memo:
-            storage_cost_per_Ha = comp_memo[field_store]
-        else:
-            #Calculate storage costs and memoize
+        if cost_cache is None:
             storage_cost_per_Ha = Manager.calcStorageCostsPerHa(Field)
 
-            if Store.implemented is True:
-                comp_memo[field_store] = storage_cost_per_Ha
-            #End if
-        #End if
-
-        field_irrig = Field.name+" "+Irrig.name
-        if field_irrig in comp_memo:
-            irrig_cost_per_Ha = comp_memo[field_irrig]
-        else:
-            
             #Includes implementation cost if necessary
             irrig_cost_per_Ha = Irrig.calcTotalCostsPerHa()
+        else:
+            #Storage costs are spread over the total farm area
+            storage_key = cost_cache.makeKey('storage_cost_per_Ha', Store, Manager.getTotalFieldArea())
+            storage_cost_per_Ha = cost_cache.memoize(storage_key, Manager.calcStorageCostsPerHa, Field)
 
-            if Irrig.implemented is True:
-                comp_memo[field_irrig] = irrig_cost_per_Ha
-            #End if
+            irrig_key = cost_cache.makeKey('irrig_cost_per_Ha', Irrig)
+            irrig_cost_per_Ha = cost_cache.memoize(irrig_key, Irrig.calcTotalCostsPerHa)
         #End if
 
         logs = [
@@ -144,6 +130,8 @@ if __name__ == "__main__":
     from integrated.Modules.Policy.WaterPolicy import SurfaceWaterPolicy
     from integrated.Modules.Farm.WaterStorages.FarmDam import FarmDam
     from integrated.Modules.Farm.Management.LpInterface import LpInterface
+    from integrated.Modules.Farm.Management.LpSolver import LpSolver
+    from integrated.Modules.Farm.Management.ComponentCache import ComponentCache
 
     #Tired of having columns split over several lines
     pd.set_option('max_colwidth', 5000)
@@ -221,7 +209,8 @@ if __name__ == "__main__":
     crops = irrig_crops + dryland_crops
 
     FileHandler = FileHandler()
-    LpInterface = LpInterface()
+    #Field combinations are re-solved each season and week with only areas and profits changed, so reuse optimal bases
+    LpInterface = LpInterface(Solver=LpSolver())
     Finance = FarmFinance()
     Manager = FarmManager(TestFarm, water_sources, storages, irrigations, crops, LpInterface, Finance)
     Manager.base_irrigation_efficiency = FarmConfig.Gravity.getCopy().irrigation_efficiency
@@ -254,8 +243,9 @@ if __name__ == "__main__":
     orig_field_combinations = field_combinations.copy()
 
     years_ahead = 20
-    field_results_memo = {}
-    b_ub_memo = {}
+
+    #Storage and irrigation costs, shared by the planning loop and the weekly loop below
+    CostCache = ComponentCache(max_entries=1000)
 
     #Manager.LpInterface.setLogTemplates(field_combinations)
     crop_rotations = Manager.crop_rotations.copy()
@@ -273,7 +263,7 @@ if __name__ == "__main__":
         # so use a traditional loop instead, even though it is slower
         for row in field_combinations.itertuples():
             #Calculate results for the given combinations
-            row = memoFieldCombinations(row, Manager.calcFieldCombination, Manager, c_log, b_ub_log, b_eq_log)
+            row = memoFieldCombinations(row, Manager.calcFieldCombination, Manager, c_log, b_ub_log, b_eq_log, cost_cache=CostCache)
         #End for
 
         A_ub = Manager.LpInterface.genAubs(c_log, Manager.Farm.water_sources)
@@ -473,7 +463,7 @@ if __name__ == "__main__":
 
             for row in field_combinations.itertuples():
                 #Calculate results for the given combinations
-                row = memoFieldCombinations(row, Manager.calcFieldCombination, Manager, c_log, b_ub_log, b_eq_log)
+                row = memoFieldCombinations(row, Manager.calcFieldCombination, Manager, c_log, b_ub_log, b_eq_log, cost_cache=CostCache)
             #End for
 
             A_ub = Manager.LpInterface.genAubs(c_log, Manager.Farm.water_sources)
@@ -514,7 +504,7 @@ if __name__ == "__main__":
             for row in field_combinations.itertuples():
 
                 #Calculate results for the given combinations
-                row = memoFieldCombinations(row, Manager.calcFieldCombination, Manager, c_log, b_ub_log, b_eq_log, total_water_applied)
+                row = memoFieldCombinations(row, Manager.calcFieldCombination, Manager, c_log, b_ub_log, b_eq_log, cost_cache=CostCache, water_applied=total_water_applied)
             #End for
 
             A_ub = Manager.LpInterface.genAubs(c_log, Manager.Farm.water_sources)
@@ -553,10 +543,11 @@ if __name__ == "__main__":
 
                 #End for
 
-                summer_rainfall = Climate.getSummerRainfall(timestep, data=ClimateData)
+                #Total rainfall over the range given by Climate.getSummerRainfall()
+                summer_rainfall = Climate.getInterYearTotal(timestep, [1, 4], days=[1, None])
 
                 #Stored soil water at start of season is 25-30% of summer rainfall, as in Oliver et al. 2008; 2009
-                Field.c_swd = -(summer_rainfall['rainfall'].sum() * 0.30)
+                Field.c_swd = -(summer_rainfall * 0.30)
                 #Field.c_swd = min(-Field.Soil.TAW_mm + (summer_rainfall['rainfall'].sum() * 0.30), 0)
 
                 assert Field.Crop.plant_date == None, "Plant date should not be set yet..."
@@ -885,5 +876,8 @@ if __name__ == "__main__":
         FileHandler.writeCSV(irrigation_log[Field.name], 'output', '2nd_phase_{f}_irrig_log.csv'.format(f=Field.name))
     #End for
 
+    print "LP solves: ", Manager.LpInterface.Solver.getStats()
+    print "Cost cache: ", CostCache.getStats()
+
     print "==== DONE ===="
 
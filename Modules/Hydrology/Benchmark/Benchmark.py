@@ -0,0 +1,277 @@
+import datetime
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from integrated.Modules.Hydrology.Benchmark.SyntheticNetwork import SyntheticNetwork
+
+
+def _peakMemory():
+
+    """
+    :returns: peak resident memory of this process in MB
+    """
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    #Reported in bytes on Mac OS and kilobytes elsewhere
+    return peak / 1024.0**2 if sys.platform == 'darwin' else peak / 1024.0
+
+#End _peakMemory()
+
+
+def runCase(case):
+
+    """
+    Time one benchmark case. Run in its own process (see Benchmark.run()) so peak memory is not shared between cases.
+
+    :param case: Dict of case settings as given by Benchmark.getCases()
+    :returns: Dict of case settings and measurements
+    """
+
+    #Imported here to avoid a circular import with Hydrology
+    from integrated.Modules.Hydrology.Hydrology import Hydrology
+
+    data = SyntheticNetwork(case['num_nodes'], node_mix=case['node_mix'], seed=case['seed']).generateData(case['num_steps'] + 1)
+    timesteps = list(data['climate']['Date'])
+
+    base_memory = _peakMemory()
+
+    start = timeit.default_timer()
+    Hydro = Hydrology(data, engine=case['engine'])
+    setup_time = timeit.default_timer() - start
+
+    store = Hydro.createResultsStore(chunk_size=len(timesteps))
+
+    step_times = np.empty(case['num_steps'])
+    for t in xrange(case['num_steps']):
+        start = timeit.default_timer()
+        store = Hydro.run(timesteps[t+1], timesteps[t], data=store)
+        step_times[t] = timeit.default_timer() - start
+    #End for
+
+    #Whole horizon at once, which lets the 'sweep' engine run node by node
+    horizon_time = np.nan
+    if case['engine'] != 'row':
+        start = timeit.default_timer()
+        Hydro.runHorizon(timesteps[:case['num_steps'] + 1])
+        horizon_time = timeit.default_timer() - start
+    #End if
+
+    result = dict((k, v) for k, v in case.iteritems() if k != 'node_mix')
+    result.update({
+        'num_routing': int((data['network']['type'] == 'Routing').sum()),
+        'num_dam': int((data['network']['type'] == 'Dam').sum()),
+        'setup_time': setup_time,
+        'run_time': step_times.sum(),
+        'step_time': step_times.mean(),
+        'step_time_p95': np.percentile(step_times, 95),
+        'step_time_max': step_times.max(),
+        'node_step_time': step_times.mean() / case['num_nodes'],
+        'horizon_time': horizon_time,
+        'base_memory_mb': base_memory,
+        'peak_memory_mb': _peakMemory()
+    })
+
+    return result
+
+#End runCase()
+
+
+def compareResults(results, baseline, candidate, metric='node_step_time'):
+
+    """
+    Compare results recorded under two labels (e.g. two versions of the engines)
+
+    :param results: DataFrame of benchmark results, as returned by Benchmark.run() or Benchmark.load()
+    :param baseline: label of results to compare against
+    :param candidate: label of results to compare
+    :param metric: column to compare
+    :returns: DataFrame of mean metric for each label, and candidate / baseline ratio, for each engine, node mix, network size and run length
+    """
+
+    keys = ['engine', 'mix', 'num_nodes', 'num_steps']
+
+    table = results[results['label'].isin([baseline, candidate])].pivot_table(index=keys, columns='label', values=metric, aggfunc='mean')
+    table['ratio'] = table[candidate] / table[baseline]
+
+    return table
+
+#End compareResults()
+
+
+class Benchmark(object):
+
+    """
+    Times Hydrology.run() on synthetic networks over a grid of network sizes, node type mixes, run lengths and engines.
+
+    Each case runs in a fresh worker process, which records time per timestep, time per node per timestep and peak memory.
+    Engines other than 'row' are also timed running the whole horizon with Hydrology.runHorizon().
+    Results are appended to a CSV file with a label (by default the current git commit), so runs of different versions
+    of the engines can be compared with compareResults().
+
+    Example::
+
+        Bench = Benchmark(node_counts=[10, 100, 1000, 10000], engines=['vectorized', 'sweep'])
+        results = Bench.run('hydrology_benchmark.csv')
+
+        print compareResults(Benchmark.load('hydrology_benchmark.csv'), 'a1b2c3d', 'e4f5a6b')
+
+    """
+
+    #Node type mixes to run by default
+    default_mixes = {
+        'default': SyntheticNetwork.default_mix,
+        'headwater': {'ihacres': 0.8, 'routing': 0.15, 'dam': 0.05},
+        'regulated': {'ihacres': 0.4, 'routing': 0.3, 'dam': 0.3}
+    }
+
+    def __init__(self, node_counts=[10, 100, 1000, 10000], node_mixes=None, num_steps=[365], engines=['row', 'vectorized', 'sweep'],
+                 repeats=1, seed=42, max_node_steps={'row': 200000}, label=None):
+
+        """
+        :param node_counts: list of network sizes
+        :param node_mixes: (optional) Dict of mix name and Dict of node type shares (see SyntheticNetwork). Defaults to default_mixes
+        :param num_steps: list of run lengths in timesteps (days)
+        :param engines: list of Hydrology engines to time
+        :param repeats: number of times to run each case
+        :param seed: seed for generating networks and climate. The same networks are used for every engine
+        :param max_node_steps: Dict of engine and largest number of node timesteps to run. Longer cases are cut short
+                               to keep slow engines practical; the number of timesteps actually run is recorded
+        :param label: (optional) label recorded with the results. Defaults to the current git commit
+        """
+
+        self.node_counts = node_counts
+        self.node_mixes = self.default_mixes if node_mixes is None else node_mixes
+        self.num_steps = num_steps
+        self.engines = engines
+        self.repeats = repeats
+        self.seed = seed
+        self.max_node_steps = max_node_steps
+        self.label = self.getVersion() if label is None else label
+
+    #End init()
+
+    @staticmethod
+    def getVersion():
+
+        """
+        :returns: short hash of the current git commit, or 'unknown' if not in a git repository
+        """
+
+        try:
+            here = os.path.dirname(os.path.abspath(__file__))
+            with open(os.devnull, 'w') as devnull:
+                return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=here, stderr=devnull).strip()
+        except (OSError, subprocess.CalledProcessError):
+            return 'unknown'
+        #End try
+
+    #End getVersion()
+
+    def getCases(self):
+
+        """
+        :returns: list of Dicts of settings for each case
+        """
+
+        cases = []
+        for mix_name in sorted(self.node_mixes):
+            for num_nodes in self.node_counts:
+                for num_steps in self.num_steps:
+                    for engine in self.engines:
+
+                        steps_run = num_steps
+                        if engine in self.max_node_steps:
+                            steps_run = max(1, min(num_steps, self.max_node_steps[engine] // num_nodes))
+                        #End if
+
+                        for repeat in xrange(self.repeats):
+                            cases.append({
+                                'label': self.label,
+                                'engine': engine,
+                                'mix': mix_name,
+                                'node_mix': self.node_mixes[mix_name],
+                                'num_nodes': num_nodes,
+                                'num_steps': steps_run,
+                                'requested_steps': num_steps,
+                                'seed': self.seed,
+                                'repeat': repeat
+                            })
+                        #End for
+                    #End for
+                #End for
+            #End for
+        #End for
+
+        return cases
+
+    #End getCases()
+
+    def run(self, filepath=None, verbose=True):
+
+        """
+        Run all cases
+
+        :param filepath: (optional) CSV file to append results to
+        :param verbose: print each result as it completes
+        :returns: DataFrame of results, one row per case
+        """
+
+        #A new process for every case so each starts from the same memory footprint
+        pool = multiprocessing.Pool(processes=1, maxtasksperchild=1)
+
+        results = []
+        try:
+            for result in pool.imap(runCase, self.getCases()):
+                if verbose:
+                    print "{engine:>10} {mix:>10} {num_nodes:>6} nodes {num_steps:>5} steps: {step_time:.6f}s per step, " \
+                          "{node_step_time:.3e}s per node step, {peak_memory_mb:.1f}MB peak".format(**result)
+                #End if
+
+                results.append(result)
+            #End for
+        finally:
+            pool.close()
+            pool.join()
+        #End try
+
+        columns = ['label', 'timestamp', 'python', 'numpy', 'pandas', 'engine', 'mix', 'num_nodes', 'num_routing', 'num_dam',
+                   'requested_steps', 'num_steps', 'seed', 'repeat', 'setup_time', 'run_time', 'step_time', 'step_time_p95',
+                   'step_time_max', 'node_step_time', 'horizon_time', 'base_memory_mb', 'peak_memory_mb']
+
+        results = pd.DataFrame(results)
+        results['timestamp'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        results['python'] = platform.python_version()
+        results['numpy'] = np.__version__
+        results['pandas'] = pd.__version__
+        results = results[columns]
+
+        if filepath is not None:
+            results.to_csv(filepath, mode='a', header=not os.path.exists(filepath), index=False)
+        #End if
+
+        return results
+
+    #End run()
+
+    @staticmethod
+    def load(filepath):
+
+        """
+        :param filepath: CSV file of benchmark results written by run()
+        :returns: DataFrame of results
+        """
+
+        return pd.read_csv(filepath, dtype={'label': str})
+
+    #End load()
+
+#End Benchmark
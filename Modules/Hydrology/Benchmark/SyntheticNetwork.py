@@ -0,0 +1,197 @@
+from collections import OrderedDict
+import datetime
+
+import numpy as np
+import pandas as pd
+
+
+class SyntheticNetwork(object):
+
+    """
+    Generates random river networks, parameters and climate in the same layout as the Hydrology data folder,
+    for benchmarking and testing the hydrology engines at scale.
+
+    Networks are random trees draining to a single END node. Each node flows into an earlier node that can take inflows
+    (a routing, dam or END node), so IHACRES nodes are always headwaters.
+
+    Example::
+
+        Synthetic = SyntheticNetwork(1000, node_mix={'ihacres': 0.5, 'routing': 0.4, 'dam': 0.1}, seed=42)
+        data = Synthetic.generateData(num_steps=365)
+
+        Hydro = Hydrology(data)
+
+    """
+
+    #Share of each node type (other than the outlet) in generated networks
+    default_mix = {'ihacres': 0.5, 'routing': 0.4, 'dam': 0.1}
+
+    #Node type names as found in the network table
+    type_names = {'ihacres': 'IHACRES', 'routing': 'Routing', 'dam': 'Dam', 'end': 'END'}
+
+    def __init__(self, num_nodes, node_mix=None, seed=None):
+
+        """
+        :param num_nodes: number of nodes in the network, including the outlet
+        :param node_mix: (optional) Dict of node type ('ihacres', 'routing', 'dam') and share of nodes of that type
+        :param seed: (optional) seed for the random number generator, so the same network can be generated again
+        """
+
+        if num_nodes < 2:
+            raise ValueError("Synthetic networks need at least 2 nodes, got {n}".format(n=num_nodes))
+        #End if
+
+        node_mix = self.default_mix if node_mix is None else node_mix
+
+        unknown = [t for t in node_mix if t not in ('ihacres', 'routing', 'dam')]
+        if len(unknown) > 0:
+            raise ValueError("Unknown node type(s) in node mix: {t}".format(t=unknown))
+        #End if
+
+        self.num_nodes = num_nodes
+        self.node_mix = node_mix
+        self.seed = seed
+
+        self.random = np.random.RandomState(seed)
+
+        self.node_ids = range(1, num_nodes + 1)
+        self.IDs = ['S{n}'.format(n=node_id) for node_id in self.node_ids]
+
+    #End init()
+
+    def generateNetwork(self):
+
+        """
+        :returns: DataFrame of network with columns ID, node, to node, type, a, b, h0
+        """
+
+        types = sorted(self.node_mix.keys())
+        share = np.array([self.node_mix[t] for t in types], dtype=float)
+
+        #The first node is the outlet
+        calc_type = ['end'] + list(self.random.choice(types, size=self.num_nodes - 1, p=share / share.sum()))
+
+        #Each node flows into a random earlier node that takes inflows
+        to_node = [np.nan]
+        receivers = [self.node_ids[0]]
+        for i in xrange(1, self.num_nodes):
+            to_node.append(receivers[self.random.randint(len(receivers))])
+
+            if calc_type[i] != 'ihacres':
+                receivers.append(self.node_ids[i])
+            #End if
+        #End for
+
+        network = pd.DataFrame(OrderedDict([
+            ('ID', self.IDs),
+            ('node', self.node_ids),
+            ('to node', np.array(to_node, dtype=float)),
+            ('type', [self.type_names[t] for t in calc_type]),
+            ('a', 1000.0),
+            ('b', 1.7),
+            ('h0', self.random.uniform(80.0, 200.0, self.num_nodes))
+        ]), index=self.node_ids)
+
+        return network
+
+    #End generateNetwork()
+
+    def generateClimate(self, num_steps, start_date=datetime.date(year=1900, month=9, day=1)):
+
+        """
+        Daily rainfall (mostly dry days, with gamma distributed falls) and seasonal evaporation for each node
+
+        :param num_steps: number of days
+        :param start_date: date of first day
+        :returns: DataFrame with a Date column of dd/mm/yyyy strings and {ID}_rain, {ID}_evap columns for each node
+        """
+
+        dates = [(start_date + datetime.timedelta(days=d)).strftime('%d/%m/%Y') for d in xrange(num_steps)]
+
+        shape = (num_steps, self.num_nodes)
+
+        wet = self.random.uniform(size=shape) < 0.3
+        rain = np.where(wet, self.random.gamma(0.7, 6.0, size=shape), 0.0)
+
+        season = 4.0 + 3.0*np.cos(2*np.pi*np.arange(num_steps)/365.25)
+        evap = np.maximum(season[:, np.newaxis] + self.random.normal(0.0, 0.5, size=shape), 0.0)
+
+        columns = OrderedDict([('Date', dates)])
+        for k, ID in enumerate(self.IDs):
+            columns['{ID}_rain'.format(ID=ID)] = rain[:, k]
+            columns['{ID}_evap'.format(ID=ID)] = evap[:, k]
+        #End for
+
+        return pd.DataFrame(columns)
+
+    #End generateClimate()
+
+    def generateParams(self):
+
+        """
+        :returns: Dict of IHACRESparams, Routingparams and Damparams tables with a row for each node
+        """
+
+        n = self.num_nodes
+
+        IHACRESparams = pd.DataFrame(OrderedDict([
+            ('ID', self.IDs),
+            ('node', self.node_ids),
+            ('d1', self.random.uniform(200.0, 215.0, n)),
+            ('d2', 400.0),
+            ('e', 1.0),
+            ('f', 160.0),
+            ('alpha', 0.9),
+            ('area', self.random.uniform(10.0, 2000.0, n)),
+            ('a', 0.7)
+        ]), index=self.node_ids)
+
+        Routingparams = pd.DataFrame(OrderedDict([
+            ('ID', self.IDs),
+            ('node', self.node_ids),
+            ('storage_coef', 0.9),
+            ('ET_f', 1.2),
+            ('area', 0.1)
+        ]), index=self.node_ids)
+
+        Damparams = pd.DataFrame(OrderedDict([
+            ('ID', self.IDs),
+            ('node', self.node_ids),
+            ('storage_coef', 0.001),
+            ('area', self.random.uniform(10.0, 50.0, n)),
+            ('max_storage', 304650.0)
+        ]), index=self.node_ids)
+
+        return {'IHACRESparams': IHACRESparams, 'Routingparams': Routingparams, 'Damparams': Damparams}
+
+    #End generateParams()
+
+    def _nodeTable(self, column, values):
+        return pd.DataFrame(OrderedDict([('ID', self.IDs), ('node', self.node_ids), (column, values)]), index=self.node_ids)
+    #End _nodeTable()
+
+    def generateData(self, num_steps, start_date=datetime.date(year=1900, month=9, day=1)):
+
+        """
+        Generate everything Hydrology needs, as it would be loaded from the data folder (tables indexed by node)
+
+        :param num_steps: number of days of climate data
+        :param start_date: date of first day
+        :returns: Dict of DataFrames
+        """
+
+        data = {
+            'network': self.generateNetwork(),
+            'climate': self.generateClimate(num_steps, start_date=start_date),
+            'water_volume': self._nodeTable('water_volume', self.random.uniform(0.0, 600.0, self.num_nodes)),
+            'water_deficit': self._nodeTable('water_deficit', 200.0),
+            'dam_volume': self._nodeTable('water_volume', 0.0)
+        }
+
+        data.update(self.generateParams())
+
+        return data
+
+    #End generateData()
+
+#End SyntheticNetwork
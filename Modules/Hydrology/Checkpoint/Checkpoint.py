@@ -0,0 +1,128 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from integrated.Modules.Hydrology.ResultsStore.ResultsStore import ResultsStore
+
+
+class Checkpoint(object):
+
+    """
+    State of all nodes at the end of a timestep, from which a run can be continued.
+
+    Holds the per-node values carried between timesteps (catchment moisture deficit, RRstorage, storage, flow and level)
+    and is saved as a single uncompressed .npz file.
+
+    Example::
+
+        spin_up = Hydro.runHorizon(spin_up_timesteps)
+        Checkpoint.fromResults(spin_up, spin_up_timesteps[-1], Hydro.node_order).save('spin_up.npz')
+
+        #Later, branch any number of scenario runs from the same state
+        results = Hydro.restart('spin_up.npz', scenario_timesteps)
+
+    """
+
+    variables = ResultsStore.variables
+
+    def __init__(self, date, node_ids, state):
+
+        """
+        :param date: timestep label the state is for
+        :param node_ids: list of node ids, giving the order of values in the state arrays
+        :param state: Dict of variable name and array of values for each node
+        """
+
+        missing = [var for var in self.variables if var not in state]
+        if len(missing) > 0:
+            raise ValueError("Checkpoint state is missing variable(s): {v}".format(v=missing))
+        #End if
+
+        self.date = date
+        self.node_ids = list(node_ids)
+        self.state = {var: np.asarray(state[var], dtype=float) for var in self.variables}
+
+    #End init()
+
+    @classmethod
+    def fromResults(cls, results, date, node_ids):
+
+        """
+        :param results: ResultsStore, or Dict of DataFrames of results for each timestep as used by Hydrology.run()
+        :param date: timestep to take the state from
+        :param node_ids: list of node ids, giving the order of values in the checkpoint
+        :returns: Checkpoint
+        """
+
+        if isinstance(results, ResultsStore):
+            pos = pd.Index(results.node_ids).get_indexer(node_ids)
+            state = results.getState(date)
+            return cls(date, node_ids, {var: state[var][pos] for var in cls.variables})
+        #End if
+
+        frame = results[date]
+        pos = pd.Index(frame['node_id'].values).get_indexer(node_ids)
+
+        return cls(date, node_ids, {var: frame[var].values.astype(float)[pos] for var in cls.variables})
+
+    #End fromResults()
+
+    @classmethod
+    def load(cls, filepath):
+
+        """
+        :param filepath: path of a checkpoint written by save()
+        :returns: Checkpoint
+        """
+
+        with np.load(filepath) as saved:
+            return cls(saved['date'].item(), saved['node_ids'].tolist(), {var: saved[var] for var in cls.variables})
+        #End with
+
+    #End load()
+
+    def save(self, filepath):
+
+        """
+        :param filepath: path of file to write. NumPy adds a .npz extension if not given
+        """
+
+        folder = os.path.dirname(filepath)
+        if folder != '' and not os.path.isdir(folder):
+            os.makedirs(folder)
+        #End if
+
+        np.savez(filepath, date=np.array(self.date), node_ids=np.array(self.node_ids), **self.state)
+
+    #End save()
+
+    def getState(self, node_ids):
+
+        """
+        :param node_ids: list of node ids to give the state for, in the order given
+        :returns: Dict of variable name and array of values
+        """
+
+        pos = pd.Index(self.node_ids).get_indexer(node_ids)
+        if (pos == -1).any():
+            raise KeyError("Checkpoint has no state for node(s) {n}".format(n=list(np.asarray(node_ids)[pos == -1])))
+        #End if
+
+        return {var: self.state[var][pos].copy() for var in self.variables}
+
+    #End getState()
+
+    @staticmethod
+    def getFilename(date):
+
+        """
+        :param date: timestep label, e.g. '01/09/1980'
+        :returns: file name to use for a checkpoint of the given timestep, e.g. 'checkpoint_01-09-1980.npz'
+        """
+
+        return 'checkpoint_{d}.npz'.format(d=str(date).replace('/', '-'))
+
+    #End getFilename()
+
+#End Checkpoint
@@ -54,5 +54,35 @@ class Dam(Component):
         return outflow, water_volume
 
     #End calcFlow()
+
+    def calcFlowBatch(self, climate, node_inflow, irrig_ext, base_flow, deep_drainage, water_volume, Damparams):
+
+        """
+        Array version of calcFlow() for many dams at once.
+
+        :param climate: tuple of arrays (evap, rain), one element per dam
+        :param water_volume: array of water volumes for each dam, as found in the water volume table
+        :param Damparams: list of arrays [storage_coef, area, max_storage]
+        :returns: tuple of arrays (outflow, water_volume)
+
+        """
+
+        evap, rain = climate
+
+        Gamma_k = base_flow - deep_drainage
+
+        storage_coef, area, max_storage = Damparams
+
+        tmp_vol = water_volume + (node_inflow + Gamma_k) + (rain - evap)*area - irrig_ext
+
+        spill = tmp_vol > max_storage
+        spill_volume = 1/(1+storage_coef) * (tmp_vol-max_storage)
+
+        outflow = np.where(spill, storage_coef*(spill_volume), 0.0)
+        water_volume = np.where(spill, spill_volume + max_storage, tmp_vol)
+
+        return outflow, water_volume
+
+    #End calcFlowBatch()
     
 #End Dam
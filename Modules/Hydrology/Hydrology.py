@@ -2,64 +2,94 @@ from integrated.Modules.Core.IntegratedModelComponent import Component
 from integrated.Modules.Hydrology.Routing.Routing import Routing
 from integrated.Modules.Hydrology.IHACRES.IHACRES import IHACRES
 from integrated.Modules.Hydrology.Dam.Dam import Dam
+from integrated.Modules.Hydrology.NodeNetwork.NodeNetwork import NodeNetwork
+from integrated.Modules.Hydrology.ResultsStore.ResultsStore import ResultsStore, stateToFrame
+from integrated.Modules.Hydrology.NodeCache.NodeCache import NodeCache
+from integrated.Modules.Hydrology.Checkpoint.Checkpoint import Checkpoint
+from integrated.Modules.Climate.ForcingCube import ForcingCube
+from integrated.Modules.Core.Profiler import profiler as shared_profiler
 
 import pandas as pd
 import numpy as np
 
-import time
+import os
 
 class Hydrology(object):
 
-    def __init__(self, combined_data, parameters=None):
+    def __init__(self, combined_data, parameters=None, engine='row', forcing=None, profiler=None):
             
         """
         parameters: Dict of IHACRES, Routing, Dam, Network parameters
+        engine: 'row' to apply calcFlow() to each node in turn,
+                'vectorized' to advance all nodes in a timestep together using NumPy arrays (see prepNetworkArrays()),
+                'sweep' to run each node over the whole horizon in topological order when using runHorizon() (see sweepNetwork()).
+                        Single timesteps given to run() are advanced as with 'vectorized'
+        forcing: (optional) ForcingCube of climate data for the network nodes, e.g. one memory-mapped by several processes.
+                 Built from the climate data if not given.
+        profiler: (optional) Profiler to record timings with. Defaults to the shared profiler, which records nothing until enabled.
         """
 
+        self.Profiler = shared_profiler if profiler is None else profiler
+
         self.Data = combined_data
         self.Climate = combined_data['climate']
 
         self.network = combined_data['network']
 
+        #Validates network topology and builds upstream node index
+        self.NodeNetwork = NodeNetwork(self.network)
+
         # self.IHACRESparams  = combined_data['IHACRESparams']
         self.Routingparams  = combined_data["Routingparams"]
 
         self.Damparams      = combined_data['Damparams']
 
-        self.climate_prep = time.time()
-        self.prepClimateDataForNetwork()
-        self.climate_prep = time.time() - self.climate_prep
+        with self.Profiler.section('Hydrology.prepClimateDataForNetwork'):
+            self.prepClimateDataForNetwork(forcing)
+        #End with
 
         self.Routing = Routing(self.Climate, combined_data['water_volume'])
         self.IHACRES = IHACRES(self.Climate, combined_data['water_deficit'], combined_data['IHACRESparams'])
 
         self.Dam     = Dam(self.Climate, combined_data['dam_volume'])
 
-        self.prep_time = 0.0
-        self.calc_time = 0.0 
-        self.dam = 0.0 
-        self.route = 0.0 
-        self.route_i = 0.0 
-        self.inflow_time = 0.0
-        self.ih = 0.0
+        #Node series kept between calls to runIncremental()
+        self.NodeCache = None
+
+        self.prepNodeTables()
+
+        if engine not in ('row', 'vectorized', 'sweep'):
+            raise ValueError("Unknown engine '{e}', expected 'row', 'vectorized' or 'sweep'".format(e=engine))
+        #End if
+
+        self.engine = engine
+
+        if self.engine != 'row':
+            self.prepNetworkArrays()
+        #End if
 
     #End init()
 
-    def prepClimateDataForNetwork(self):
+    def prepClimateDataForNetwork(self, forcing=None):
 
         """
-        Create a Dictionary of climate data for each node
+        Gather evaporation and rainfall for each node into a (time, node, variable) ForcingCube
+
+        :param forcing: (optional) existing ForcingCube to use
         """
 
         network_data = self.network
 
         climate_data = self.Climate
 
-        self.preppedClimate = {i: pd.DataFrame({'rainfall': climate_data["{node_id}_rain".format(node_id=ID)].values,
-                                          'evap': climate_data["{node_id}_evap".format(node_id=ID)].values
-                                          },
-                                          index=climate_data['Date']
-                    ) for i, ID in network_data['ID'].iteritems()}
+        if forcing is None:
+            forcing = ForcingCube.fromNodeClimate(climate_data, list(network_data['node']), list(network_data['ID']), variables=['evap', 'rain'])
+        #End if
+
+        self.Forcing = forcing
+
+        #Columns of the forcing holding evaporation and rainfall (in that order, as expected by calcFlow())
+        self.forcing_vars = [forcing.var_pos['evap'], forcing.var_pos['rain']]
 
         temp = self.network
         filler = np.zeros(len(temp['to node']))
@@ -82,12 +112,188 @@ class Hydrology(object):
 
     #End prepClimateDataForNetwork)
 
+    def _gatherNodeValues(self, table, columns, node_ids, fill=0.0):
+
+        """
+        Extract values from a parameter table for the given nodes, matched by the table's 'node' column.
+
+        :param table: Pandas DataFrame with a 'node' column
+        :param columns: list of columns to extract
+        :param node_ids: list of node ids, gives the order of the returned rows
+        :param fill: value to use for nodes that do not appear in the table
+        :returns: NumPy array of shape (number of nodes, number of columns)
+        """
+
+        pos = pd.Index(table['node'].values).get_indexer(node_ids)
+        values = table[columns].values.astype(float)[pos]
+        values[pos == -1] = fill
+
+        return values
+
+    #End _gatherNodeValues()
+
+    def prepNodeTables(self):
+
+        """
+        Gather Routing, Dam and rating curve parameters once into arrays aligned with the rows of the results template,
+        so calcFlow() does not search the parameter tables for every node in every timestep.
+        """
+
+        node_ids = self.results_template['node_id'].values
+        calc_type = self.results_template['calc_type'].values
+
+        #Row of each node in the results template and the tables below
+        self.template_row = dict((node_id, i) for i, node_id in enumerate(node_ids))
+
+        for table, name, node_type in [(self.Routingparams, 'Routing', 'routing'), (self.Damparams, 'Dam', 'dam')]:
+            missing = np.setdiff1d(node_ids[calc_type == node_type], table['node'].values)
+            if len(missing) > 0:
+                raise KeyError("No {t} parameters for node(s) {n}".format(t=name, n=list(missing)))
+            #End if
+        #End for
+
+        self.routing_table = self._gatherNodeValues(self.Routingparams, ['storage_coef', 'ET_f', 'area'], node_ids, fill=np.nan)
+        self.dam_table = self._gatherNodeValues(self.Damparams, ['storage_coef', 'area', 'max_storage'], node_ids, fill=np.nan)
+        self.rating_table = self._gatherNodeValues(self.network, ['a', 'b', 'h0'], node_ids, fill=np.nan)
+
+        #Rows of nodes with a level given by their rating curve
+        self.level_rows = np.flatnonzero(np.in1d(calc_type, ['routing', 'dam']))
+
+    #End prepNodeTables()
+
+    def calcLevels(self, results):
+
+        """
+        Set the level of all routing and dam nodes from their flow using their rating curves (:math:`a * flow^b + h0`), in one expression.
+
+        :param results: DataFrame of results for a timestep, as found in the results template. Updated in place
+        """
+
+        #Results are usually in the same row order as the template
+        if np.array_equal(results['node_id'].values, self.results_template['node_id'].values):
+            rows = self.level_rows
+            table_rows = rows
+        else:
+            table_rows = pd.Index(self.results_template['node_id'].values).get_indexer(results['node_id'].values)
+            rows = np.flatnonzero(np.in1d(table_rows, self.level_rows))
+            table_rows = table_rows[rows]
+        #End if
+
+        a, b, h0 = self.rating_table[table_rows].T
+        results.iloc[rows, results.columns.get_loc('level')] = a*np.power(results['flow'].values[rows], b)+h0
+
+    #End calcLevels()
+
+    def prepNetworkArrays(self):
+
+        """
+        Pack node information, parameters and climate data into NumPy arrays ordered topologically, for use with the vectorized engine.
+        Node types are stored as index arrays so each node type can be advanced for all nodes in one call.
+        """
+
+        self.node_order = self.NodeNetwork.node_ids
+        node_ids = self.node_order
+
+        #Position of each node in the results template
+        self.template_pos = pd.Index(self.results_template['node_id'].values).get_indexer(node_ids)
+
+        calc_type = self.results_template['calc_type'].values[self.template_pos]
+
+        known_types = np.in1d(calc_type, ['ihacres', 'routing', 'dam', 'end'])
+        if not known_types.all():
+            raise ValueError("No method defined for node type(s): {t}".format(t=list(np.unique(calc_type[~known_types]))))
+        #End if
+
+        self.ihacres_idx = np.flatnonzero(np.in1d(calc_type, ['ihacres', 'routing', 'end']))
+        self.routing_idx = np.flatnonzero(calc_type == 'routing')
+        self.dam_idx = np.flatnonzero(calc_type == 'dam')
+        self.level_idx = np.flatnonzero(np.in1d(calc_type, ['routing', 'dam']))
+
+        self.node_params = self.packNodeParams()
+
+        routing_ids = [node_ids[i] for i in self.routing_idx]
+        self.routing_volume = self._gatherNodeValues(self.Routing.water_volume, ['water_volume'], routing_ids)[:, 0]
+
+        dam_ids = [node_ids[i] for i in self.dam_idx]
+        self.dam_volume = self._gatherNodeValues(self.Dam.water_volume, ['water_volume'], dam_ids)[:, 0]
+
+        self.rating_params = self.rating_table[self.template_pos[self.level_idx]].T
+
+        #Position of each node in the climate forcing
+        self.forcing_pos = self.Forcing.getNodePositions(node_ids)
+
+        self.state = None
+        self.state_frame = None
+
+    #End prepNetworkArrays()
+
+    def _ensureNetworkArrays(self):
+
+        """
+        Prepare the arrays used by the vectorized engine if this model was created with another engine
+        """
+
+        if not hasattr(self, 'node_params'):
+            self.prepNetworkArrays()
+        #End if
+
+    #End _ensureNetworkArrays()
+
+    def packNodeParams(self, IHACRESparams=None, Routingparams=None, Damparams=None):
+
+        """
+        Gather IHACRES, Routing and Dam parameters into arrays aligned with the node type index arrays made by prepNetworkArrays().
+
+        :param IHACRESparams: (optional) IHACRES parameter table. Defaults to the parameters the model was created with
+        :param Routingparams: (optional) Routing parameter table, as above
+        :param Damparams: (optional) Dam parameter table, as above
+        :returns: Dict of 'ihacres' (structured array), 'routing' (array of storage_coef, ET_f, area) and 'dam' (array of storage_coef, area, max_storage)
+        """
+
+        Routingparams = self.Routingparams if Routingparams is None else Routingparams
+        Damparams = self.Damparams if Damparams is None else Damparams
+
+        node_ids = self.node_order
+
+        ihacres_ids = [node_ids[i] for i in self.ihacres_idx]
+        routing_ids = [node_ids[i] for i in self.routing_idx]
+        dam_ids = [node_ids[i] for i in self.dam_idx]
+
+        return {
+            'ihacres': self.IHACRES.packParams(ihacres_ids, params=IHACRESparams),
+            'routing': self._gatherNodeValues(Routingparams, ['storage_coef', 'ET_f', 'area'], routing_ids).T,
+            'dam': self._gatherNodeValues(Damparams, ['storage_coef', 'area', 'max_storage'], dam_ids).T
+        }
+
+    #End packNodeParams()
+
+    def createResultsStore(self, chunk_size=365, spill_path=None):
+
+        """
+        Create a ResultsStore to pass to run() in place of a Dict of DataFrames
+
+        :param chunk_size: number of timesteps to preallocate at a time
+        :param spill_path: (optional) folder to write finished chunks of results to
+        :returns: ResultsStore
+        """
+
+        return ResultsStore(self.NodeNetwork.node_ids, self.results_template, chunk_size=chunk_size, spill_path=spill_path)
+
+    #End createResultsStore()
+
     def run(self, this_time, last_time, data=None):
 
         """
         :param this_time: current timestep as string
+        :param last_time: last timestep as string
+        :param data: Dict of DataFrames of results for each timestep, or a ResultsStore (see createResultsStore())
+        :returns: data with results for this timestep added
         """
 
+        if isinstance(data, ResultsStore):
+            return self._runWithStore(this_time, last_time, data)
+        #End if
+
         # if len(data) == 0:
         #     data = {}
         #     # data[this_time] = {}
@@ -102,13 +308,35 @@ class Hydrology(object):
             data[last_time] = self.results_template.copy()
             last = data[last_time]
 
+        if self.engine != 'row':
+            with self.Profiler.section('Hydrology.run', self.engine, items=len(last.index)):
+                data[this_time] = self.calcNetworkFlow(last, this_time)
+            #End with
+            return data
+        #End if
+
         data[this_time] = self.results_template.copy()
         
-        #For each row in results dataframe (denoted by axis=1), apply the calcFlow method
-        #x represents a given row
-        #So we are calling calcFlow() with the current row, the complete dataframe, and this timestep
-        climate_data = self.preppedClimate
-        data[this_time] = data[last_time].apply(self.calcFlow, args=(last, this_time, climate_data, ), axis=1)
+        with self.Profiler.section('Hydrology.run', self.engine, items=len(last.index)):
+
+            #For each row in results dataframe (denoted by axis=1), apply the calcFlow method
+            #x represents a given row
+            #So we are calling calcFlow() with the current row, the complete dataframe, and this timestep
+            climate_data = self.Forcing.getTimestep(self.Forcing.getTimeIndex(this_time))[:, self.forcing_vars]
+
+            #Sum inflows for all nodes at once
+            with self.Profiler.section('NodeNetwork.calcInflow', items=len(last.index)):
+                pos = pd.Index(last['node_id'].values).get_indexer(self.NodeNetwork.node_ids)
+                node_inflows = dict(zip(self.NodeNetwork.node_ids, self.NodeNetwork.calcInflow(last['flow'].values[pos])))
+            #End with
+
+            data[this_time] = data[last_time].apply(self.calcFlow, args=(last, this_time, climate_data, node_inflows, ), axis=1)
+
+            with self.Profiler.section('Hydrology.calcLevels', items=len(self.level_rows)):
+                self.calcLevels(data[this_time])
+            #End with
+
+        #End with
 
         # for i, row in data[last_time].iterrows():
         #     data[this_time].loc[i] = self.calcFlow(row, last, this_time, climate_data)
@@ -118,7 +346,580 @@ class Hydrology(object):
 
     #End run()
 
-    def calcFlow(self, node, df, this_time, timestep_climate):
+    def _runWithStore(self, this_time, last_time, store):
+
+        """
+        Run a timestep, reading last timestep's state from and recording results into a ResultsStore
+        """
+
+        if last_time not in store:
+            store.recordFrame(last_time, self.results_template)
+        #End if
+
+        with self.Profiler.section('Hydrology.run', self.engine, items=self.NodeNetwork.num_nodes):
+
+            if self.engine != 'row':
+                store.record(this_time, self.calcNetworkState(store.getState(last_time), this_time))
+                return store
+            #End if
+
+            last = store[last_time]
+
+            climate_data = self.Forcing.getTimestep(self.Forcing.getTimeIndex(this_time))[:, self.forcing_vars]
+
+            with self.Profiler.section('NodeNetwork.calcInflow', items=self.NodeNetwork.num_nodes):
+                node_inflows = dict(zip(self.NodeNetwork.node_ids, self.NodeNetwork.calcInflow(store.getState(last_time)['flow'])))
+            #End with
+
+            results = last.apply(self.calcFlow, args=(last, this_time, climate_data, node_inflows, ), axis=1)
+
+            with self.Profiler.section('Hydrology.calcLevels', items=len(self.level_rows)):
+                self.calcLevels(results)
+            #End with
+
+            store.recordFrame(this_time, results)
+
+        #End with
+
+        return store
+
+    #End _runWithStore()
+
+    def calcNetworkFlow(self, last, this_time):
+
+        """
+        Advance all nodes by one timestep with the vectorized engine.
+        Gives the same results as applying calcFlow() to each row of the previous timestep.
+
+        Node state is held in NumPy arrays between calls. If the given results for the last timestep are not the ones
+        produced by the previous call, the state is read in from them instead.
+
+        :param last: DataFrame of results for the last timestep, as found in the results template
+        :param this_time: current timestep as string
+        :returns: DataFrame of results for this timestep
+        """
+
+        if (self.state is None) or (last is not self.state_frame):
+            pos = pd.Index(last['node_id'].values).get_indexer(self.node_order)
+            self.state = {col: last[col].values.astype(float)[pos] for col in ResultsStore.variables}
+        #End if
+
+        self.state = self.calcNetworkState(self.state, this_time)
+        self.state_frame = stateToFrame(self.results_template, self.template_pos, self.state)
+
+        return self.state_frame
+
+    #End calcNetworkFlow()
+
+    def runHorizon(self, timesteps, external_inflow=None, chunk_size=None, spill_path=None, initial=None, 
+                   checkpoint_every=None, checkpoint_path=None):
+
+        """
+        Run all nodes over a series of timesteps, starting from the results template or a checkpoint.
+        Uses sweepNetwork() if the model was created with the 'sweep' engine, otherwise advances all nodes a timestep at a time with the vectorized engine.
+
+        :param timesteps: list of timesteps as strings. The first is the starting state
+        :param external_inflow: (optional) (time, node) array of inflows from outside the network, in topological order,
+                                added to each node's inflow. Row t is used when calculating timesteps[t]
+        :param chunk_size: number of timesteps to preallocate, defaults to all of them
+        :param spill_path: (optional) folder to write finished chunks of results to
+        :param initial: (optional) Checkpoint to start from. Must be for the first timestep
+        :param checkpoint_every: (optional) write a Checkpoint every this many timesteps
+        :param checkpoint_path: folder to write checkpoints to, named as given by Checkpoint.getFilename()
+        :returns: ResultsStore
+        """
+
+        self._ensureNetworkArrays()
+
+        initial_state = None
+        if initial is not None:
+            if initial.date != timesteps[0]:
+                raise ValueError("Checkpoint is for {c}, but the run starts from {t}".format(c=initial.date, t=timesteps[0]))
+            #End if
+            initial_state = initial.getState(self.node_order)
+        #End if
+
+        if (checkpoint_every is not None) and (checkpoint_path is None):
+            raise ValueError("A checkpoint_path is needed to write checkpoints to")
+        #End if
+
+        chunk_size = len(timesteps) if chunk_size is None else chunk_size
+        store = self.createResultsStore(chunk_size=chunk_size, spill_path=spill_path)
+
+        with self.Profiler.section('Hydrology.runHorizon', self.engine, items=len(self.node_order)*(len(timesteps)-1)):
+
+            if self.engine == 'sweep':
+
+                #Sweep the horizon in segments of checkpoint_every timesteps, each starting from the last state of the
+                #one before, so checkpoints are written as the run goes
+                segment = (len(timesteps) - 1) if checkpoint_every is None else checkpoint_every
+
+                state = initial_state
+                start = 0
+                while True:
+                    end = min(start + segment, len(timesteps) - 1)
+
+                    inflow = None if external_inflow is None else external_inflow[start:end + 1]
+                    results = self.sweepNetwork(timesteps[start:end + 1], external_inflow=inflow, initial=state)
+
+                    #Starting state of later segments was recorded by the segment before
+                    first = 0 if start == 0 else 1
+                    store.recordSeries(timesteps[start + first:end + 1], {var: values[first:] for var, values in results.iteritems()})
+
+                    state = {var: results[var][-1].copy() for var in ResultsStore.variables}
+
+                    if (checkpoint_every is not None) and (end > 0) and (end % checkpoint_every == 0):
+                        self._writeCheckpoint(checkpoint_path, timesteps[end], state)
+                    #End if
+
+                    if end == len(timesteps) - 1:
+                        break
+                    #End if
+
+                    start = end
+                #End while
+
+                return store
+            #End if
+
+            if initial_state is None:
+                store.recordFrame(timesteps[0], self.results_template)
+            else:
+                store.record(timesteps[0], initial_state)
+            #End if
+
+            for t in xrange(1, len(timesteps)):
+                inflow = None if external_inflow is None else external_inflow[t]
+                store.record(timesteps[t], self.calcNetworkState(store.getState(), timesteps[t], external_inflow=inflow))
+
+                if (checkpoint_every is not None) and (t % checkpoint_every == 0):
+                    self._writeCheckpoint(checkpoint_path, timesteps[t], store.getState())
+                #End if
+            #End for
+
+        #End with
+
+        return store
+
+    #End runHorizon()
+
+    def _writeCheckpoint(self, checkpoint_path, date, state):
+
+        with self.Profiler.section('Checkpoint.save', items=len(self.node_order)):
+            Checkpoint(date, self.node_order, state).save(os.path.join(checkpoint_path, Checkpoint.getFilename(date)))
+        #End with
+
+    #End _writeCheckpoint()
+
+    def restart(self, checkpoint, timesteps, **kwargs):
+
+        """
+        Continue a run from a checkpoint, e.g. one written by runHorizon() or a shared spin-up state for several scenarios.
+
+        :param checkpoint: Checkpoint, or path to a checkpoint file
+        :param timesteps: list of timesteps as strings to run from the checkpoint. The checkpoint's timestep is used as the
+                          starting state if it is not given first
+        :param kwargs: other arguments for runHorizon() (e.g. checkpoint_every, checkpoint_path)
+        :returns: ResultsStore
+        """
+
+        if not isinstance(checkpoint, Checkpoint):
+            checkpoint = Checkpoint.load(checkpoint)
+        #End if
+
+        timesteps = list(timesteps)
+        if timesteps[0] != checkpoint.date:
+            timesteps = [checkpoint.date] + timesteps
+        #End if
+
+        return self.runHorizon(timesteps, initial=checkpoint, **kwargs)
+
+    #End restart()
+
+    def getCheckpointFrame(self, checkpoint):
+
+        """
+        Results DataFrame for a checkpoint, to continue a run made with run() and a Dict of results::
+
+            checkpoint = Checkpoint.load('checkpoint_01-09-1980.npz')
+            results = {checkpoint.date: Hydro.getCheckpointFrame(checkpoint)}
+
+        :param checkpoint: Checkpoint
+        :returns: DataFrame of results as found in the results template
+        """
+
+        node_ids = list(self.results_template['node_id'])
+
+        return stateToFrame(self.results_template, np.arange(len(node_ids)), checkpoint.getState(node_ids))
+
+    #End getCheckpointFrame()
+
+    def runIncremental(self, timesteps, IHACRESparams=None, Routingparams=None, Damparams=None, cache=None, external_inflow=None):
+
+        """
+        Run all nodes over a series of timesteps, reusing each node's series from earlier runs if nothing it depends on has changed.
+        After a change to some nodes' parameters only those nodes, and the nodes downstream of them, are calculated again.
+
+        Example::
+
+            for params in calibration_sets:
+                results = Hydro.runIncremental(timesteps, IHACRESparams=params)
+
+            print Hydro.NodeCache.getStats()
+
+        :param timesteps: list of timesteps as strings. The first is the starting state, taken from the results template
+        :param IHACRESparams: (optional) IHACRES parameter table. Defaults to the parameters the model was created with
+        :param Routingparams: (optional) Routing parameter table, as above
+        :param Damparams: (optional) Dam parameter table, as above
+        :param cache: (optional) NodeCache to use. Defaults to one kept by this model
+        :param external_inflow: (optional) (time, node) array of inflows from outside the network, in topological order
+        :returns: ResultsStore
+        """
+
+        self._ensureNetworkArrays()
+
+        if cache is None:
+            if self.NodeCache is None:
+                self.NodeCache = NodeCache()
+            #End if
+            cache = self.NodeCache
+        #End if
+
+        params = self.packNodeParams(IHACRESparams=IHACRESparams, Routingparams=Routingparams, Damparams=Damparams)
+
+        store = self.createResultsStore(chunk_size=len(timesteps))
+
+        with self.Profiler.section('Hydrology.runIncremental', items=len(self.node_order)*(len(timesteps)-1)):
+            store.recordSeries(timesteps, self.sweepNetwork(timesteps, external_inflow=external_inflow, params=params, cache=cache))
+        #End with
+
+        return store
+
+    #End runIncremental()
+
+    def sweepNetwork(self, timesteps, external_inflow=None, params=None, cache=None, initial=None):
+
+        """
+        Node-major evaluation. Nodes are visited in topological order and each node's whole time series is calculated before moving on.
+
+        Routing and dam nodes only depend on the flows of upstream nodes in the last timestep, so by the time a node is visited
+        its full upstream inflow series is known and is summed once. Gives the same results as advancing all nodes a timestep at a time.
+
+        :param timesteps: list of timesteps as strings. The first is the starting state, taken from the results template
+        :param external_inflow: (optional) (time, node) array of inflows from outside the network, in topological order
+        :param params: (optional) Dict of node parameters as given by packNodeParams(). Defaults to the model parameters
+        :param cache: (optional) NodeCache of node series to reuse and add to
+        :param initial: (optional) Dict of variable name and array of starting values, in topological order. Defaults to the results template
+        :returns: Dict of variable name and (time, node) array of results, nodes in topological order
+        """
+
+        self._ensureNetworkArrays()
+
+        params = self.node_params if params is None else params
+
+        num_steps = len(timesteps)
+
+        if initial is None:
+            initial = {var: self.results_template[var].values.astype(float)[self.template_pos] for var in ResultsStore.variables}
+        #End if
+
+        results = {var: np.tile(np.asarray(initial[var], dtype=float), (num_steps, 1)) for var in ResultsStore.variables}
+
+        #Position of forcing for all timesteps after the first
+        tpos = [self.Forcing.getTimeIndex(ts) for ts in timesteps[1:]]
+
+        #Position of each node in the parameter arrays of each node type
+        positions = {
+            'ihacres': dict((i, k) for k, i in enumerate(self.ihacres_idx)),
+            'routing': dict((i, k) for k, i in enumerate(self.routing_idx)),
+            'dam': dict((i, k) for k, i in enumerate(self.dam_idx)),
+            'level': dict((i, k) for k, i in enumerate(self.level_idx))
+        }
+
+        if cache is not None:
+            run_key = NodeCache.makeKey(tuple(timesteps))
+            node_keys = {}
+        #End if
+
+        for i in xrange(self.NodeNetwork.num_nodes):
+
+            if cache is not None:
+                node_keys[i] = self._nodeKey(i, run_key, results, params, positions, node_keys, external_inflow)
+
+                cached = cache.get(node_keys[i], num_steps - 1)
+                if cached is not None:
+                    for var in ResultsStore.variables:
+                        results[var][1:, i] = cached[var]
+                    #End for
+                    continue
+                #End if
+            #End if
+
+            self._sweepNode(i, results, tpos, params, positions, external_inflow)
+
+            if cache is not None:
+                cache.put(node_keys[i], dict((var, results[var][1:, i].copy()) for var in ResultsStore.variables), num_steps - 1)
+            #End if
+
+        #End for
+
+        return results
+
+    #End sweepNetwork()
+
+    def _sweepNode(self, i, results, tpos, params, positions, external_inflow=None):
+
+        """
+        Calculate the whole time series of node i in place in the results, for sweepNetwork()
+        """
+
+        network = self.NodeNetwork
+        num_steps = len(tpos) + 1
+        irrig_ext=0; base_flow=0.0; deep_drainage=0
+
+        evap, rain = self.Forcing.data[tpos, self.forcing_pos[i]][:, self.forcing_vars].T
+
+        flow = results['flow'][1:, i]
+        flow[:] = 0.0
+
+        if i in positions['ihacres']:
+            with self.Profiler.section('IHACRES.calcCMDSeries', items=num_steps - 1):
+                deficit, flow[:], RRstorage = self.IHACRES.calcCMDSeries(results['deficit'][0, i], results['RRstorage'][0, i], 
+                                                                         rain, evap, params['ihacres'][positions['ihacres'][i]])
+                results['deficit'][1:, i] = deficit
+                results['RRstorage'][1:, i] = RRstorage
+            #End with
+        #End if
+
+        if (i not in positions['routing']) and (i not in positions['dam']):
+            return
+        #End if
+
+        #Whole inflow series from upstream nodes, lagged by a timestep
+        with self.Profiler.section('NodeNetwork.calcInflow', items=num_steps - 1):
+            upstream = network.upstream_nodes[network.upstream_offsets[i]:network.upstream_offsets[i+1]]
+            node_inflow = np.zeros(num_steps - 1)
+            for j in upstream:
+                node_inflow = node_inflow + results['flow'][:-1, j]
+            #End for
+            if external_inflow is not None:
+                node_inflow = node_inflow + external_inflow[1:, i]
+            #End if
+        #End with
+
+        if i in positions['routing']:
+            with self.Profiler.section('Routing.calcFlowBatch', items=num_steps - 1):
+                k = positions['routing'][i]
+                outflow, results['storage'][1:, i] = self.Routing.calcFlowBatch((evap, rain), node_inflow, irrig_ext, flow, base_flow, 
+                                                                                deep_drainage, self.routing_volume[k], params['routing'][:, k])
+                flow[:] = flow + outflow
+            #End with
+        else:
+            with self.Profiler.section('Dam.calcFlowBatch', items=num_steps - 1):
+                k = positions['dam'][i]
+                outflow, results['storage'][1:, i] = self.Dam.calcFlowBatch((evap, rain), node_inflow, irrig_ext, base_flow, deep_drainage, 
+                                                                            self.dam_volume[k], params['dam'][:, k])
+                flow[:] = flow + outflow
+            #End with
+        #End if
+
+        a, b, h0 = self.rating_params[:, positions['level'][i]]
+        results['level'][1:, i] = a*np.power(flow, b)+h0
+
+    #End _sweepNode()
+
+    def _nodeKey(self, i, run_key, results, params, positions, node_keys, external_inflow=None):
+
+        """
+        Fingerprint of everything the series of node i depends on, for use with a NodeCache.
+        Upstream nodes are included through their own keys, which must already be in node_keys.
+        """
+
+        network = self.NodeNetwork
+
+        parts = [run_key, network.node_ids[i], self.forcing_pos[i]]
+        parts.extend(results[var][0, i] for var in ResultsStore.variables)
+
+        if i in positions['ihacres']:
+            parts.extend(['ihacres', params['ihacres'][positions['ihacres'][i]]])
+        #End if
+
+        if i in positions['routing']:
+            k = positions['routing'][i]
+            parts.extend(['routing', params['routing'][:, k], self.routing_volume[k]])
+        #End if
+
+        if i in positions['dam']:
+            k = positions['dam'][i]
+            parts.extend(['dam', params['dam'][:, k], self.dam_volume[k]])
+        #End if
+
+        if i in positions['level']:
+            parts.extend(['level', self.rating_params[:, positions['level'][i]]])
+        #End if
+
+        upstream = network.upstream_nodes[network.upstream_offsets[i]:network.upstream_offsets[i+1]]
+        parts.extend(node_keys[j] for j in upstream)
+
+        if external_inflow is not None:
+            parts.append(external_inflow[1:, i])
+        #End if
+
+        return NodeCache.makeKey(*parts)
+
+    #End _nodeKey()
+
+    def calcNetworkState(self, prev, this_time, params=None, external_inflow=None):
+
+        """
+        Advance the state of all nodes by one timestep with the vectorized engine.
+
+        Nodes are along the last axis of the state arrays. Any leading axes (e.g. ensemble members) are carried through,
+        with parameters broadcast against them.
+
+        :param prev: Dict of arrays of node state (deficit, RRstorage, flow, level, storage) for the last timestep, in topological order
+        :param this_time: current timestep as string
+        :param params: (optional) Dict of node parameters as given by packNodeParams(). Defaults to the model parameters
+        :param external_inflow: (optional) array of inflows into each node from outside the network (e.g. other sub-catchments)
+        :returns: Dict of arrays of node state for this timestep
+        """
+
+        params = self.node_params if params is None else params
+
+        climate = self.Forcing.getTimestep(self.Forcing.getTimeIndex(this_time))[self.forcing_pos]
+        evap, rain = climate[:, self.forcing_vars].T
+
+        deficit = prev['deficit'].copy()
+        RRstorage = prev['RRstorage'].copy()
+        flow = np.zeros(prev['flow'].shape)
+        level = prev['level'].copy()
+        storage = prev['storage'].copy()
+
+        irrig_ext=0; base_flow=0.0; deep_drainage=0
+
+        #IHACRES for ihacres, routing and end nodes
+        idx = self.ihacres_idx
+        with self.Profiler.section('IHACRES.calcCMDBatch', items=len(idx)):
+            deficit[..., idx], flow[..., idx], RRstorage[..., idx] = self.IHACRES.calcCMDBatch(prev['deficit'][..., idx], prev['RRstorage'][..., idx], 
+                                                                                              rain[idx], evap[idx], params['ihacres'])
+        #End with
+
+        #Inflows from upstream nodes in the last timestep
+        with self.Profiler.section('NodeNetwork.calcInflow', items=self.NodeNetwork.num_nodes):
+            node_inflow = self.NodeNetwork.calcInflow(prev['flow'])
+            if external_inflow is not None:
+                node_inflow = node_inflow + external_inflow
+            #End if
+        #End with
+
+        idx = self.routing_idx
+        with self.Profiler.section('Routing.calcFlowBatch', items=len(idx)):
+            outflow, storage[..., idx] = self.Routing.calcFlowBatch((evap[idx], rain[idx]), node_inflow[..., idx], irrig_ext, flow[..., idx], base_flow, 
+                                                                   deep_drainage, self.routing_volume, params['routing'])
+            flow[..., idx] = flow[..., idx] + outflow
+        #End with
+
+        idx = self.dam_idx
+        with self.Profiler.section('Dam.calcFlowBatch', items=len(idx)):
+            outflow, storage[..., idx] = self.Dam.calcFlowBatch((evap[idx], rain[idx]), node_inflow[..., idx], irrig_ext, base_flow, deep_drainage, 
+                                                               self.dam_volume, params['dam'])
+            flow[..., idx] = flow[..., idx] + outflow
+        #End with
+
+        idx = self.level_idx
+        a, b, h0 = self.rating_params
+        level[..., idx] = a*np.power(flow[..., idx], b)+h0
+
+        return {'deficit': deficit, 'RRstorage': RRstorage, 'flow': flow, 'level': level, 'storage': storage}
+
+    #End calcNetworkState()
+
+    def runEnsemble(self, param_sets, timesteps, variables=None):
+
+        """
+        Run many parameter sets together. Node state carries an extra ensemble axis, so all members advance together each timestep
+        using the vectorized engine, sharing climate data and network traversal.
+
+        Example::
+
+            param_sets = {'wet': {'IHACRESparams': wet_params}, 'dry': {'IHACRESparams': dry_params}}
+            results = Hydro.runEnsemble(param_sets, timesteps)
+
+            results['flow']['wet'] #DataFrame of flows for each timestep and node for the 'wet' parameter set
+
+        :param param_sets: List, or Dict of member labels, of Dicts that may hold 'IHACRESparams', 'Routingparams' and 'Damparams' tables.
+                           Tables not given default to the parameters the model was created with.
+        :param timesteps: list of timesteps as strings. The first is the starting state, taken from the results template
+        :param variables: (optional) list of variables to return, defaults to all of ResultsStore.variables
+        :returns: DataFrame with timesteps as index and (variable, member, node) columns
+        """
+
+        self._ensureNetworkArrays()
+
+        if isinstance(param_sets, dict):
+            labels = list(param_sets.keys())
+            param_sets = [param_sets[label] for label in labels]
+        else:
+            labels = range(len(param_sets))
+        #End if
+
+        variables = ResultsStore.variables if variables is None else variables
+
+        members = [self.packNodeParams(**p) for p in param_sets]
+        params = {
+            'ihacres': np.stack([m['ihacres'] for m in members]),
+            'routing': np.stack([m['routing'] for m in members], axis=1),
+            'dam': np.stack([m['dam'] for m in members], axis=1)
+        }
+
+        initial = self.results_template
+        state = {var: np.tile(initial[var].values.astype(float)[self.template_pos], (len(members), 1)) for var in ResultsStore.variables}
+
+        results = np.empty((len(timesteps), len(variables), len(members), len(self.node_order)))
+        with self.Profiler.section('Hydrology.runEnsemble', items=len(members)*len(self.node_order)*(len(timesteps)-1)):
+            for t, this_time in enumerate(timesteps):
+
+                if t > 0:
+                    state = self.calcNetworkState(state, this_time, params=params)
+                #End if
+
+                for k, var in enumerate(variables):
+                    results[t, k] = state[var]
+                #End for
+            #End for
+        #End with
+
+        columns = pd.MultiIndex.from_product([variables, labels, self.node_order], names=['variable', 'member', 'node'])
+
+        return pd.DataFrame(results.reshape(len(timesteps), -1), index=timesteps, columns=columns)
+
+    #End runEnsemble()
+
+    def calcFlow(self, node, df, this_time, timestep_climate, node_inflows=None):
+
+            """
+            Calculate flow for a single node (a row of the results from the last timestep).
+            Levels of routing and dam nodes are not updated here; run() sets them for all nodes at once with calcLevels()
+
+            :param node: Pandas Series of last timestep's results for this node
+            :param df: DataFrame of last timestep's results for all nodes
+            :param this_time: current timestep as string
+            :param timestep_climate: (node, variable) array of evaporation and rainfall for this timestep, as given by the ForcingCube
+            :param node_inflows: (optional) Dict of inflow into each node. Calculated from df if not given.
+            """
+
+            #Looking up the node type costs more than a disabled section, so only do it when profiling
+            if not self.Profiler.enabled:
+                return self._calcNodeFlow(node, df, this_time, timestep_climate, node_inflows)
+            #End if
+
+            with self.Profiler.section('Hydrology.calcFlow', node['calc_type']):
+                return self._calcNodeFlow(node, df, this_time, timestep_climate, node_inflows)
+            #End with
+
+    #End calcFlow()
+
+    def _calcNodeFlow(self, node, df, this_time, timestep_climate, node_inflows=None):
 
             # if time.strptime(this_time, "%d/%m/%Y") == time.strptime("04/09/1900", "%d/%m/%Y"):
 
@@ -129,62 +930,52 @@ class Hydrology(object):
 
             #     import sys; sys.exit()
 
-            prep_time = time.time()
-
             #get the previous values for this node
             prev_RRstorage, calc_type, prev_CMD, flow, level, node_id, prev_storage, to_node = node
 
-            timestep_climate = timestep_climate[node_id].loc[this_time].values
+            timestep_climate = timestep_climate[self.Forcing.node_pos[node_id]]
 
-            self.prep_time += time.time() - prep_time
-
-            ct = time.time()
             node['flow']=0.0
             node_inflow=0.0
 
             if (calc_type == 'ihacres') or (calc_type == 'routing') or (calc_type == 'end'):
 
                 # print "Calling IHACRES"
-                ih = time.time()
-
-                #node['deficit'], node['flow'], node['RRstorage'] = self.IHACRES.calcCMD(node_id, timestep_climate, prev_CMD, prev_RRstorage, self.IHACRESparams)
-                node['deficit'], flow, node['RRstorage'] = self.IHACRES.calcCMD(node_id, timestep_climate, prev_CMD, prev_RRstorage)
-                node['flow'] = node['flow'] + flow
-
-                self.ih += time.time() - ih
+                with self.Profiler.section('IHACRES.calcCMD', calc_type):
+                    #node['deficit'], node['flow'], node['RRstorage'] = self.IHACRES.calcCMD(node_id, timestep_climate, prev_CMD, prev_RRstorage, self.IHACRESparams)
+                    node['deficit'], flow, node['RRstorage'] = self.IHACRES.calcCMD(node_id, timestep_climate, prev_CMD, prev_RRstorage)
+                    node['flow'] = node['flow'] + flow
+                #End with
             #End common check
 
             if (calc_type == 'ihacres') or (calc_type == 'end'):
                 
                 # print(node['node_id'],node['flow'],node['storage'],node['RRstorage'],node['deficit'])
-                self.calc_time += time.time() - ct
                 return node
 
             else:
 
-                inflow_time = time.time()
-                node_inflow = df.loc[df['to_node'] == node_id, 'flow'].sum()
+                if node_inflows is not None:
+                    node_inflow = node_inflows[node_id]
+                else:
+                    with self.Profiler.section('NodeNetwork.getUpstream', calc_type):
+                        node_inflow = df.loc[df['node_id'].isin(self.NodeNetwork.getUpstream(node_id)), 'flow'].sum()
+                    #End with
+                #End if
 
                 irrig_ext=0; base_flow=0.0; deep_drainage=0; storage_coef=0.5; ET_f=0.8*10*0.01
 
-                self.inflow_time = time.time() - inflow_time
-
                 if calc_type == 'routing':
 
                     # run Routing module
-                    rt = time.time()
-                    
-                    #timing routing prep
-                    route_prep = time.time()
-
-                    b_id, n_id, storage_coef, ET_f, area = self.Routingparams.loc[self.Routingparams.index == node_id].iloc[0]
-                    route_params = [storage_coef, ET_f, area]
+                    #storage_coef, ET_f, area
+                    route_params = self.routing_table[self.template_row[node_id]]
 
                     local_inflow = flow
 
-                    self.route_i += time.time() - route_prep
-
-                    flow, node['storage'] = self.Routing.calcFlow(node_id, timestep_climate, node_inflow, irrig_ext, local_inflow, base_flow, deep_drainage, route_params)
+                    with self.Profiler.section('Routing.calcFlow', calc_type):
+                        flow, node['storage'] = self.Routing.calcFlow(node_id, timestep_climate, node_inflow, irrig_ext, local_inflow, base_flow, deep_drainage, route_params)
+                    #End with
 
                     # if time.strptime(this_time, "%d/%m/%Y") == time.strptime("01/09/1900", "%d/%m/%Y"):
                     #     print flow
@@ -193,21 +984,17 @@ class Hydrology(object):
 
                     # node['flow'] = node['flow'] + flow
 
-                    self.route += time.time() - rt
-
                 elif calc_type == 'dam':
 
-                    dt = time.time()
-
-                    g_id, n_id, storage_coef, area, max_storage = self.Damparams.loc[self.Damparams.index == node_id].iloc[0]
-                    dam_params = [storage_coef, area, max_storage]
+                    #storage_coef, area, max_storage
+                    dam_params = self.dam_table[self.template_row[node_id]]
                     
-                    flow, node['storage'] = self.Dam.calcFlow(node_id, timestep_climate, node_inflow, irrig_ext, base_flow, deep_drainage, dam_params)
+                    with self.Profiler.section('Dam.calcFlow', calc_type):
+                        flow, node['storage'] = self.Dam.calcFlow(node_id, timestep_climate, node_inflow, irrig_ext, base_flow, deep_drainage, dam_params)
+                    #End with
 
                     # node['flow'] = node['flow'] + flow
 
-                    self.dam += time.time() - dt
-
                 else:
                     print "No method defined"
                     import sys
@@ -218,20 +1005,15 @@ class Hydrology(object):
 
             node['flow'] = node['flow']+flow
 
-            #Grab vars to calculate level with
-            g_id, n_id, to_node, calc_type, a, b, h0 = self.network.loc[self.network.index == node_id].iloc[0]
-
-            # a=1/1000.; b=1.7; h0=100.
-            node['level'] = a*np.power(node['flow'],b)+h0
             # print(level)
             # node['storage'] = level
 
             # print(node['node_id'],node['flow'],node['storage'],node['RRstorage'],node['deficit'])
 
-            self.calc_time += time.time() - ct
-
             return node
 
+    #End _calcNodeFlow()
+
     def overflow(self):
             pass
 
@@ -6,10 +6,12 @@ from integrated.Modules.Core.Handlers.FileHandler import FileHandler
 import pandas as pd
 import numpy as np
 
-import time
-
 
 class IHACRES(Component):
+
+    #Parameters used in calculations, in the order they appear in the parameter table
+    param_names = ['d1', 'd2', 'e', 'f', 'alpha', 'area', 'a']
+
     def __init__(self, Climate, water_deficit, params):
         """
         comment
@@ -21,11 +23,6 @@ class IHACRES(Component):
 
         #Reset index to node numbers
         self.params.index = self.params["node"]
-
-        self.prep_time = 0.0
-        self.calc_time = 0.0
-        self.get_climate = 0.0
-        self.get_params = 0.0
     #End init()
 
     def calcCMD(self, node_id, climate, CMD_old, Sflow_old): 
@@ -40,24 +37,27 @@ class IHACRES(Component):
 
         """
 
-        prep_start = time.time()
-
-        climate_vars = time.time()
         evap, rain = climate
         #print(node_id,evap,rain)
-        self.get_climate += time.time() - climate_vars
 
-        get_params = time.time()
         #Turns out in this context its much quicker to grab all the values and throw away the ones we don't need
         # i, n, d1, d2, e, f, alpha, area, a = self.params.loc[self.params["node"] == node_id].iloc[0]
         i, n, d1, d2, e, f, alpha, area, a = self.params.loc[node_id]
         #	print(node_id,area,rain,evap,CMD_old,Sflow_old)
 
-        self.get_params += time.time() - get_params
+        CMD_new, flow, Sflow = self._calcCMDStep(CMD_old, Sflow_old, rain, evap, d1, d2, e, f, alpha, area, a)
+
+        return CMD_new,flow,Sflow
 
-        self.prep_time += time.time() - prep_start
+ #End calcCMD()
 
-        calc_time = time.time()
+    def _calcCMDStep(self, CMD_old, Sflow_old, rain, evap, d1, d2, e, f, alpha, area, a):
+
+        """
+        Single timestep calculation for calcCMD() with parameters already extracted
+
+        :returns: tuple of CMD_new, flow, Sflow
+        """
 
         cmd2 = CMD_old
         if cmd2 > d2+rain:
@@ -111,11 +111,137 @@ class IHACRES(Component):
             flow=0
         #End if
 
-        self.calc_time += time.time() - calc_time
-
         return CMD_new,flow,Sflow
 
- #End calcCMD()
+    #End _calcCMDStep()
+
+    def calcCMDSeries(self, CMD_old, Sflow_old, rain, evap, params):
+
+        """
+        Run a single node over a series of timesteps.
+
+        :param CMD_old: catchment moisture deficit before the first timestep
+        :param Sflow_old: storage flow before the first timestep
+        :param rain: array of rainfall for each timestep
+        :param evap: array of evaporation for each timestep
+        :param params: parameter record for the node, an element of the array given by packParams()
+        :returns: tuple of arrays (CMD_new, flow, Sflow), one element per timestep
+        """
+
+        d1, d2, e, f, alpha, area, a = [params[name] for name in self.param_names]
+
+        num_steps = len(rain)
+        CMD_new = np.empty(num_steps)
+        flow = np.empty(num_steps)
+        Sflow = np.empty(num_steps)
+
+        for t in xrange(num_steps):
+            CMD_old, flow[t], Sflow_old = self._calcCMDStep(CMD_old, Sflow_old, rain[t], evap[t], d1, d2, e, f, alpha, area, a)
+            CMD_new[t] = CMD_old
+            Sflow[t] = Sflow_old
+        #End for
+
+        return CMD_new, flow, Sflow
+
+    #End calcCMDSeries()
+
+    def packParams(self, node_ids=None, params=None):
+
+        """
+        Pack the parameter table into a NumPy structured array for use with calcCMDBatch().
+
+        :param node_ids: list of node ids giving the order of the packed rows. Defaults to all nodes in the parameter table
+        :param params: (optional) parameter table to pack, in the same layout as the IHACRES parameters. Defaults to this object's parameters
+        :returns: structured array with a 'node' field and one float field for each parameter
+        """
+
+        if params is None:
+            params = self.params
+        #End if
+
+        if node_ids is None:
+            node_ids = params["node"].values
+        #End if
+
+        pos = pd.Index(params["node"].values).get_indexer(node_ids)
+        if (pos == -1).any():
+            raise KeyError("No IHACRES parameters for node(s) {n}".format(n=list(np.asarray(node_ids)[pos == -1])))
+        #End if
+
+        packed = np.empty(len(pos), dtype=[('node', 'i8')] + [(name, 'f8') for name in self.param_names])
+        packed['node'] = np.asarray(node_ids)
+        for name in self.param_names:
+            packed[name] = params[name].values[pos]
+        #End for
+
+        return packed
+
+    #End packParams()
+
+    def calcCMDBatch(self, CMD_old, Sflow_old, rain, evap, params):
+
+        """
+        Array version of calcCMD() that advances many nodes in one call.
+
+        The nested branches in calcCMD() are replaced by masks; each branch is evaluated for every node and
+        the applicable result kept. Values calculated for nodes that fall into another branch (e.g. the log of a negative number)
+        are discarded, so floating point warnings are suppressed here.
+
+        :param CMD_old: array of catchment moisture deficits, one element per node
+        :param Sflow_old: array of previous storage flows
+        :param rain: array of rainfall
+        :param evap: array of evaporation
+        :param params: structured array of parameters for the same nodes, as given by packParams().
+                       May have leading dimensions (e.g. ensemble members) that broadcast against the other arguments
+        :returns: tuple of arrays (CMD_new, flow, Sflow)
+        """
+
+        d1, d2, e, f, alpha, area, a = [params[name] for name in self.param_names]
+
+        with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+
+            cmd2 = CMD_old
+            dry = cmd2 > d2+rain
+
+            over = cmd2 > d2
+            rain2 = np.where(over, rain-(cmd2-d2), rain)
+            cmd2 = np.where(over, d2, cmd2)
+
+            epsilonn = d2/(1.0-alpha)
+            rain3 = epsilonn * np.log((alpha+cmd2/epsilonn)/(alpha+d1/epsilonn))
+            below = rain3 >= rain2
+
+            #rain3 >= rain2
+            lamda = np.exp(rain2*(1.0-alpha)/d2)
+            epsilon = alpha*epsilonn
+            cmd_below = cmd2/lamda-epsilon*(1.0-1.0/lamda)
+
+            #rain3 < rain2
+            rain2 = np.where(cmd2 > d1, rain2-rain3, rain2)
+            cmd2 = np.where(rain2 > rain, d1, cmd2)
+            gamma = (alpha*d2+(1-alpha)*d1)/(d1*d2)
+            cmd_above = cmd2*np.exp(-rain2*gamma)
+            u_above = alpha*(rain2+1.0/d1/gamma*(cmd_above-cmd2))
+
+            cmd = np.where(dry, CMD_old-rain, np.where(below, cmd_below, cmd_above))
+            u = np.where(dry | below, 0.0, u_above)
+            r = np.where(dry, 0.0, rain-(CMD_old-cmd)-u)
+
+            et = np.where(cmd > f, e*evap*np.exp( (1-cmd/f)*2 ), e*evap)
+            et = np.where(et < 0, 0.0, et)
+
+            CMD_new = CMD_old + et + u + r - rain
+
+            loss = 0
+            tmp_flow = Sflow_old+u*area-loss
+            Sflow = np.where(tmp_flow > 0, 1/(1+a)*tmp_flow, tmp_flow)
+            flow = np.where(tmp_flow > 0, a*Sflow, 0.0)
+
+        #End with
+
+        return CMD_new, flow, Sflow
+
+    #End calcCMDBatch()
 
     def useUnitHydrograph(self):
 
@@ -0,0 +1,143 @@
+from collections import OrderedDict
+import hashlib
+
+import numpy as np
+
+
+class NodeCache(object):
+
+    """
+    Cache of each node's full output series, for re-running a network after a change to some of its nodes.
+
+    Entries are keyed by a fingerprint of everything a node's series depends on: its own parameters, initial state,
+    climate forcing and the timesteps run, and the fingerprints of the nodes flowing into it. Changing a node therefore
+    changes its key and the keys of every node downstream of it, while nodes upstream of or beside it keep theirs.
+
+    Keys are only meaningful for the model (and climate forcing) that made them. Least recently used entries are dropped
+    once max_entries is reached.
+
+    Example::
+
+        Cache = NodeCache()
+        for params in calibration_sets:
+            results = Hydro.runIncremental(timesteps, IHACRESparams=params, cache=Cache)
+
+        print Cache.getStats()
+
+    """
+
+    def __init__(self, max_entries=None):
+
+        """
+        :param max_entries: (optional) largest number of node series to keep. Unbounded if None
+        """
+
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.clear()
+
+    #End init()
+
+    def clear(self):
+
+        """
+        Remove all entries and reset statistics
+        """
+
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.node_steps_computed = 0
+        self.node_steps_reused = 0
+
+    #End clear()
+
+    @staticmethod
+    def makeKey(*parts):
+
+        """
+        Fingerprint a node from the given parts. Arrays are hashed by value, upstream keys and other values by their representation.
+
+        :returns: key as string
+        """
+
+        h = hashlib.sha1()
+        for part in parts:
+            if isinstance(part, (np.ndarray, np.generic)):
+                h.update(np.ascontiguousarray(part).tobytes())
+            else:
+                h.update(repr(part))
+            #End if
+        #End for
+
+        return h.digest()
+
+    #End makeKey()
+
+    def get(self, key, num_steps=0):
+
+        """
+        :param key: node key as given by makeKey()
+        :param num_steps: number of timesteps in the series, counted towards node_steps_reused on a hit
+        :returns: Dict of variable name and array of values, or None if not cached
+        """
+
+        try:
+            series = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        #End try
+
+        #Most recently used entries are kept at the end
+        self.entries[key] = series
+
+        self.hits += 1
+        self.node_steps_reused += num_steps
+
+        return series
+
+    #End get()
+
+    def put(self, key, series, num_steps=0):
+
+        """
+        :param key: node key as given by makeKey()
+        :param series: Dict of variable name and array of values
+        :param num_steps: number of timesteps calculated, counted towards node_steps_computed
+        """
+
+        self.entries[key] = series
+        self.node_steps_computed += num_steps
+
+        if self.max_entries is not None:
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            #End while
+        #End if
+
+    #End put()
+
+    def getStats(self):
+
+        """
+        :returns: Dict of number of entries, hits, misses, node timesteps computed and node timesteps reused from the cache
+        """
+
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'node_steps_computed': self.node_steps_computed,
+            'node_steps_reused': self.node_steps_reused
+        }
+
+    #End getStats()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+#End NodeCache
@@ -0,0 +1,151 @@
+from __future__ import division
+import pandas as pd
+import numpy as np
+
+
+class NodeNetwork(object):
+
+    """
+    Topology of a river node network.
+
+    Upstream connections are stored in compressed (CSR-style) form: the upstream nodes of the node at position i
+    are upstream_nodes[upstream_offsets[i]:upstream_offsets[i+1]]. Node positions follow topological order,
+    so every node comes after all nodes that flow into it.
+    """
+
+    def __init__(self, network):
+
+        """
+        :param network: Pandas DataFrame with 'node' and 'to node' columns. 'to node' is blank for nodes that leave the network
+        """
+
+        nodes = list(network['node'])
+        to_nodes = list(network['to node'])
+
+        self.node_ids = self.validate(nodes, to_nodes)
+        self.num_nodes = len(self.node_ids)
+
+        self.node_pos = dict((node_id, i) for i, node_id in enumerate(self.node_ids))
+
+        #Position of the downstream node for each node, -1 if it leaves the network
+        to_nodes = dict(zip(nodes, to_nodes))
+        self.to_pos = np.array([self.node_pos.get(to_nodes[node_id], -1) for node_id in self.node_ids], dtype=int)
+
+        #Group upstream nodes by the node they flow into, keeping network order within each group
+        has_downstream = np.flatnonzero(self.to_pos != -1)
+        grouped = has_downstream[np.argsort(self.to_pos[has_downstream], kind='mergesort')]
+
+        self.upstream_nodes = grouped
+        self.num_upstream = np.bincount(self.to_pos[has_downstream], minlength=self.num_nodes)
+        self.upstream_offsets = np.concatenate(([0], np.cumsum(self.num_upstream)))
+
+        #Nodes that receive inflows and where each of their segments starts
+        self.confluence_pos = np.flatnonzero(self.num_upstream > 0)
+        self.segment_starts = self.upstream_offsets[self.confluence_pos]
+
+    #End init()
+
+    def validate(self, nodes, to_nodes):
+
+        """
+        Check the network is a set of trees that drain out of the network.
+
+        Raises ValueError if node ids are repeated, a node flows into a node that is not in the network (an orphaned reference)
+        or the network contains a cycle.
+
+        :returns: list of node ids in topological order, see getTopologicalOrder()
+        """
+
+        node_set = set(nodes)
+
+        if len(node_set) != len(nodes):
+            repeated = sorted(set(node_id for node_id in nodes if nodes.count(node_id) > 1))
+            raise ValueError("Node ids appear more than once in network: {n}".format(n=repeated))
+        #End if
+
+        orphans = [node_id for node_id, to_node in zip(nodes, to_nodes) if (not pd.isnull(to_node)) and (to_node not in node_set)]
+        if len(orphans) > 0:
+            raise ValueError("Node(s) {n} flow into nodes that are not in the network".format(n=orphans))
+        #End if
+
+        #Cycles are found while ordering the network, so the order is kept rather than sorting the network again
+        return self.getTopologicalOrder(nodes, to_nodes)
+
+    #End validate()
+
+    def getTopologicalOrder(self, nodes, to_nodes):
+
+        """
+        Order nodes so that every node comes after all nodes that flow into it (headwaters first, end nodes last).
+        Nodes with no ordering between them keep the order they appear in the network table.
+
+        :param nodes: list of node ids
+        :param to_nodes: list of downstream node ids, in the same order as nodes
+        :returns: list of node ids
+        """
+
+        #Downstream ids may be stored as floats (e.g. 11.0 for node 11), so map them back to the node ids as given
+        node_lookup = dict((node_id, node_id) for node_id in nodes)
+        to_nodes = dict((node_id, node_lookup.get(to_node)) for node_id, to_node in zip(nodes, to_nodes))
+
+        num_upstream = dict((node_id, 0) for node_id in nodes)
+        for node_id in nodes:
+            if to_nodes[node_id] in num_upstream:
+                num_upstream[to_nodes[node_id]] += 1
+        #End for
+
+        order = []
+        ready = [node_id for node_id in nodes if num_upstream[node_id] == 0]
+        while len(ready) > 0:
+            node_id = ready.pop(0)
+            order.append(node_id)
+
+            to_node = to_nodes[node_id]
+            if to_node in num_upstream:
+                num_upstream[to_node] -= 1
+                if num_upstream[to_node] == 0:
+                    ready.append(to_node)
+            #End if
+        #End while
+
+        if len(order) != len(nodes):
+            in_cycle = [node_id for node_id in nodes if num_upstream[node_id] > 0]
+            raise ValueError("Node network contains a cycle through node(s) {n}".format(n=in_cycle))
+        #End if
+
+        return order
+
+    #End getTopologicalOrder()
+
+    def getUpstream(self, node_id):
+
+        """
+        :returns: list of ids of the nodes that flow directly into the given node
+        """
+
+        i = self.node_pos[node_id]
+        return [self.node_ids[j] for j in self.upstream_nodes[self.upstream_offsets[i]:self.upstream_offsets[i+1]]]
+
+    #End getUpstream()
+
+    def calcInflow(self, flow):
+
+        """
+        Sum the flows coming into each node with one segmented sum.
+
+        :param flow: array of flows, with nodes in topological order along the last axis
+        :returns: array of the same shape holding each node's inflow
+        """
+
+        flow = np.asarray(flow, dtype=float)
+        inflow = np.zeros(flow.shape)
+
+        if len(self.confluence_pos) > 0:
+            inflow[..., self.confluence_pos] = np.add.reduceat(flow[..., self.upstream_nodes], self.segment_starts, axis=-1)
+        #End if
+
+        return inflow
+
+    #End calcInflow()
+
+#End NodeNetwork
@@ -0,0 +1,270 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def stateToFrame(template, template_pos, state):
+
+    """
+    Build a results DataFrame, as found in the Hydrology results template, from arrays of node state
+
+    :param template: results template DataFrame
+    :param template_pos: position in the template of each element of the state arrays
+    :param state: Dict of variable name and array of values
+    :returns: DataFrame
+    """
+
+    results = template.copy()
+    for col, values in state.iteritems():
+        results.iloc[template_pos, results.columns.get_loc(col)] = values
+    #End for
+
+    return results
+
+#End stateToFrame()
+
+
+class ResultsStore(object):
+
+    """
+    Preallocated columnar store of hydrology results.
+
+    Each variable is held as a (time, node) block of a preallocated array. Rows are filled one timestep at a time;
+    when a chunk is full it is either kept in memory, or written to disk as a .npy file (shape (variable, time, node)) 
+    and the memory reused, so only the current chunk and the last recorded state are held.
+
+    The store can be passed to Hydrology.run() in place of the Dict of DataFrames. Indexing it with a timestep 
+    gives the same DataFrame as found in the Dict.
+
+    Example::
+
+        results = Hydro.createResultsStore(chunk_size=365, spill_path='results')
+
+        for this_time, last_time in timesteps:
+            results = Hydro.run(this_time, last_time, data=results)
+
+        flow_df = results.getVariable('flow')
+        day_df = results['02/09/2005']
+
+    """
+
+    variables = ['deficit', 'RRstorage', 'flow', 'level', 'storage']
+
+    def __init__(self, node_ids, template, chunk_size=365, spill_path=None):
+
+        """
+        :param node_ids: list of node ids, giving the order of nodes in the stored arrays
+        :param template: results template DataFrame used to build per-timestep DataFrames
+        :param chunk_size: number of timesteps to preallocate at a time
+        :param spill_path: (optional) folder to write full chunks to. Chunks are kept in memory if None
+        """
+
+        self.node_ids = list(node_ids)
+        self.template = template
+        self.template_pos = pd.Index(template['node_id'].values).get_indexer(self.node_ids)
+        self.chunk_size = chunk_size
+        self.spill_path = spill_path
+
+        if spill_path is not None and not os.path.isdir(spill_path):
+            os.makedirs(spill_path)
+        #End if
+
+        self.dates = []
+        self.date_pos = {}
+
+        #Finished chunks as list of [first timestep position, array or file path]
+        self.chunks = []
+
+        self.buffer = self._allocate()
+        self.buffer_start = 0
+        self.last_state = None
+
+    #End init()
+
+    def _allocate(self):
+        return np.empty((len(self.variables), self.chunk_size, len(self.node_ids)))
+    #End _allocate()
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __contains__(self, date):
+        return date in self.date_pos
+
+    def __getitem__(self, date):
+        return self.getTimestep(date)
+
+    def keys(self):
+        return list(self.dates)
+
+    def record(self, date, state):
+
+        """
+        Store the state of all nodes for a timestep
+
+        :param date: timestep label
+        :param state: Dict of variable name and array of values, in node_ids order
+        """
+
+        if date in self.date_pos:
+            raise ValueError("Results for {d} have already been recorded".format(d=date))
+        #End if
+
+        row = len(self.dates) - self.buffer_start
+        if row == self.chunk_size:
+            self._finishChunk()
+            row = 0
+        #End if
+
+        for k, var in enumerate(self.variables):
+            self.buffer[k, row] = state[var]
+        #End for
+
+        self.date_pos[date] = len(self.dates)
+        self.dates.append(date)
+
+        self.last_state = {var: self.buffer[k, row] for k, var in enumerate(self.variables)}
+
+    #End record()
+
+    def recordSeries(self, dates, series):
+
+        """
+        Store the state of all nodes for a series of timesteps
+
+        :param dates: list of timestep labels
+        :param series: Dict of variable name and (time, node) array of values, nodes in node_ids order
+        """
+
+        for t, date in enumerate(dates):
+            self.record(date, {var: series[var][t] for var in self.variables})
+        #End for
+
+    #End recordSeries()
+
+    def recordFrame(self, date, frame):
+
+        """
+        Store the results of a timestep given as a DataFrame, as found in the results template
+        """
+
+        pos = pd.Index(frame['node_id'].values).get_indexer(self.node_ids)
+        self.record(date, {var: frame[var].values.astype(float)[pos] for var in self.variables})
+
+    #End recordFrame()
+
+    def _finishChunk(self):
+
+        """
+        Move the full buffer into the list of finished chunks, writing it to disk if a spill path was given
+        """
+
+        if self.spill_path is not None:
+            fname = os.path.join(self.spill_path, 'chunk_{n:05d}.npy'.format(n=len(self.chunks)))
+            np.save(fname, self.buffer)
+            self.chunks.append([self.buffer_start, fname])
+
+            #Keep last state, which lives in the buffer about to be reused
+            self.last_state = {var: values.copy() for var, values in self.last_state.iteritems()}
+        else:
+            self.chunks.append([self.buffer_start, self.buffer])
+            self.buffer = self._allocate()
+        #End if
+
+        self.buffer_start += self.chunk_size
+
+    #End _finishChunk()
+
+    def flush(self):
+
+        """
+        Write the partly filled buffer to disk, so all recorded results can be read from the spill path.
+        Recording can continue afterwards.
+        """
+
+        if self.spill_path is None:
+            return
+        #End if
+
+        num_rows = len(self.dates) - self.buffer_start
+        fname = os.path.join(self.spill_path, 'chunk_{n:05d}.npy'.format(n=len(self.chunks)))
+        np.save(fname, self.buffer[:, :num_rows])
+
+    #End flush()
+
+    def _getChunk(self, i):
+
+        """
+        :returns: (variable, time, node) array of the given finished chunk
+        """
+
+        data = self.chunks[i][1]
+        if not isinstance(data, np.ndarray):
+            data = np.load(data, mmap_mode='r')
+        #End if
+
+        return data
+
+    #End _getChunk()
+
+    def _locate(self, date):
+
+        """
+        :returns: (variable, time, node) array holding the given timestep, and the row of the timestep within it
+        """
+
+        t = self.date_pos[date]
+
+        if t >= self.buffer_start:
+            return self.buffer, t - self.buffer_start
+        #End if
+
+        i = t // self.chunk_size
+        return self._getChunk(i), t - self.chunks[i][0]
+
+    #End _locate()
+
+    def getState(self, date=None):
+
+        """
+        :param date: timestep label. Defaults to the last recorded timestep
+        :returns: Dict of variable name and array of values for all nodes, in node_ids order
+        """
+
+        if (date is None) or (date == self.dates[-1]):
+            return self.last_state
+        #End if
+
+        data, row = self._locate(date)
+        return {var: np.array(data[k, row]) for k, var in enumerate(self.variables)}
+
+    #End getState()
+
+    def getTimestep(self, date):
+
+        """
+        :returns: DataFrame of results for the given timestep, as found in the results template
+        """
+
+        return stateToFrame(self.template, self.template_pos, self.getState(date))
+
+    #End getTimestep()
+
+    def getVariable(self, var):
+
+        """
+        :param var: name of variable, one of ResultsStore.variables
+        :returns: DataFrame of values with timesteps as index and node ids as columns
+        """
+
+        k = self.variables.index(var)
+
+        values = [self._getChunk(i)[k] for i in xrange(len(self.chunks))]
+        values.append(self.buffer[k, :len(self.dates) - self.buffer_start])
+
+        return pd.DataFrame(np.concatenate(values), index=self.dates, columns=self.node_ids)
+
+    #End getVariable()
+
+#End ResultsStore
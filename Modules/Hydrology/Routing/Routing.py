@@ -2,8 +2,6 @@ from __future__ import division
 import pandas as pd
 import numpy as np
 
-import time
-
 from integrated.Modules.Core.IntegratedModelComponent import Component
 from integrated.Modules.Core.Handlers.FileHandler import FileHandler
 
@@ -17,8 +15,6 @@ class Routing(Component):
         self.Climate = Climate 
         self.water_volume = water_volume
         self.water_volume.index = water_volume["node"]
-
-        self.runtime = 0.0
     #End init()
 
     # def run(self):
@@ -37,8 +33,6 @@ class Routing(Component):
 
         """
 
-        t = time.time()
-
         evap, rain = climate
 
         Gamma_k = base_flow - deep_drainage #These could come from external module
@@ -70,8 +64,35 @@ class Routing(Component):
         #     water_volume = tmp
         #     outflow=0.0
 
-        self.runtime += time.time() - t
-
         return outflow, water_volume
 
     #End calcFlow()
+
+    def calcFlowBatch(self, climate, node_inflow, irrig_ext, local_inflow, base_flow, deep_drainage, water_volume, Routingparams):
+
+        """
+        Array version of calcFlow() for many nodes at once.
+
+        :param climate: tuple of arrays (evap, rain), one element per node
+        :param water_volume: array of water volumes for each node, as found in the water volume table
+        :param Routingparams: list of arrays [storage_coef, ET_f, area]
+        :returns: tuple of arrays (outflow, water_volume)
+
+        """
+
+        evap, rain = climate
+
+        Gamma_k = base_flow - deep_drainage
+
+        #As in calcFlow()
+        # storage_coef, ET_f, area = Routingparams
+        storage_coef=0.1; ET_f=1.2; area=0.1;
+
+        tmp_vol = water_volume + (node_inflow + local_inflow + Gamma_k) + (rain - evap*ET_f)*area - irrig_ext
+
+        water_volume = np.where(tmp_vol > 0, 1/(1+storage_coef) * tmp_vol, tmp_vol)
+        outflow = np.where(tmp_vol > 0, storage_coef*water_volume, 0.0)
+
+        return outflow, water_volume
+
+    #End calcFlowBatch()
@@ -0,0 +1,194 @@
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+from integrated.Modules.Hydrology.ResultsStore.ResultsStore import ResultsStore
+
+#Model data held by each worker process, set by _initWorker()
+_worker_data = {}
+
+
+def _initWorker(combined_data, forcing, timesteps, engine):
+
+    """
+    Store the model data once per worker process instead of sending it with every task
+    """
+
+    _worker_data['combined_data'] = combined_data
+    _worker_data['forcing'] = forcing
+    _worker_data['timesteps'] = timesteps
+    _worker_data['engine'] = engine
+
+#End _initWorker()
+
+
+def _runSubcatchment(task):
+
+    """
+    Run the nodes of one sub-catchment over the whole simulation horizon.
+
+    :param task: tuple of (list of node ids, (time, node) array of inflows from upstream sub-catchments)
+    :returns: Dict of variable name and (time, node) array of results, nodes in the order given
+    """
+
+    #Imported here to avoid a circular import with Hydrology
+    from integrated.Modules.Hydrology.Hydrology import Hydrology
+
+    node_ids, external_inflow = task
+
+    combined_data = dict(_worker_data['combined_data'])
+
+    #Nodes that flow out of the sub-catchment leave its network
+    network = combined_data['network']
+    network = network[network['node'].isin(node_ids)].copy()
+    network.loc[~network['to node'].isin(node_ids), 'to node'] = np.nan
+    combined_data['network'] = network
+
+    Hydro = Hydrology(combined_data, engine=_worker_data['engine'], forcing=_worker_data['forcing'])
+
+    #Align inflows with the sub-catchment's own node ordering
+    pos = pd.Index(node_ids).get_indexer(Hydro.node_order)
+    store = Hydro.runHorizon(_worker_data['timesteps'], external_inflow=external_inflow[:, pos])
+
+    order = pd.Index(Hydro.node_order).get_indexer(node_ids)
+
+    return {var: store.getVariable(var).values[:, order] for var in ResultsStore.variables}
+
+#End _runSubcatchment()
+
+
+class SubcatchmentScheduler(object):
+
+    """
+    Runs a node network as independent sub-catchments in parallel worker processes.
+
+    The network is split into chains of nodes starting at each headwater and each confluence. A chain only depends on the chains
+    that flow into its first node, so chains are grouped into levels: every chain in a level can run over the whole simulation horizon
+    at the same time as the others, using the outflows of chains in earlier levels as inflows.
+
+    Example::
+
+        Hydro = Hydrology(data, forcing=ForcingCube.fromNodeClimate(..., filename='forcing.npy'))
+        results = SubcatchmentScheduler(Hydro, processes=4).run(timesteps)
+
+        results['flow'] #DataFrame of flows for each timestep and node
+
+    Giving Hydrology a memory-mapped ForcingCube means climate data are mapped by each worker rather than copied to it.
+    """
+
+    def __init__(self, Hydrology, processes=None):
+
+        """
+        :param Hydrology: Hydrology object to run
+        :param processes: number of worker processes, defaults to the number of CPUs. Runs in this process if 1
+        """
+
+        self.Hydrology = Hydrology
+        self.processes = multiprocessing.cpu_count() if processes is None else processes
+
+        self.subcatchments, self.levels = self.splitSubcatchments()
+
+    #End init()
+
+    def splitSubcatchments(self):
+
+        """
+        Split the network into chains of nodes. A new chain starts at each node that does not have exactly one node flowing into it.
+
+        :returns: tuple of (list of chains, each a list of node ids from upstream to downstream,
+                            list of levels, each a list of positions in the list of chains)
+        """
+
+        network = self.Hydrology.NodeNetwork
+
+        chain_of = {}
+        chains = []
+        for node_id in network.node_ids:
+            upstream = network.getUpstream(node_id)
+            if len(upstream) == 1:
+                chain = chain_of[upstream[0]]
+                chains[chain].append(node_id)
+            else:
+                chain = len(chains)
+                chains.append([node_id])
+            #End if
+
+            chain_of[node_id] = chain
+        #End for
+
+        #Chains are found in topological order, so a chain's upstream chains already have a level
+        chain_level = []
+        for chain in chains:
+            upstream = network.getUpstream(chain[0])
+            chain_level.append(1 + max([chain_level[chain_of[node_id]] for node_id in upstream]) if len(upstream) > 0 else 0)
+        #End for
+
+        levels = [[i for i, level in enumerate(chain_level) if level == l] for l in xrange(max(chain_level) + 1)]
+
+        return chains, levels
+
+    #End splitSubcatchments()
+
+    def run(self, timesteps):
+
+        """
+        Run the network over the given timesteps.
+
+        :param timesteps: list of timesteps as strings. The first is the starting state, taken from the results template
+        :returns: Dict of variable name and DataFrame of results with timesteps as index and node ids as columns
+        """
+
+        Hydro = self.Hydrology
+        network = Hydro.NodeNetwork
+
+        combined_data = dict(Hydro.Data, climate=None)
+
+        #Sub-catchments are run over the whole horizon, node by node if the model uses the 'sweep' engine
+        engine = 'sweep' if Hydro.engine == 'sweep' else 'vectorized'
+
+        results = {var: np.zeros((len(timesteps), network.num_nodes)) for var in ResultsStore.variables}
+
+        if self.processes > 1:
+            pool = multiprocessing.Pool(self.processes, initializer=_initWorker, initargs=(combined_data, Hydro.Forcing, timesteps, engine))
+            map_func = pool.map
+        else:
+            _initWorker(combined_data, Hydro.Forcing, timesteps, engine)
+            map_func = map
+        #End if
+
+        try:
+            for level in self.levels:
+
+                tasks = []
+                for i in level:
+                    chain = self.subcatchments[i]
+
+                    #Flows into the first node from upstream chains, lagged by a timestep as in Hydrology.calcNetworkState()
+                    external_inflow = np.zeros((len(timesteps), len(chain)))
+                    for node_id in network.getUpstream(chain[0]):
+                        external_inflow[1:, 0] += results['flow'][:-1, network.node_pos[node_id]]
+                    #End for
+
+                    tasks.append((chain, external_inflow))
+                #End for
+
+                for i, chain_results in zip(level, map_func(_runSubcatchment, tasks)):
+                    pos = [network.node_pos[node_id] for node_id in self.subcatchments[i]]
+                    for var, values in chain_results.iteritems():
+                        results[var][:, pos] = values
+                    #End for
+                #End for
+            #End for
+        finally:
+            if self.processes > 1:
+                pool.close()
+                pool.join()
+            #End if
+        #End try
+
+        return {var: pd.DataFrame(values, index=timesteps, columns=network.node_ids) for var, values in results.iteritems()}
+
+    #End run()
+
+#End SubcatchmentScheduler
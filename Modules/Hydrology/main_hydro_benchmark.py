@@ -0,0 +1,21 @@
+#main_hydro_benchmark.py
+
+if __name__ == '__main__':
+
+    from integrated.Modules.Hydrology.Benchmark.Benchmark import Benchmark, compareResults
+
+    #Results from each run are appended, labelled with the current git commit
+    results_file = "hydrology_benchmark.csv"
+
+    Bench = Benchmark(node_counts=[10, 100, 1000, 10000], num_steps=[365], engines=['row', 'vectorized', 'sweep'])
+    results = Bench.run(results_file)
+
+    print results[['engine', 'mix', 'num_nodes', 'num_steps', 'step_time', 'node_step_time', 'peak_memory_mb']]
+
+    #Compare with the earliest version benchmarked
+    all_results = Benchmark.load(results_file)
+    baseline = all_results['label'].iloc[0]
+    if baseline != Bench.label:
+        print compareResults(all_results, baseline, Bench.label)
+    #End if
+
@@ -7,6 +7,7 @@ if __name__ == '__main__':
 
     from integrated.Modules.Core.Handlers.FileHandler import FileHandler
     from Hydrology import Hydrology
+    from integrated.Modules.Core.Profiler import profiler
 
     import datetime
 
@@ -29,6 +30,9 @@ if __name__ == '__main__':
         #End try
     #End for
 
+    #Record time spent in each model component
+    profiler.enable()
+
     #Create a Hydrology Object
     Hydro = Hydrology(data)
 
@@ -63,19 +67,9 @@ if __name__ == '__main__':
 
     print "Total script time: {st}".format(st=time.time() - s)
 
-    print "Time spent prepping vars: {ts}".format(ts=Hydro.prep_time)
-    print "Time spent climate vars: {ts}".format(ts=Hydro.climate_prep)
-    print "Time taken doing calculations: {ts}".format(ts=Hydro.calc_time)
-    print "    Summing node inflows: {ts}".format(ts=Hydro.inflow_time)
-    print "    Time spent on Routing: {ts}".format(ts=Hydro.route)
-    print "        Time spent on prepping routing vars: {ts}".format(ts=Hydro.route_i)
-    print "        Calculating Routing: {s}".format(s=Hydro.Routing.runtime)
-    print "    Time spent on IHACRES: {ts}".format(ts=Hydro.ih)
-    print "        Time prepping data: {ts}".format(ts=Hydro.IHACRES.prep_time)
-    print "            Climate: {ts}".format(ts=Hydro.IHACRES.get_climate)
-    print "            Params : {ts}".format(ts=Hydro.IHACRES.get_params)
-    print "        Calculating IHACRES: {ts}".format(ts=Hydro.IHACRES.calc_time)
-    print "    Time spent on Dam: {ts}".format(ts=Hydro.dam)
+    #Time spent in each model component, by node type
+    print Hydro.Profiler.getReport()
+    Hydro.Profiler.writeCollapsedStacks('hydrology_profile.folded')
 
     #Collate results
     deficit_df = pd.DataFrame()